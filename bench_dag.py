@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+# wall time of `strainpi identify_wf --dry-run`, which parses the sample sheet
+# and builds the whole DAG, over generated projects of increasing sample
+# counts. The first run of a project parses the sheet, later runs load the
+# parsed samples cache. Every sample gets its own links to one tiny read pair
+# and every reference is one tiny fasta, snakemake has to be on PATH:
+#
+#   python bench_dag.py
+#   python bench_dag.py --samples 100 1000 --runs 5 --task trimming_all
+
+import argparse
+import gzip
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+
+def make_project(project, samples, root):
+    """
+    workdir of a project with samples samples, made once and reused
+    """
+    if os.path.exists(os.path.join(project, "config.yaml")):
+        return
+    data = os.path.join(project, "data")
+    os.makedirs(data, exist_ok=True)
+
+    reads = []
+    for mate in [1, 2]:
+        fq = os.path.join(data, "reads_%d.fq.gz" % mate)
+        with gzip.open(fq, "wt") as oh:
+            for i in range(4):
+                oh.write("@r%d/%d\n%s\n+\n%s\n" % (i, mate, "ACGT" * 25, "I" * 100))
+        reads.append(fq)
+    ref = os.path.join(data, "ref.fna")
+    with open(ref, "wt") as oh:
+        oh.write(">ref\n%s\n" % ("ACGT" * 250))
+
+    links = os.path.join(data, "links")
+    os.makedirs(links, exist_ok=True)
+    samples_tsv = os.path.join(project, "samples.tsv")
+    with open(samples_tsv, "wt") as oh:
+        oh.write("sample_id\tshort_forward_reads\tshort_reverse_reads\n")
+        for i in range(samples):
+            sample = "s%06d" % i
+            row = [sample]
+            for mate, fq in enumerate(reads, 1):
+                link = os.path.join(links, "%s_%d.fq.gz" % (sample, mate))
+                os.symlink(fq, link)
+                row.append(link)
+            oh.write("\t".join(row) + "\n")
+
+    subprocess.run([sys.executable, os.path.join(root, "run_strainpi.py"), "init",
+                    "-d", project, "-s", samples_tsv],
+                   stdout=subprocess.DEVNULL, check=True)
+
+    # every index is built from, or is, the tiny fasta
+    from strainpi import configer
+    config = os.path.join(project, "config.yaml")
+    conf = configer.parse_yaml(config)
+    conf["params"]["rmhost"]["host_fasta"] = ref
+    for tool in ["bwa", "bowtie2"]:
+        conf["params"]["rmhost"][tool]["index_prefix"] = ref
+    conf["params"]["rmhost"]["minimap2"]["index"] = ref
+    for tool in ["bowtie2", "strobealign"]:
+        conf["params"]["alignment"][tool]["index_prefix"] = ref
+    configer.update_config(config, config, conf, remove=False)
+
+    # alignment takes prebuilt indexes, a dry run only checks they exist
+    read_length = conf["params"]["alignment"]["strobealign"]["read_length"]
+    for suffix in ["1.bt2l", "2.bt2l", "3.bt2l", "4.bt2l", "rev.1.bt2l", "rev.2.bt2l",
+                   "r%s.sti" % read_length]:
+        open(ref + "." + suffix, "wb").close()
+
+
+def dry_run(project, task, root):
+    """
+    seconds of one dry run
+    """
+    cmd = [sys.executable, os.path.join(root, "run_strainpi.py"), "identify_wf",
+           "--config", "config.yaml", "--dry-run", task]
+    start = time.time()
+    proc = subprocess.run(cmd, cwd=project, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          universal_newlines=True)
+    seconds = time.time() - start
+    if proc.returncode != 0:
+        sys.exit(f"dry run of {project} failed:\n{proc.stdout[-2000:]}")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DAG build time of identify_wf against sample count")
+    parser.add_argument("--samples", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="sample counts of the projects")
+    parser.add_argument("--runs", type=int, default=3, help="dry runs with the samples cache")
+    parser.add_argument("--task", default="all", help="identify_wf end point, default: all")
+    parser.add_argument("--workdir", default="bench_dag", help="where the projects are kept")
+    args = parser.parse_args()
+
+    if shutil.which("snakemake") is None:
+        sys.exit("snakemake is not on PATH")
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    env_path = os.environ.get("PYTHONPATH", "")
+    os.environ["PYTHONPATH"] = root + (os.pathsep + env_path if env_path else "")
+    sys.path.insert(0, root)
+
+    print(f"{'samples':>8s} {'cold s':>8s} {'cached s':>9s} {'ms/sample':>10s}")
+    for samples in args.samples:
+        project = os.path.realpath(os.path.join(args.workdir, "samples_%d" % samples))
+        make_project(project, samples, root)
+
+        # without the parsed samples cache, then with it
+        shutil.rmtree(os.path.join(project, ".strainpi"), ignore_errors=True)
+        cold = dry_run(project, args.task, root)
+        cached = statistics.median(dry_run(project, args.task, root) for _ in range(args.runs))
+        print(f"{samples:8d} {cold:8.2f} {cached:9.2f} {cached / samples * 1000:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+# wall time of strainpi fqstats, of the seqstats wrapper and of seqkit stats
+# on the same synthetic gzipped fastq, the file is made once from a fixed
+# seed and reused, tools which are not installed are skipped:
+#
+#   python bench_fqstats.py
+#   python bench_fqstats.py --reads 1000000 --runs 1 --threads 8
+
+import argparse
+import gzip
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+CHUNK_READS = 100000
+
+# columns every tool must agree on
+CHECKED_COLUMNS = [
+    "num_seqs", "sum_len", "min_len", "avg_len", "max_len", "Q1", "Q2", "Q3",
+    "sum_gap", "N50", "Q20(%)", "Q30(%)", "AvgQual", "GC(%)"]
+
+
+def make_fastq(fq, reads, min_length, max_length, seed):
+    """
+    reads with uniform random lengths, bases and qualities
+    """
+    rng = np.random.default_rng(seed)
+    bases = np.frombuffer(b"ACGTN", dtype=np.uint8)
+    base_p = [0.2475, 0.2475, 0.2475, 0.2475, 0.01]
+
+    temp = fq + ".tmp"
+    pigz = shutil.which("pigz")
+    with open(temp, "wb") as raw:
+        if pigz is not None:
+            proc = subprocess.Popen([pigz, "-1", "-c"], stdin=subprocess.PIPE, stdout=raw)
+            oh = proc.stdin
+        else:
+            proc = None
+            oh = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=1)
+
+        for start in range(0, reads, CHUNK_READS):
+            n = min(CHUNK_READS, reads - start)
+            lengths = rng.integers(min_length, max_length + 1, n)
+            seqs = rng.choice(bases, lengths.sum(), p=base_p).tobytes()
+            quals = (rng.integers(2, 42, lengths.sum(), dtype=np.uint8) + 33).tobytes()
+            ends = np.cumsum(lengths).tolist()
+            chunk = []
+            offset = 0
+            for i, end in enumerate(ends):
+                chunk.append(b"@r%d\n%s\n+\n%s\n" % (start + i, seqs[offset:end], quals[offset:end]))
+                offset = end
+            oh.write(b"".join(chunk))
+
+        oh.close()
+        if proc is not None and proc.wait() != 0:
+            sys.exit(f"pigz failed on {fq}")
+    os.replace(temp, fq)
+
+
+def run(cmd):
+    """
+    (seconds, {column: value}) of one run of a tool printing a seqkit stats table
+    """
+    start = time.time()
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    seconds = time.time() - start
+    header, row = proc.stdout.splitlines()[:2]
+    return seconds, dict(zip(header.split("\t"), row.split("\t")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="strainpi fqstats against seqkit stats")
+    parser.add_argument("--reads", type=int, default=10000000, help="reads in the fastq")
+    parser.add_argument("--min-length", type=int, default=50)
+    parser.add_argument("--max-length", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=3, help="runs of every tool")
+    parser.add_argument("--threads", type=int, default=4, help="seqkit threads and inflate threads")
+    parser.add_argument("--workdir", default="bench_fqstats", help="where the fastq is kept")
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    os.makedirs(args.workdir, exist_ok=True)
+    fq = os.path.join(args.workdir, "bench_%d_%d_%d_%d.fq.gz" % (
+        args.reads, args.min_length, args.max_length, args.seed))
+    if not os.path.exists(fq):
+        print(f"making {fq}")
+        make_fastq(fq, args.reads, args.min_length, args.max_length, args.seed)
+
+    stats_file = os.path.join(args.workdir, "seqstats.tsv")
+    tools = {
+        "strainpi fqstats": [sys.executable, "-m", "strainpi.fqstats", "-b",
+                             "--inflate-threads", str(args.threads), fq],
+        "seqstats.py files": ["sh", "-c", " ".join([
+            "rm -f", stats_file, "&&", sys.executable,
+            os.path.join(root, "strainpi/wrappers/seqstats.py"), "files",
+            "--threads", str(args.threads), "--stats", stats_file, fq,
+            "&&", "cat", stats_file])],
+    }
+    if shutil.which("seqkit") is not None:
+        tools["seqkit stats"] = ["seqkit", "stats", "--all", "--tabular", "--basename",
+                                 "-j", str(args.threads), fq]
+    else:
+        print("seqkit is not installed, skip it")
+
+    env_path = os.environ.get("PYTHONPATH", "")
+    os.environ["PYTHONPATH"] = root + (os.pathsep + env_path if env_path else "")
+
+    rows = {}
+    for name, cmd in tools.items():
+        times = []
+        for _ in range(args.runs):
+            seconds, rows[name] = run(cmd)
+            times.append(seconds)
+        median = statistics.median(times)
+        print(f"{name:20s} median {median:8.2f} s, min {min(times):8.2f} s, "
+              f"{args.reads / median / 1e6:6.2f} M reads/s, {args.runs} runs")
+
+    reference = rows.get("seqkit stats", rows["strainpi fqstats"])
+    for name, row in rows.items():
+        differ = [c for c in CHECKED_COLUMNS if row.get(c) != reference.get(c)]
+        if differ:
+            print(f"{name} differs on " + ", ".join(
+                f"{c}: {row.get(c)} != {reference.get(c)}" for c in differ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+# wall time of qcer.compute_host_rate and qcer.qc_summary_merge on a synthetic
+# paired-end cohort (raw, trimming and rmhost steps, the rmhost stats of one
+# sample in every 97 missing) against the row-wise implementation they
+# replaced, which is kept below as the reference. Both must write the same
+# qc_stats_l.tsv and qc_stats_w.tsv tables and print the same warnings, the
+# reference prints the missing (sample, step) ones in set order so warnings
+# are compared sorted. The reference is quadratic in samples, it is skipped
+# above --reference-max samples:
+#
+#   python bench_qcstats.py
+#   python bench_qcstats.py --samples 1000 10000 --runs 3
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+STEPS = ["raw", "trimming", "rmhost"]
+MISSING_EVERY = 97
+
+
+def reference_update_qcstats_row(row):
+    rows = row["file"].split(".")
+    sample_id = rows[0]
+    step = rows[1]
+    fq_type = rows[2]
+
+    reads = "fq1"
+    if "pe.2.fq.gz" in row["file"]:
+        reads = "fq2"
+
+    return pd.Series([sample_id, reads, step, fq_type])
+
+
+def reference_update_qcstats_df(df):
+    stats_df = df.copy()
+    stats_df[["id", "reads", "step", "fq_type"]] = stats_df.apply(
+        lambda row: reference_update_qcstats_row(row), axis=1, result_type="expand")
+    return stats_df
+
+
+def reference_compute_host_rate(df, steps, samples_id_list, allow_miss_samples=True):
+    all_state_set = set()
+    have_state_set = set()
+    sample_reads = {}
+    host_rate = {}
+
+    for step in steps:
+        for sample_id in samples_id_list:
+            all_state_set.add((sample_id, step))
+
+    df = reference_update_qcstats_df(df)
+    df = df.set_index("id")
+    for sample_id in df.index.unique():
+        if not pd.isnull(sample_id):
+            sample_reads[sample_id] = {}
+
+            for step in steps:
+                step_df = df.loc[
+                    [sample_id],
+                ].query(f'''reads=="fq1" and step=="{step}"''')
+                if not step_df.empty:
+                    num_seqs = sum(step_df["num_seqs"].to_list())
+                    if num_seqs >= 0:
+                        have_state_set.add((sample_id, step))
+                        sample_reads[sample_id][step] = num_seqs
+                    else:
+                        print(f'''WARNING: {sample_id}_{step}_num_seqs: {num_seqs}''')
+        else:
+            print("WARNING: found NA sample id in qcreport summary")
+
+    not_have_state_set = all_state_set - have_state_set
+
+    if len(not_have_state_set) > 0:
+        for j in not_have_state_set:
+            print(f"""WARNING: there are no {j[0]} full stats report for {j[1]} step""")
+        if not allow_miss_samples:
+            print("Please check stats report again for each sample")
+            sys.exit(1)
+
+    for sample_id in df.index.unique():
+        if not pd.isnull(sample_id):
+            if sample_id in sample_reads:
+                if "rmhost" in steps:
+                    if "trimming" in steps:
+                        if ("trimming" in sample_reads[sample_id]) and ("rmhost" in sample_reads[sample_id]):
+                            host_rate[sample_id] = (
+                                sample_reads[sample_id]["trimming"]
+                                - sample_reads[sample_id]["rmhost"]
+                                ) / sample_reads[sample_id]["trimming"]
+                        else:
+                            host_rate[sample_id] = np.nan
+                    elif "raw" in steps:
+                        if ("raw" in sample_reads[sample_id]) and ("rmhost" in sample_reads[sample_id]):
+                            host_rate[sample_id] = (
+                                sample_reads[sample_id]["raw"]
+                                - sample_reads[sample_id]["rmhost"]
+                                ) / sample_reads[sample_id]["raw"]
+                        else:
+                            host_rate[sample_id] = np.nan
+                else:
+                    host_rate[sample_id] = np.nan
+            else:
+                host_rate[sample_id] = np.nan
+
+    df = df.reset_index()
+    df["host_rate"] = df.apply(lambda x: host_rate[x["id"]], axis=1)
+    return df
+
+
+def make_stats(samples, seed):
+    """
+    merged seqkit stats rows of a cohort, fq1 and fq2 of every sample and step
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(samples):
+        sample = "s%06d" % i
+        num_seqs = int(rng.integers(1000000, 20000000))
+        for step in STEPS:
+            if step == "rmhost" and i % MISSING_EVERY == 0:
+                continue
+            if step == "trimming":
+                num_seqs = int(num_seqs * rng.uniform(0.9, 1.0))
+            elif step == "rmhost":
+                num_seqs = int(num_seqs * rng.uniform(0.5, 1.0))
+            for mate in [1, 2]:
+                sum_len = num_seqs * 150
+                rows.append([
+                    "%s.%s.pe.%d.fq.gz" % (sample, step, mate), "FASTQ", "DNA",
+                    num_seqs, sum_len, 50, 150.0, 150, 150.0, 150.0, 150.0, 0, 150,
+                    round(rng.uniform(90, 99), 2), round(rng.uniform(80, 95), 2),
+                    round(rng.uniform(30, 38), 2), round(rng.uniform(35, 55), 2)])
+    columns = ["file", "format", "type", "num_seqs", "sum_len", "min_len", "avg_len",
+               "max_len", "Q1", "Q2", "Q3", "sum_gap", "N50", "Q20(%)", "Q30(%)",
+               "AvgQual", "GC(%)"]
+    return pd.DataFrame(rows, columns=columns), ["s%06d" % i for i in range(samples)]
+
+
+def run(compute_host_rate, qc_summary_merge, df, samples_id_list):
+    """
+    (seconds, qc_stats_l.tsv, qc_stats_w.tsv, printed lines) of one run
+    """
+    out = io.StringIO()
+    start = time.time()
+    with contextlib.redirect_stdout(out):
+        df_l = compute_host_rate(df, STEPS, samples_id_list, allow_miss_samples=True)
+        df_w = qc_summary_merge(df_l)
+    seconds = time.time() - start
+    return (seconds, df_l.to_csv(sep="\t", index=False), df_w.to_csv(sep="\t", index=False),
+            out.getvalue().splitlines())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="qcer.compute_host_rate against its row-wise reference")
+    parser.add_argument("--samples", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="samples of the cohorts")
+    parser.add_argument("--runs", type=int, default=1, help="runs of every implementation")
+    parser.add_argument("--reference-max", type=int, default=10000,
+                        help="largest cohort the reference runs on")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from strainpi import qcer
+
+    print(f"{'samples':>8s} {'rows':>8s} {'reference s':>12s} {'qcer s':>8s}  check")
+    for samples in args.samples:
+        df, samples_id_list = make_stats(samples, args.seed)
+
+        times = []
+        for _ in range(args.runs):
+            seconds, l_tsv, w_tsv, printed = run(
+                qcer.compute_host_rate, qcer.qc_summary_merge, df, samples_id_list)
+            times.append(seconds)
+        new = statistics.median(times)
+
+        reference = None
+        check = "reference skipped"
+        if samples <= args.reference_max:
+            times = []
+            for _ in range(args.runs):
+                # qc_summary_merge only gained observed=True, which changes
+                # nothing on the object columns of the reference
+                seconds, ref_l_tsv, ref_w_tsv, ref_printed = run(
+                    reference_compute_host_rate, qcer.qc_summary_merge, df, samples_id_list)
+                times.append(seconds)
+            reference = statistics.median(times)
+
+            differ = [name for name, same in [
+                ("qc_stats_l.tsv", l_tsv == ref_l_tsv),
+                ("qc_stats_w.tsv", w_tsv == ref_w_tsv),
+                ("warnings", sorted(printed) == sorted(ref_printed))] if not same]
+            check = "differ on " + ", ".join(differ) if differ else \
+                "same tables, same %d warnings" % len(printed)
+
+        print(f"{samples:8d} {len(df):8d} "
+              f"{'-' if reference is None else '%.2f' % reference:>12s} {new:8.2f}  {check}")
+
+
+if __name__ == "__main__":
+    main()
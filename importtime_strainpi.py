@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+# import time of strainpi modules, measured by `python -X importtime` in fresh
+# interpreters, exit 1 when the median is over --limit ms:
+#
+#   python importtime_strainpi.py
+#   python importtime_strainpi.py --module strainpi.qcer --top 20 --limit 0
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+def import_time(module, cwd):
+    """
+    (cumulative us of module, {imported module: cumulative us}) of one run
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times[module], times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import time of strainpi")
+    parser.add_argument("--module", default="strainpi", help="module to import, default: strainpi")
+    parser.add_argument("--runs", type=int, default=10, help="fresh interpreters to run")
+    parser.add_argument("--top", type=int, default=10, help="print the slowest imports")
+    parser.add_argument("--limit", type=float, default=100, help="median limit in ms, 0: no limit")
+    args = parser.parse_args()
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    totals = []
+    for _ in range(args.runs):
+        total, times = import_time(args.module, cwd)
+        totals.append(total / 1000)
+
+    median = statistics.median(totals)
+    print(f"import {args.module}: median {median:.1f} ms, "
+          f"min {min(totals):.1f} ms, max {max(totals):.1f} ms, {args.runs} runs")
+
+    for name, cumulative in sorted(times.items(), key=lambda x: -x[1])[:args.top]:
+        print(f"{cumulative / 1000:10.1f} ms  {name}")
+
+    if args.limit > 0 and median > args.limit:
+        print(f"import {args.module} is over {args.limit} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,73 @@
 #!/usr/bin/env python
 
-from strainpi.configer import metaconfig
-from strainpi.configer import parse_yaml
-from strainpi.configer import update_config
-from strainpi.configer import custom_help_formatter
+import importlib
 
-from strainpi.tooler import parse
-from strainpi.tooler import merge
+from strainpi.__about__ import __version__, __author__
 
-from strainpi.sampler import HEADERS
-from strainpi.sampler import parse_samples
-from strainpi.sampler import get_reads
-from strainpi.sampler import get_sample_id
 
-from strainpi.sampler import get_raw_input_list
-from strainpi.sampler import get_raw_input_dict
+# strainpi.<name>: the module it comes from, a module is imported on the first
+# access of one of its names, so `import strainpi` doesn't load pandas,
+# matplotlib or seaborn, the CLI and every snakemake job start faster
+_LAZY = {
+    "metaconfig": "strainpi.configer",
+    "parse_yaml": "strainpi.configer",
+    "update_config": "strainpi.configer",
+    "custom_help_formatter": "strainpi.configer",
 
-from strainpi.qcer import change
-from strainpi.qcer import compute_host_rate
-from strainpi.qcer import qc_summary_merge
-from strainpi.qcer import qc_bar_plot
-from strainpi.qcer import parse_fastp_json
+    "parse": "strainpi.tooler",
+    "merge": "strainpi.tooler",
+    "merge_tables": "strainpi.tooler",
+    "merge_stats_store": "strainpi.tooler",
 
-from strainpi.aligner import flagstats_summary
+    "HEADERS": "strainpi.sampler",
+    "parse_samples": "strainpi.sampler",
+    "parse_samples_cached": "strainpi.sampler",
+    "get_reads": "strainpi.sampler",
+    "get_sample_id": "strainpi.sampler",
 
+    "get_raw_input_list": "strainpi.sampler",
+    "get_raw_input_dict": "strainpi.sampler",
+
+    "change": "strainpi.qcer",
+    "compute_host_rate": "strainpi.qcer",
+    "qc_summary_merge": "strainpi.qcer",
+    "qc_summary_store": "strainpi.qcer",
+    "qc_bar_plot": "strainpi.qcer",
+    "qc_bar_pages": "strainpi.qcer",
+    "qc_dist_plot": "strainpi.qcer",
+    "parse_fastp_json": "strainpi.qcer",
+    "trimming_summary": "strainpi.qcer",
+
+    "flagstats_summary": "strainpi.aligner",
+
+    "fastq_stats": "strainpi.fqstats",
+    "fqstats_summary": "strainpi.fqstats",
+
+    "check_samples": "strainpi.checker",
+
+    "project_status": "strainpi.tracker",
+
+    "benchmark_report": "strainpi.profiler",
+
+    "learn_models": "strainpi.modeler",
+    "load_resource_models": "strainpi.modeler",
+
+    "rule_sizer": "strainpi.sizer",
+}
+
+__all__ = list(_LAZY) + ["__version__", "__author__"]
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module 'strainpi' has no attribute '{name}'")
+    value = getattr(importlib.import_module(_LAZY[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
 
-from strainpi.__about__ import __version__, __author__
 
 name = "strainpi"
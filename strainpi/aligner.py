@@ -1,11 +1,11 @@
 #!/usr/bin/env python
 import argparse
+import concurrent.futures
 import gzip
 import os
 import re
 import json
 import pandas as pd
-from decimal import *
 
 
 """
@@ -41,87 +41,140 @@ checkm_coverage
 """
 
 
-def flagstats_summary(flagstats, method, **kwargs):
+# output column: flagstat field, the QC-passed value is used
+FLAGSTAT_FIELDS = {
+    "total_num": "total",
+    "read_1_num": "read1",
+    "read_2_num": "read2",
+    "mapped_num": "mapped",
+    "mapped_rate": "mapped %",
+    "primary_mapped_num": "primary mapped",
+    "primary_mapped_rate": "primary mapped %",
+    "paired_num": "properly paired",
+    "paired_rate": "properly paired %",
+    "singletons_num": "singletons",
+    "singletons_rate": "singletons %",
+    "mate_mapped_num": "with mate mapped to a different chr",
+    "mate_mapped_num_mapQge5": "with mate mapped to a different chr (mapQ >= 5)"
+}
+
+FLAGSTAT_COLUMNS = [
+    "sample_id", "align_way", "total_num", "read_1_num", "read_2_num",
+    "mapped_num", "mapped_rate", "primary_mapped_num", "primary_mapped_rate",
+    "paired_num", "paired_rate", "mapping_type",
+    "singletons_num", "singletons_rate", "mate_mapped_num", "mate_mapped_num_mapQge5"]
+
+
+def flagstat_key(field):
+    # "(mapQ>=5)" in tsv and text output, "(mapQ >= 5)" in json output
+    return re.sub(r"\s+", "", field)
+
+
+def flagstat_rate(value):
     """
-    get alignment rate from sorted bam file
-    samtools flagstat --threads 8 sample.sort.bam
+    50.00%, 50.0 or N/A -> 0.5 or N/A
     """
-    mapping_info = []
-    getcontext().prec = 8
+    if value is None:
+        return "N/A"
+    try:
+        # the percentages have two decimals, drop the float noise of / 100
+        rate = round(float(str(value).rstrip("%")) / 100, 8)
+    except ValueError:
+        return "N/A"
+    return "N/A" if rate != rate else rate
 
+
+def read_flagstat(stat_file):
+    """
+    QC-passed values of a `samtools flagstat` report by field name,
+    from -O json, -O tsv or the default text output
+    """
+    fields = {}
+    with open(stat_file, "rt") as ih:
+        if stat_file.endswith(".json"):
+            for field, value in json.load(ih)["QC-passed reads"].items():
+                fields[flagstat_key(field)] = value
+
+        elif stat_file.endswith(".tsv"):
+            for line in ih:
+                passed, _, field = line.rstrip("\n").split("\t", 2)
+                if field.startswith("total"):
+                    field = "total"
+                fields[flagstat_key(field)] = passed
+
+        else:
+            for line in ih:
+                matched = re.match(r"(\d+) \+ (\d+) (.*)", line.strip())
+                if matched is None:
+                    continue
+                field = matched.group(3)
+                if field.startswith("in total"):
+                    field = "total"
+                rate = re.match(r"(.*) \((\S+?%|N/A)\s*:.*\)$", field)
+                if rate is not None:
+                    field = rate.group(1)
+                    fields[flagstat_key(field + " %")] = rate.group(2)
+                fields[flagstat_key(field)] = matched.group(1)
+    return fields
+
+
+def flagstat_records(flagstat_file):
+    """
+    one record per flagstat report, flagstat_file is a report itself or a
+    {sample}.json which lists the PE_ALIGN_STATS and SE_ALIGN_STATS reports
+    """
+    flagstat_file = flagstat_file.strip()
+    if not os.path.exists(flagstat_file):
+        return []
+
+    stat_lists = []
+    if flagstat_file.endswith(".json"):
+        with open(flagstat_file, "rt") as jsonh:
+            jsondata = json.load(jsonh)
+        if ("PE_ALIGN_STATS" in jsondata) or ("SE_ALIGN_STATS" in jsondata):
+            sample_id = os.path.basename(flagstat_file).split(".")[0]
+            if jsondata.get("PE_ALIGN_STATS", "") != "":
+                stat_lists.append([sample_id, "pe_align", jsondata["PE_ALIGN_STATS"]])
+            if jsondata.get("SE_ALIGN_STATS", "") != "":
+                stat_lists.append([sample_id, "se_align", jsondata["SE_ALIGN_STATS"]])
+    if len(stat_lists) == 0:
+        stat_lists.append([os.path.basename(flagstat_file).split(".")[0], "align", flagstat_file])
+
+    records = []
+    for sample_id, align_way, stat_file in stat_lists:
+        fields = read_flagstat(stat_file)
+        info = {"sample_id": sample_id, "align_way": align_way}
+        for column, field in FLAGSTAT_FIELDS.items():
+            value = fields.get(flagstat_key(field))
+            if column.endswith("_rate"):
+                info[column] = flagstat_rate(value)
+            else:
+                info[column] = None if value is None else int(value)
+        info["mapping_type"] = "single-end" if info["paired_rate"] == "N/A" else "paired-end"
+        records.append(info)
+    return records
+
+
+def flagstats_summary(flagstats, method, workers=8, **kwargs):
+    """
+    get alignment rate from samtools flagstat reports (json, tsv or text),
+    reports are read on a thread pool
+
+    samtools flagstat --threads 8 -O json sample.sort.bam
+    """
     # with open(flagstat_list, 'r') as list_handle:
     if method == 1:
-        list_handle = gzip.open(flagstats, "rt")
+        with gzip.open(flagstats, "rt") as ih:
+            list_handle = [line for line in ih if line.strip() != ""]
     if method == 2:
-        list_handle = flagstats
-
-    for flagstat_file in list_handle:
-        if os.path.exists(flagstat_file.strip()):
-            stat_lists = []
-            if flagstat_file.endswith(".json"):
-                with open(flagstat_file.strip(), "rt") as jsonh:
-                    jsondata = json.load(jsonh)
-                    if jsondata.get("PE_ALIGN_STATS", "") != "":
-                        stat_lists.append(["pe_align", jsondata["PE_ALIGN_STATS"]])
-                    if jsondata.get("SE_ALIGN_STATS", "") != "":
-                        stat_lists.append(["se_align", jsondata["SE_ALIGN_STATS"]])
-            else:
-                stat_lists.append(["align", flagstat_file.strip()])
-
-            for stat_file in stat_lists:
-                info = {}
-                info["sample_id"] = os.path.basename(stat_file[1].strip()).split(".")[0]
-                info["align_way"] = stat_file[0]
-
-                stat_list = open(stat_file[1], "rt").readlines()
-                info["total_num"] = stat_list[0].split(" ")[0]
-
-                if len(stat_list) == 13:
-                    info["read_1_num"] = stat_list[6].split(" ")[0]
-                    info["read_2_num"] = stat_list[7].split(" ")[0]
-
-                    mapped = re.split(r"\(|\\s+", stat_list[4])
-                    info["mapped_num"] = mapped[0]
-                    info["mapped_rate"] = Decimal(mapped[5].rstrip("%")) / Decimal(100)
-
-                    #primary_mapped = re.split(r"\(|\\s+", stat_list[5])
-                    #info["primary_mapped_num"] = primary_mapped[0]
-                    #info["primary_mapped_rate"] = Decimal(primary_mapped[6].rstrip("%")) / Decimal(100)
-
-                elif len(stat_list) == 16:
-                    info["read_1_num"] = stat_list[9].split(" ")[0]
-                    info["read_2_num"] = stat_list[10].split(" ")[0]
-
-                    mapped = re.split(r"\(|\\s+", stat_list[6])
-                    info["mapped_num"] = mapped[0]
-                    info["mapped_rate"] = Decimal(mapped[5].rstrip("%")) / Decimal(100)
-
-                    primary_mapped = re.split(r"\(|\\s+", stat_list[7])
-                    info["primary_mapped_num"] = primary_mapped[0]
-                    info["primary_mapped_rate"] = Decimal(primary_mapped[6].rstrip("%")) / Decimal(100)
-
-                paired = re.split(r"\(|\\s+", stat_list[-5])
-                info["paired_num"] = paired[0]
-                paired_rate = paired[6].rstrip("%")
-                if paired_rate != "N/A":
-                    info["paired_rate"] = Decimal(paired_rate) / Decimal(100)
-                    info["mapping_type"] = "paired-end"
-                else:
-                    info["paired_rate"] = paired_rate
-                    info["mapping_type"] = "single-end"
-
-                singletons = re.split(r"\(|\\s+", stat_list[-3])
-                info["singletons_num"] = singletons[0]
-                singletons_rate = singletons[5].rstrip("%")
-                if singletons_rate != "N/A":
-                    info["singletons_rate"] = Decimal(singletons_rate) / Decimal(100)
-                else:
-                    info["singletons_rate"] = singletons_rate
-
-                info["mate_mapped_num"] = re.split(r"\(|\\s+", stat_list[-2])[0]
-                info["mate_mapped_num_mapQge5"] = re.split(r"\(|\\s+", stat_list[-1])[0]
-
-                mapping_info.append(info)
+        list_handle = [str(i) for i in flagstats]
+
+    mapping_info = {column: [] for column in FLAGSTAT_COLUMNS}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for records in executor.map(flagstat_records, list_handle):
+            for info in records:
+                for column in FLAGSTAT_COLUMNS:
+                    mapping_info[column].append(info[column])
 
     mapping_info_df = pd.DataFrame(mapping_info)
     if "output" in kwargs:
@@ -139,13 +192,14 @@ def main():
     )
     parser.add_argument("-statfiles", default=None, nargs="*", help="sorted flagstat file, gzip")
     parser.add_argument("-outfile", type=str, help="output alignment rate file")
+    parser.add_argument("-threads", default=8, type=int, help="threads to read flagstat files")
     args = parser.parse_args()
     if args.statlist:
         method = 1
-        flagstats_summary(args.statlist, method, output=args.outfile)
+        flagstats_summary(args.statlist, method, args.threads, output=args.outfile)
     if args.statfiles:
         method = 2
-        flagstats_summary(args.statfiles, method, output=args.outfile)
+        flagstats_summary(args.statfiles, method, args.threads, output=args.outfile)
 
 
 if __name__ == "__main__":
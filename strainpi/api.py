@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import signal
+
+import strainpi
+from strainpi import corer
+
+
+WORKFLOWS = {
+    "identify_wf": "snakefiles/identify_wf.smk",
+}
+
+JSONLOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "wrappers/jsonlog.py")
+
+# a snakemake log message may carry a whole shell command or job table
+LINE_LIMIT = 1 << 24
+
+TOTAL_RE = re.compile(r"^total\s+(\d+)", re.MULTILINE)
+
+
+class run_handle:
+    """
+    a snakemake run of one project, job counts are updated from the
+    snakemake log while it runs, `future` resolves to the exit status
+    """
+    def __init__(self, config, task, cmd, workdir, on_message=None):
+        self.config = config
+        self.task = task
+        self.cmd = cmd
+        self.workdir = workdir
+        self.on_message = on_message
+
+        self.total = None
+        self.done = 0
+        self.running = {}
+        self.failed = []
+        self.errors = []
+        self.returncode = None
+
+        self.proc = None
+        self.follower = None
+        self.future = asyncio.get_running_loop().create_future()
+
+    def __repr__(self):
+        return "run_handle(%s, %s, %s)" % (self.workdir, self.task, self.counts())
+
+    def counts(self):
+        """
+        live job counts
+        """
+        return {
+            "total": self.total,
+            "done": self.done,
+            "running": len(self.running),
+            "failed": len(self.failed)
+        }
+
+    def handle(self, msg):
+        level = msg.get("level")
+        if level == "run_info":
+            total = TOTAL_RE.search(str(msg.get("msg", "")))
+            if total is not None:
+                self.total = int(total.group(1))
+        elif level == "job_info":
+            self.running[msg["jobid"]] = msg.get("name")
+        elif level == "job_finished":
+            self.running.pop(msg["jobid"], None)
+        elif level == "progress":
+            # snakemake counts every job of the DAG, --until keeps some of them from running
+            self.done = msg["done"]
+            if self.total is None:
+                self.total = msg["total"]
+        elif level in ("job_error", "group_error"):
+            self.running.pop(msg.get("jobid"), None)
+            self.failed.append(msg)
+        elif level == "error":
+            self.errors.append(msg.get("msg"))
+
+        if self.on_message is not None:
+            self.on_message(self, msg)
+
+    async def follow(self, reader, transport):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    continue
+                self.handle(msg)
+
+            self.returncode = await self.proc.wait()
+            self.running.clear()
+            if self.total is None:
+                self.total = self.done
+            self.future.set_result(self.returncode)
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+        except Exception as e:
+            # the log can't be followed (a line over LINE_LIMIT), stop snakemake
+            # rather than leave it running unobserved, jsonlog.py ignores the
+            # closed pipe
+            transport.close()
+            self.cancel()
+            self.returncode = await self.proc.wait()
+            self.running.clear()
+            self.future.set_exception(e)
+        finally:
+            transport.close()
+
+    async def wait(self):
+        """
+        wait for the run, return the exit status of snakemake
+        """
+        return await asyncio.shield(self.future)
+
+    def cancel(self):
+        """
+        stop the run as Ctrl-C does, snakemake kills its running jobs
+        """
+        if (self.proc is not None) and (self.proc.returncode is None):
+            self.proc.send_signal(signal.SIGINT)
+
+
+async def run(config, task="all", workflow="identify_wf", cores=240, local_cores=8, jobs=30,
+              run_remote=False, cluster_engine="slurm", use_conda=False, conda_prefix=None,
+              dry_run=False, unknown=None, log=None, on_message=None):
+    """
+    start snakemake on a strainpi project in a subprocess and return its run_handle,
+    runs of many projects can share one event loop:
+
+        handles = [await strainpi.api.run(c, "qcreport_all") for c in configs]
+        returncodes = await asyncio.gather(*(h.wait() for h in handles))
+    """
+    config = os.path.realpath(config)
+    workdir = os.path.dirname(config)
+
+    conf = strainpi.parse_yaml(config)
+    if not os.path.exists(os.path.join(workdir, conf["params"]["samples"])):
+        raise FileNotFoundError(
+            "samples list %s of %s not found" % (conf["params"]["samples"], config))
+
+    args = argparse.Namespace(
+        config=config, task=task, cores=cores, local_cores=local_cores, jobs=jobs,
+        list=False, debug=False, dry_run=dry_run,
+        run_local=not run_remote, run_remote=run_remote, cluster_engine=cluster_engine,
+        use_conda=use_conda, conda_prefix=conda_prefix, conda_create_envs_only=False)
+    snakefile = os.path.join(os.path.dirname(os.path.abspath(__file__)), WORKFLOWS[workflow])
+    cmd = corer.snakemake_cmd(args, list(unknown or []), snakefile) + \
+        ["--log-handler-script", JSONLOG]
+
+    if log is None:
+        log = os.path.join(workdir, "logs", "strainpi_%s.log" % task)
+    os.makedirs(os.path.dirname(os.path.realpath(log)), exist_ok=True)
+
+    handle = run_handle(config, task, cmd, workdir, on_message)
+
+    rfd, wfd = os.pipe()
+    env = os.environ.copy()
+    env["STRAINPI_LOG_FD"] = str(wfd)
+    try:
+        with open(log, "wb") as oh:
+            handle.proc = await asyncio.create_subprocess_exec(
+                *cmd, cwd=workdir, env=env, pass_fds=(wfd,),
+                stdin=asyncio.subprocess.DEVNULL, stdout=oh, stderr=oh)
+    except BaseException:
+        os.close(rfd)
+        raise
+    finally:
+        os.close(wfd)
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=LINE_LIMIT)
+    transport, _ = await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(rfd, "rb"))
+    handle.follower = asyncio.ensure_future(handle.follow(reader, transport))
+
+    return handle
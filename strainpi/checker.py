@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import zlib
+
+import pandas as pd
+
+from strainpi import sampler
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# every BGZF file ends with this empty 28 bytes block
+BGZF_EOF = bytes.fromhex(
+    "1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+CHUNK_SIZE = 1 << 18
+
+
+def gzip_format(header):
+    if header[:2] != GZIP_MAGIC:
+        return "unknown"
+    # FEXTRA flag with a BC subfield
+    if (len(header) >= 14) and (header[3] & 4) and (header[12:14] == b"BC"):
+        return "bgzf"
+    return "gzip"
+
+
+def scan_gzip(ih, sample_bytes, deep):
+    """
+    decompress from the start of the file, member by member,
+    return (lines, compressed bytes consumed, reached end of file, stream complete)
+    """
+    decompressor = zlib.decompressobj(31)
+    in_member = False
+    lines = 0
+    consumed = 0
+    while True:
+        chunk = ih.read(CHUNK_SIZE)
+        if not chunk:
+            # at end of file the last member must be complete
+            return lines, consumed, True, not in_member
+        consumed += len(chunk)
+
+        data = chunk
+        while data:
+            in_member = True
+            lines += decompressor.decompress(data).count(b"\n")
+            if decompressor.eof:
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(31)
+                in_member = False
+                if len(data) >= 2 and data[:2] != GZIP_MAGIC:
+                    raise zlib.error("trailing garbage after gzip member")
+            else:
+                data = b""
+
+        if (not deep) and (consumed >= sample_bytes):
+            return lines, consumed, False, None
+
+
+def check_fastq(fq, sample_bytes=1 << 22, deep=False):
+    """
+    check one input file: exists, gzip/BGZF magic bytes, clean end of the
+    final member, and estimate the number of reads from the compression
+    ratio of the first sample_bytes
+    """
+    info = {
+        "path": fq,
+        "exists": False,
+        "size": 0,
+        "format": "",
+        "eof": "",
+        "est_reads": 0,
+        "status": "FAILED",
+        "message": ""
+    }
+
+    try:
+        info["size"] = os.path.getsize(fq)
+        info["exists"] = True
+    except OSError:
+        info["message"] = "not exists"
+        return info
+
+    if fq.endswith(".sra"):
+        info["format"] = "sra"
+        info["status"] = "OK"
+        return info
+
+    if info["size"] == 0:
+        info["message"] = "empty file"
+        return info
+
+    try:
+        with open(fq, "rb") as ih:
+            info["format"] = gzip_format(ih.read(18))
+            if info["format"] == "unknown":
+                info["message"] = "not gzip format"
+                return info
+
+            if info["format"] == "bgzf":
+                if info["size"] < len(BGZF_EOF):
+                    info["eof"] = "truncated"
+                else:
+                    ih.seek(-len(BGZF_EOF), os.SEEK_END)
+                    info["eof"] = "ok" if ih.read() == BGZF_EOF else "truncated"
+                if info["eof"] == "truncated":
+                    info["message"] = "BGZF EOF block is missing"
+                    return info
+
+            ih.seek(0)
+            lines, consumed, at_end, complete = scan_gzip(ih, sample_bytes, deep)
+    except zlib.error as e:
+        info["message"] = f"corrupt gzip stream: {e}"
+        return info
+    except OSError as e:
+        info["message"] = str(e)
+        return info
+
+    if at_end:
+        info["eof"] = "ok" if complete else "truncated"
+        if not complete:
+            info["message"] = "gzip stream ends in the middle of a member"
+            return info
+        info["est_reads"] = lines // 4
+    else:
+        # only plain gzip gets here, its end can't be seen without inflating it all
+        if info["format"] == "gzip":
+            info["eof"] = "unchecked"
+        info["est_reads"] = int(lines / 4 * info["size"] / consumed)
+
+    info["status"] = "OK"
+    return info
+
+
+def check_samples(samples_tsv, threads, deep=False, sample_bytes=1 << 22, **kwargs):
+    """
+    check every input file of the samples sheet on a thread pool,
+    return the number of failed files
+    """
+    samples_df, data_type = sampler.parse_samples(samples_tsv)
+    reads_index = sampler.get_reads_index(samples_df)
+    headers = list(sampler.HEADERS[data_type].values())
+
+    inputs = []
+    for sample_id, sample_reads in reads_index.items():
+        for col in headers:
+            for fq in sample_reads.get(col, ()):
+                inputs.append((sample_id, col, fq))
+
+    fqs = list(dict.fromkeys([fq for _, _, fq in inputs]))
+    print(f"checking {len(fqs)} files of {len(reads_index)} samples with {threads} threads")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        checked = dict(zip(fqs, executor.map(
+            lambda fq: check_fastq(fq, sample_bytes=sample_bytes, deep=deep), fqs)))
+
+    report = []
+    for sample_id, col, fq in inputs:
+        info = {"sample_id": sample_id, "column": col}
+        info.update(checked[fq])
+        report.append(info)
+    report_df = pd.DataFrame(report, columns=[
+        "sample_id", "column", "path", "exists", "size", "format",
+        "eof", "est_reads", "status", "message"])
+
+    if "output" in kwargs:
+        report_df.to_csv(kwargs["output"], sep="\t", index=False)
+        print(f"samples check report: {kwargs['output']}")
+
+    failed_df = report_df.query('status=="FAILED"')
+    for row in failed_df.itertuples():
+        print(f"{row.sample_id}\t{row.path}\t{row.message}")
+    print(f"checked {len(fqs)} files, {len(failed_df)} failed")
+
+    return len(failed_df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="check samples input files")
+    parser.add_argument("--samples", help="samples list, tsv format")
+    parser.add_argument("--threads", type=int, default=16, help="threads")
+    parser.add_argument("--deep", default=False, action="store_true",
+                        help="inflate every file completely")
+    parser.add_argument("--output", help="check report")
+    args = parser.parse_args()
+
+    failed = check_samples(args.samples, args.threads, deep=args.deep, output=args.output)
+    sys.exit(1 if failed > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,16 +5,18 @@ import os
 import sys
 import shutil
 
-from ruamel.yaml import YAML
-
 
 def parse_yaml(yaml_file):
+    from ruamel.yaml import YAML
+
     yaml = YAML()
     with open(yaml_file, "r") as f:
         return yaml.load(f)
 
 
 def update_config(yaml_file_old, yaml_file_new, yaml_content, remove=True):
+    from ruamel.yaml import YAML
+
     yaml = YAML()
     yaml.default_flow_style = False
     if remove:
@@ -1,14 +1,14 @@
 #!/usr/bin/env python
 
 import argparse
+import json
 import os
+import shlex
 import subprocess
 import sys
 import textwrap
 from io import StringIO
 
-import pandas as pd
-
 import strainpi
 
 
@@ -35,13 +35,10 @@ WORKFLOWS_IDENTIFY = [
 ]
 
 
-def run_snakemake(args, unknown, snakefile, workflow):
-    conf = strainpi.parse_yaml(args.config)
-
-    if not os.path.exists(conf["params"]["samples"]):
-        print("Please specific samples list on init step or change config.yaml manualy")
-        sys.exit(1)
-
+def snakemake_cmd(args, unknown, snakefile):
+    """
+    snakemake command of a strainpi run, as an argument list
+    """
     cmd = [
         "snakemake",
         "--snakefile",
@@ -90,13 +87,26 @@ def run_snakemake(args, unknown, snakefile, workflow):
         if args.dry_run and ("--dry-run" not in cmd):
             cmd += ["--dry-run"]
 
-    cmd_str = " ".join(cmd).strip()
+    return cmd
+
+
+def run_snakemake(args, unknown, snakefile, workflow):
+    conf = strainpi.parse_yaml(args.config)
+
+    if not os.path.exists(conf["params"]["samples"]):
+        print("Please specific samples list on init step or change config.yaml manualy")
+        sys.exit(1)
+
+    if args.check_samples:
+        check_samples(conf["params"]["samples"], args)
+
+    cmd = snakemake_cmd(args, unknown, snakefile)
+    cmd_str = " ".join(map(shlex.quote, cmd))
     print("Running strainpi %s:\n%s" % (workflow, cmd_str))
 
     env = os.environ.copy()
     proc = subprocess.Popen(
-        cmd_str,
-        shell=True,
+        cmd,
         stdout=sys.stdout,
         stderr=sys.stderr,
         env=env,
@@ -104,6 +114,16 @@ def run_snakemake(args, unknown, snakefile, workflow):
     proc.communicate()
 
     print(f'''\nReal running cmd:\n{cmd_str}''')
+    return proc.returncode
+
+
+def check_samples(samples_tsv, args):
+    failed = strainpi.check_samples(
+        samples_tsv, args.check_threads, deep=args.check_deep,
+        output=os.path.join(os.path.realpath(args.workdir), "samples_check.tsv"))
+    if failed > 0:
+        print("Please check samples input files again, now quiting :)")
+        sys.exit(1)
 
 
 def update_config_tools(conf, begin, trimmer, rmhoster, identifier, gpu):
@@ -168,6 +188,9 @@ def init(args, unknown):
         strainpi.update_config(
             project.config_file, project.new_config_file, conf, remove=False
         )
+
+        if args.check_samples:
+            check_samples(args.samples, args)
     else:
         print("Please supply a workdir!")
         sys.exit(-1)
@@ -175,10 +198,58 @@ def init(args, unknown):
 
 def identify_wf(args, unknown):
     snakefile = os.path.join(os.path.dirname(__file__), "snakefiles/identify_wf.smk")
-    run_snakemake(args, unknown, snakefile, "identify_wf")
+    sys.exit(run_snakemake(args, unknown, snakefile, "identify_wf"))
+
+
+def fqstats(args, unknown):
+    df = strainpi.fqstats_summary(
+        args.fqs, args.threads, args.fq_encoding, args.basename,
+        threads=args.inflate_threads)
+    df.to_csv(sys.stdout if args.out_file == "-" else args.out_file, sep="\t", index=False)
+
+
+def status(args, unknown):
+    from strainpi import tracker
+
+    project = strainpi.project_status(
+        args.workdir, args.config, args.threads, args.refresh, per_sample=args.samples is not None)
+
+    if args.json:
+        print(json.dumps({k: v for k, v in project.items() if k != "per_sample"}, indent=2))
+    else:
+        tracker.print_status(project, sys.stdout)
+
+    if args.samples == "-":
+        tracker.write_per_sample(project, sys.stdout)
+    elif args.samples is not None:
+        with open(args.samples, "wt") as oh:
+            tracker.write_per_sample(project, oh)
+
+
+def benchmark_report(args, unknown):
+    df, summary, usage = strainpi.benchmark_report(
+        args.workdir, args.config, args.out_dir, args.threads)
+
+    print("%d jobs, %.2f core-hours in %.2f hours, busy cores: %.1f mean, %d peak" % (
+        len(df), usage["core_hours"], usage["makespan_hours"],
+        usage["mean_busy_cores"], usage["peak_busy_cores"]))
+    columns = ["rank", "rule", "jobs", "threads", "core_hours", "core_hours_pct",
+               "cpu_efficiency", "p95_s", "max_rss_mb", "s_per_input_gb"]
+    print(summary[columns].head(args.top).to_string(index=False, float_format="%.2f"))
+
+
+def resource_model(args, unknown):
+    from strainpi import modeler
+
+    models = strainpi.learn_models(args.workdir, args.config, args.history, args.threads)
+    table = modeler.models_table(models)
+    if len(table) > 0:
+        print(table.to_string(index=False, float_format="%.2f"))
 
 
 def snakemake_summary(snakefile, configfile, task):
+    import pandas as pd
+
     cmd = [
         "snakemake",
         "--snakefile",
@@ -238,6 +309,20 @@ def main():
         action="store_true",
         help="check samples, default: False",
     )
+    common_parser.add_argument(
+        "--check-threads",
+        dest="check_threads",
+        type=int,
+        default=16,
+        help="threads used to check samples",
+    )
+    common_parser.add_argument(
+        "--check-deep",
+        dest="check_deep",
+        default=False,
+        action="store_true",
+        help="inflate every input file completely when checking samples, default: False",
+    )
 
     run_parser = argparse.ArgumentParser(add_help=False)
     run_parser.add_argument(
@@ -339,6 +424,30 @@ def main():
         prog="strainpi identify_wf",
         help="identify strains",
     )
+    parser_status = subparsers.add_parser(
+        "status",
+        formatter_class=strainpi.custom_help_formatter,
+        prog="strainpi status",
+        help="project progress from output manifests, logs and benchmark files",
+    )
+    parser_benchmark_report = subparsers.add_parser(
+        "benchmark-report",
+        formatter_class=strainpi.custom_help_formatter,
+        prog="strainpi benchmark-report",
+        help="collect benchmark files into a table, bottleneck summary and trace timeline",
+    )
+    parser_resource_model = subparsers.add_parser(
+        "resource-model",
+        formatter_class=strainpi.custom_help_formatter,
+        prog="strainpi resource-model",
+        help="learn mem_mb and runtime of rules from benchmark files, used by later runs",
+    )
+    parser_fqstats = subparsers.add_parser(
+        "fqstats",
+        formatter_class=strainpi.custom_help_formatter,
+        prog="strainpi fqstats",
+        help="seqkit stats --all --tabular compatible fastq statistics",
+    )
 
     parser_init.add_argument(
         "-s",
@@ -412,6 +521,158 @@ if begin from trimming, rmhost, or assembly:
     parser_identify_wf.set_defaults(func=identify_wf)
 
 
+    parser_status.add_argument(
+        "-d",
+        "--workdir",
+        metavar="WORKDIR",
+        type=str,
+        default="./",
+        help="project workdir",
+    )
+    parser_status.add_argument(
+        "--config",
+        type=str,
+        default=None,
+        help="config.yaml, default: WORKDIR/config.yaml",
+    )
+    parser_status.add_argument(
+        "-j",
+        "--threads",
+        type=int,
+        default=16,
+        help="directories scanned in parallel",
+    )
+    parser_status.add_argument(
+        "--samples",
+        type=str,
+        default=None,
+        help="write per-sample completion to a tsv, '-': stdout",
+    )
+    parser_status.add_argument(
+        "--json",
+        default=False,
+        action="store_true",
+        help="print the status as json",
+    )
+    parser_status.add_argument(
+        "--refresh",
+        default=False,
+        action="store_true",
+        help="ignore the cache of previous calls and scan everything again",
+    )
+    parser_status.set_defaults(func=status)
+
+
+    parser_benchmark_report.add_argument(
+        "-d",
+        "--workdir",
+        metavar="WORKDIR",
+        type=str,
+        default="./",
+        help="project workdir",
+    )
+    parser_benchmark_report.add_argument(
+        "--config",
+        type=str,
+        default=None,
+        help="config.yaml, default: WORKDIR/config.yaml",
+    )
+    parser_benchmark_report.add_argument(
+        "-o",
+        "--out-dir",
+        dest="out_dir",
+        type=str,
+        default=None,
+        help="output directory, default: WORKDIR/benchmark_report",
+    )
+    parser_benchmark_report.add_argument(
+        "-j",
+        "--threads",
+        type=int,
+        default=16,
+        help="files read in parallel",
+    )
+    parser_benchmark_report.add_argument(
+        "--top",
+        type=int,
+        default=20,
+        help="print the top rules by core-hours",
+    )
+    parser_benchmark_report.set_defaults(func=benchmark_report)
+
+    parser_resource_model.add_argument(
+        "-d",
+        "--workdir",
+        metavar="WORKDIR",
+        type=str,
+        default="./",
+        help="project workdir, the models are written to WORKDIR/.strainpi/resource_models.json",
+    )
+    parser_resource_model.add_argument(
+        "--config",
+        type=str,
+        default=None,
+        help="config.yaml, default: WORKDIR/config.yaml",
+    )
+    parser_resource_model.add_argument(
+        "--history",
+        metavar="PROJECT",
+        nargs="+",
+        default=None,
+        help="workdirs of past projects whose benchmark files are learned from too",
+    )
+    parser_resource_model.add_argument(
+        "-j",
+        "--threads",
+        type=int,
+        default=16,
+        help="files read in parallel",
+    )
+    parser_resource_model.set_defaults(func=resource_model)
+
+
+    parser_fqstats.add_argument("fqs", metavar="FQ", nargs="+", help="fastq files, gzip or plain")
+    parser_fqstats.add_argument(
+        "-o",
+        "--out-file",
+        dest="out_file",
+        type=str,
+        default="-",
+        help="output tsv, default: stdout",
+    )
+    parser_fqstats.add_argument(
+        "-j",
+        "--threads",
+        type=int,
+        default=4,
+        help="files counted in parallel",
+    )
+    parser_fqstats.add_argument(
+        "--inflate-threads",
+        dest="inflate_threads",
+        type=int,
+        default=1,
+        help="threads to inflate one gzip file, needs isal or zlib-ng",
+    )
+    parser_fqstats.add_argument(
+        "-E",
+        "--fq-encoding",
+        dest="fq_encoding",
+        type=str,
+        default="sanger",
+        choices=["sanger", "illumina-1.8+", "solexa", "illumina-1.3+", "illumina-1.5+"],
+        help="fastq quality encoding",
+    )
+    parser_fqstats.add_argument(
+        "-b",
+        "--basename",
+        default=False,
+        action="store_true",
+        help="only output basename of files",
+    )
+    parser_fqstats.set_defaults(func=fqstats)
+
+
     args, unknown = parser.parse_known_args()
 
     try:
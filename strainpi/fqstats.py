@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+import argparse
+import concurrent.futures
+import gzip
+import os
+import sys
+
+import numpy as np
+
+try:
+    from isal import igzip_threaded
+except ImportError:
+    igzip_threaded = None
+
+try:
+    from zlib_ng import gzip_ng_threaded
+except ImportError:
+    gzip_ng_threaded = None
+
+
+# quality offset of seqkit --fq-encoding
+QUALITY_OFFSET = {
+    "sanger": 33,
+    "illumina-1.8+": 33,
+    "solexa": 64,
+    "illumina-1.3+": 64,
+    "illumina-1.5+": 64
+}
+
+# seqkit stats counts these as gaps and these as GC
+GAP_BASES = b"- ."
+GC_BASES = b"GCSgcs"
+
+BLOCK_SIZE = 1 << 23
+
+
+def open_fastq(fq, threads=1):
+    """
+    a binary handle of a fastq, gzip is inflated on threads by isal or zlib-ng when installed
+    """
+    with open(fq, "rb") as ih:
+        gzipped = ih.read(2) == b"\x1f\x8b"
+    if not gzipped:
+        return open(fq, "rb")
+    if igzip_threaded is not None:
+        return igzip_threaded.open(fq, "rb", threads=threads)
+    if gzip_ng_threaded is not None:
+        return gzip_ng_threaded.open(fq, "rb", threads=threads)
+    return gzip.open(fq, "rb")
+
+
+def read_blocks(ih, block_size=BLOCK_SIZE):
+    """
+    large blocks of whole fastq records, as numpy byte arrays
+    """
+    carry = b""
+    while True:
+        data = ih.read(block_size)
+        if not data:
+            break
+        data = carry + data
+        buf = np.frombuffer(data, dtype=np.uint8)
+        newlines = np.flatnonzero(buf == 10)
+        records = len(newlines) // 4
+        if records == 0:
+            carry = data
+            continue
+        end = int(newlines[records * 4 - 1]) + 1
+        carry = data[end:]
+        yield buf[:end]
+
+    if carry.strip():
+        if not carry.endswith(b"\n"):
+            carry += b"\n"
+        yield np.frombuffer(carry, dtype=np.uint8)
+
+
+class fastq_counter:
+    """
+    seqkit stats --all of fastq blocks, everything is counted by numpy over
+    the byte buffer, the state is a read length histogram and a few counters
+    """
+    def __init__(self, fq_encoding="sanger"):
+        self.offset = QUALITY_OFFSET.get(fq_encoding, 33)
+        self.lengths = np.zeros(1, dtype=np.int64)
+        self.gc = 0
+        self.gaps = 0
+        self.qual_bases = 0
+        self.q20 = 0
+        self.q30 = 0
+        self.sum_avg_qual = 0.0
+        # phred -> error probability, seqkit averages the quality of a read in this space
+        phred = np.arange(256, dtype=np.float64) - self.offset
+        self.error_prob = np.power(10.0, -np.maximum(phred, 0) / 10.0).astype(np.float32)
+        # line classes of a record: header, sequence, plus, quality
+        self.classes = np.array([0, 1, 0, 2], dtype=np.int8)
+
+    def update(self, buf):
+        """
+        buf holds whole 4-line fastq records
+        """
+        newlines = np.flatnonzero(buf == 10)
+        if len(newlines) < 4:
+            return
+        newlines = newlines[:len(newlines) // 4 * 4].reshape(-1, 4)
+
+        # [sequence start, sequence end, quality start, quality end] of every record
+        bounds = np.empty(newlines.shape, dtype=np.int64)
+        bounds[:, 0] = newlines[:, 0] + 1
+        bounds[:, 1] = newlines[:, 1]
+        bounds[:, 2] = newlines[:, 2] + 1
+        bounds[:, 3] = newlines[:, 3]
+        # CRLF files
+        for start, end in [(0, 1), (2, 3)]:
+            bounds[:, end] -= (buf[np.maximum(bounds[:, end] - 1, 0)] == 13) & \
+                (bounds[:, end] > bounds[:, start])
+
+        lengths = bounds[:, 1] - bounds[:, 0]
+        hist = np.bincount(lengths)
+        if len(hist) > len(self.lengths):
+            self.lengths = np.pad(self.lengths, (0, len(hist) - len(self.lengths)))
+        self.lengths[:len(hist)] += hist
+
+        # 1 on sequence bytes, 2 on quality bytes, 0 elsewhere
+        spans = np.diff(np.concatenate(([0], bounds.ravel(), [len(buf)])))
+        classes = np.append(np.tile(self.classes, len(bounds)), np.int8(0))
+        klass = np.repeat(classes, spans)
+
+        seqs = buf[klass == 1]
+        self.gc += sum(np.count_nonzero(seqs == base) for base in GC_BASES)
+        self.gaps += sum(np.count_nonzero(seqs == base) for base in GAP_BASES)
+
+        quals = buf[klass == 2]
+        self.qual_bases += np.count_nonzero(quals >= self.offset)
+        self.q20 += np.count_nonzero(quals >= self.offset + 20)
+        self.q30 += np.count_nonzero(quals >= self.offset + 30)
+
+        qual_lengths = bounds[:, 3] - bounds[:, 2]
+        nonempty = qual_lengths > 0
+        if quals.size > 0:
+            offsets = np.concatenate(([0], np.cumsum(qual_lengths)[:-1]))[nonempty]
+            error = np.add.reduceat(self.error_prob[quals], offsets, dtype=np.float64) / \
+                qual_lengths[nonempty]
+            self.sum_avg_qual += float((-10 * np.log10(error)).sum())
+
+    def nth_length(self, cumulative, n):
+        return int(np.searchsorted(cumulative, n, side="right"))
+
+    def median(self, cumulative, start, end):
+        # median of the sorted lengths[start:end], same as seqkit
+        n = end - start
+        if n <= 0:
+            return 0
+        if n % 2 == 0:
+            return (self.nth_length(cumulative, start + n // 2 - 1) +
+                    self.nth_length(cumulative, start + n // 2)) / 2
+        return self.nth_length(cumulative, start + n // 2)
+
+    def row(self, name):
+        lengths = np.arange(len(self.lengths))
+        num_seqs = int(self.lengths.sum())
+        sum_len = int((lengths * self.lengths).sum())
+        cumulative = np.cumsum(self.lengths)
+        seen = np.flatnonzero(self.lengths)
+
+        if num_seqs % 2 == 0:
+            c1 = c2 = num_seqs // 2
+        else:
+            c1 = (num_seqs - 1) // 2
+            c2 = c1 + 1
+
+        n50 = 0
+        if sum_len > 0:
+            covered = np.cumsum((lengths * self.lengths)[::-1])
+            n50 = int(lengths[::-1][np.searchsorted(covered * 2, sum_len)])
+
+        return {
+            "file": name,
+            "format": "FASTQ",
+            "type": "DNA",
+            "num_seqs": num_seqs,
+            "sum_len": sum_len,
+            "min_len": int(seen[0]) if len(seen) > 0 else 0,
+            "avg_len": "%.1f" % (sum_len / num_seqs if num_seqs > 0 else 0),
+            "max_len": int(seen[-1]) if len(seen) > 0 else 0,
+            "Q1": "%.1f" % self.median(cumulative, 0, c1),
+            "Q2": "%.1f" % self.median(cumulative, 0, num_seqs),
+            "Q3": "%.1f" % self.median(cumulative, c2, num_seqs),
+            "sum_gap": int(self.gaps),
+            "N50": n50,
+            "Q20(%)": "%.2f" % (100 * self.q20 / self.qual_bases if self.qual_bases > 0 else 0),
+            "Q30(%)": "%.2f" % (100 * self.q30 / self.qual_bases if self.qual_bases > 0 else 0),
+            "AvgQual": "%.2f" % (self.sum_avg_qual / num_seqs if num_seqs > 0 else 0),
+            "GC(%)": "%.2f" % (100 * self.gc / sum_len if sum_len > 0 else 0)
+        }
+
+
+def fastq_stats(fq, fq_encoding="sanger", threads=1, basename=True, block_size=BLOCK_SIZE):
+    """
+    seqkit stats --all --tabular row of one fastq
+    """
+    counter = fastq_counter(fq_encoding)
+    with open_fastq(fq, threads) as ih:
+        for buf in read_blocks(ih, block_size):
+            counter.update(buf)
+    return counter.row(os.path.basename(fq) if basename else fq)
+
+
+def fastp_rows(report, names):
+    """
+    seqkit stats rows of the outputs of fastp from its json report, fastp keeps
+    no read length distribution and no gap count, so min_len, Q1, Q2, Q3,
+    sum_gap, N50 and AvgQual are empty
+    """
+    gc = report["summary"]["after_filtering"]["gc_content"]
+    rows = []
+    for name, key in zip(names, ["read1_after_filtering", "read2_after_filtering"]):
+        reads = report[key]
+        num_seqs = reads["total_reads"]
+        sum_len = reads["total_bases"]
+        rows.append({
+            "file": name,
+            "format": "FASTQ",
+            "type": "DNA",
+            "num_seqs": num_seqs,
+            "sum_len": sum_len,
+            "min_len": "",
+            "avg_len": "%.1f" % (sum_len / num_seqs if num_seqs > 0 else 0),
+            "max_len": reads["total_cycles"],
+            "Q1": "",
+            "Q2": "",
+            "Q3": "",
+            "sum_gap": "",
+            "N50": "",
+            "Q20(%)": "%.2f" % (100 * reads["q20_bases"] / sum_len if sum_len > 0 else 0),
+            "Q30(%)": "%.2f" % (100 * reads["q30_bases"] / sum_len if sum_len > 0 else 0),
+            "AvgQual": "",
+            "GC(%)": "%.2f" % (100 * gc)
+        })
+    return rows
+
+
+def fqstats_summary(fqs, workers=1, fq_encoding="sanger", basename=True, **kwargs):
+    """
+    a drop-in for `seqkit stats --all --tabular`, files are counted in parallel
+    """
+    # pandas is only needed here, the counting runs in the wrapper environments too
+    import pandas as pd
+    from strainpi import tooler
+
+    threads = kwargs.get("threads", 1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        rows = list(executor.map(
+            lambda fq: fastq_stats(fq, fq_encoding, threads, basename), fqs))
+
+    df = pd.DataFrame(rows, columns=list(tooler.SEQKIT_STATS_DTYPES))
+    if "output" in kwargs:
+        df.to_csv(kwargs["output"], sep="\t", index=False)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser("strainpi fqstats")
+    parser.add_argument("fqs", nargs="+", help="fastq files, gzip or plain")
+    parser.add_argument("-o", "--out-file", dest="output", default="-", help="output tsv, default: stdout")
+    parser.add_argument("-j", "--threads", dest="threads", type=int, default=4,
+                        help="files counted in parallel")
+    parser.add_argument("--inflate-threads", dest="inflate_threads", type=int, default=1,
+                        help="threads to inflate one gzip file, needs isal or zlib-ng")
+    parser.add_argument("-E", "--fq-encoding", dest="fq_encoding", default="sanger",
+                        choices=list(QUALITY_OFFSET))
+    parser.add_argument("-b", "--basename", dest="basename", default=False, action="store_true",
+                        help="only output basename of files")
+    args = parser.parse_args()
+
+    df = fqstats_summary(args.fqs, args.threads, args.fq_encoding, args.basename,
+                 threads=args.inflate_threads)
+    df.to_csv(sys.stdout if args.output == "-" else args.output, sep="\t", index=False)
+
+
+if __name__ == "__main__":
+    main()
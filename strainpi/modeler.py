@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+
+import json
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from strainpi import profiler
+
+
+# 2: rules are named after their benchmark: declaration, not their directory
+MODELS_VERSION = 2
+
+# next to the parsed samples cache of the project
+MODELS_FILE = os.path.join(".strainpi", "resource_models.json")
+
+# jobs with a known input size a rule needs before the size enters its model,
+# with fewer the model is a constant that covers the jobs seen
+MIN_JOBS = 5
+
+# share of the jobs a prediction covers before the margin
+QUANTILE = 0.95
+
+MIN_MEM_MB = 256
+MIN_RUNTIME = 1
+
+
+def feature_values(input_gb, threads):
+    """
+    features of a job, or of many when given arrays, input size in GB
+    """
+    return {
+        "intercept": np.ones_like(input_gb),
+        "input_gb": input_gb,
+        "threads": threads,
+        "input_gb_per_thread": input_gb / threads,
+    }
+
+
+def design(jobs, features):
+    """
+    feature matrix of jobs
+    """
+    values = feature_values(
+        jobs["input_bytes"].to_numpy(dtype="float64") / 1e9,
+        jobs["threads"].to_numpy(dtype="float64"))
+    return np.column_stack([values[f] for f in features])
+
+
+def evaluate(params, input_gb, threads):
+    """
+    model value of a job before the ratio
+    """
+    values = feature_values(float(input_gb or 0), float(threads))
+    return sum(c * values[f] for f, c in zip(params["features"], params["coef"]))
+
+
+def fit(x, y):
+    """
+    least squares with non-negative coefficients, the feature with the most
+    negative coefficient is dropped until none is left, the intercept stays
+    """
+    keep = list(range(x.shape[1]))
+    while True:
+        coef = np.linalg.lstsq(x[:, keep], y, rcond=None)[0]
+        negative = [(c, i) for c, i in zip(coef, keep) if c < 0 and i != 0]
+        if len(negative) == 0:
+            break
+        keep.remove(min(negative)[1])
+    full = np.zeros(x.shape[1])
+    full[keep] = np.clip(coef, 0, None)
+    return full
+
+
+def fit_target(jobs, features, y):
+    """
+    coefficients and the QUANTILE of observed / predicted, so that the
+    prediction covers the jobs the fit runs under
+    """
+    x = design(jobs, features)
+    coef = fit(x, y)
+    predicted = x @ coef
+    ratio = y[predicted > 0] / predicted[predicted > 0]
+    if len(ratio) == 0:
+        ratio = np.ones(1)
+    q = np.quantile(ratio, QUANTILE) if len(ratio) >= MIN_JOBS else ratio.max()
+    return {
+        "features": features,
+        "coef": [float(c) for c in coef],
+        "ratio": max(float(q), 1.0),
+    }
+
+
+def fit_rule(jobs):
+    """
+    mem_mb and runtime (minutes) model of one rule from its benchmark rows,
+    threads enter a model only when the history has more than one
+    """
+    jobs = jobs.dropna(subset=["s", "max_rss"])
+    if len(jobs) == 0:
+        return None
+
+    features = ["intercept"]
+    sized = jobs.dropna(subset=["input_bytes"])
+    if len(sized) >= MIN_JOBS:
+        jobs = sized
+        features.append("input_gb")
+    threads = sorted(int(t) for t in jobs["threads"].unique())
+
+    mem_features = list(features)
+    runtime_features = list(features)
+    if len(threads) > 1:
+        mem_features.append("threads")
+        if "input_gb" in features:
+            runtime_features.append("input_gb_per_thread")
+
+    model = {
+        "jobs": len(jobs),
+        "threads": threads,
+        "input_gb_max": float(jobs["input_bytes"].max() / 1e9) if "input_gb" in features else None,
+        "mem_mb": fit_target(jobs, mem_features, jobs["max_rss"].to_numpy(dtype="float64")),
+        "runtime": fit_target(jobs, runtime_features, jobs["s"].to_numpy(dtype="float64") / 60),
+    }
+    return model
+
+
+def fit_models(df):
+    """
+    {rule: model} from a profiler.benchmark_table
+    """
+    models = {}
+    for rule, jobs in df.groupby("rule", sort=True):
+        model = fit_rule(jobs)
+        if model is not None:
+            models[rule] = model
+    return models
+
+
+def learn_models(workdir="./", config=None, history=None, workers=16):
+    """
+    fit the resource models of a project from its benchmark files and those of
+    the history projects, save them to WORKDIR/.strainpi/resource_models.json
+    """
+    workdir = os.path.realpath(workdir)
+    tables = [profiler.benchmark_table(workdir, config, workers)]
+    for project in history or []:
+        tables.append(profiler.benchmark_table(project, None, workers))
+    df = pd.concat(tables, ignore_index=True)
+
+    models = {
+        "version": MODELS_VERSION,
+        "projects": [workdir] + [os.path.realpath(p) for p in history or []],
+        "rules": fit_models(df),
+    }
+
+    models_file = os.path.join(workdir, MODELS_FILE)
+    os.makedirs(os.path.dirname(models_file), exist_ok=True)
+    with open(models_file + ".tmp", "wt") as oh:
+        json.dump(models, oh, indent=2)
+    os.replace(models_file + ".tmp", models_file)
+    print("resource models of %d rules written to %s" % (len(models["rules"]), models_file))
+    return models
+
+
+class resource_models:
+    """
+    learned mem_mb and runtime of the rules of a project, mem_mb and runtime
+    are snakemake resource callables, every retry of a job asks for
+    retry_factor times more
+    """
+    def __init__(self, config, workdir="./", models_file=None, margin=0.2, retry_factor=1.5):
+        self.config = config
+        self.workdir = workdir
+        self.margin = margin
+        self.retry_factor = retry_factor
+        self.rules = {}
+
+        models_file = models_file or os.path.join(workdir, MODELS_FILE)
+        if os.path.exists(models_file):
+            with open(models_file, "rt") as ih:
+                models = json.load(ih)
+            if models.get("version") == MODELS_VERSION:
+                self.rules = models["rules"]
+            else:
+                print("%s is out of date, run strainpi resource-model again" % models_file,
+                      file=sys.stderr)
+
+    def __contains__(self, rule):
+        return rule in self.rules
+
+    def input_bytes(self, rulename, wildcards, input):
+        """
+        bytes of the reads of a job, from the manifest of its upstream step or
+        else from its input files, None before they exist
+        """
+        sample = wildcards.get("sample")
+        if sample is not None:
+            for step in profiler.input_steps(rulename):
+                if step not in self.config["output"]:
+                    continue
+                manifest = os.path.join(
+                    self.workdir, self.config["output"][step], "reads", sample, sample + ".json")
+                size = profiler.reads_size(manifest, self.workdir)
+                if size:
+                    return size
+
+        size = 0
+        for f in input:
+            try:
+                size += os.path.getsize(f)
+            except OSError:
+                return None
+        return size or None
+
+    def predict(self, target, rulename, wildcards, input, threads, attempt):
+        model = self.rules[rulename]
+        params = model[target]
+
+        input_gb = None
+        if "input_gb" in params["features"]:
+            size = self.input_bytes(rulename, wildcards, input)
+            # the largest input seen until the job's input exists
+            input_gb = model["input_gb_max"] if size is None else size / 1e9
+        value = evaluate(params, input_gb, threads) * params["ratio"]
+        value *= (1 + self.margin) * self.retry_factor ** (attempt - 1)
+        return value
+
+    def mem_mb(self, wildcards, input, threads, attempt, rulename):
+        return max(MIN_MEM_MB, int(math.ceil(
+            self.predict("mem_mb", rulename, wildcards, input, threads, attempt))))
+
+    def runtime(self, wildcards, input, threads, attempt, rulename):
+        return max(MIN_RUNTIME, int(math.ceil(
+            self.predict("runtime", rulename, wildcards, input, threads, attempt))))
+
+    def apply(self, rules):
+        """
+        give the rules with a model mem_mb and runtime resources, strainpi_model
+        tells the cluster submit scripts to prefer them over cluster.yaml,
+        models which match no rule are reported
+        """
+        names = set()
+        for rule in rules:
+            names.add(rule.name)
+            if rule.name in self.rules:
+                rule.resources["mem_mb"] = self.mem_mb
+                rule.resources["runtime"] = self.runtime
+                rule.resources["strainpi_model"] = 1
+        unmatched = sorted(set(self.rules) - names)
+        if unmatched:
+            print("resource models of %d rule(s) match no rule of the workflow: %s" % (
+                len(unmatched), ", ".join(unmatched)), file=sys.stderr)
+
+
+def load_resource_models(config, workdir="./"):
+    """
+    resource_models of the project, as set in params: resources of the config
+    """
+    params = config["params"].get("resources", {})
+    models = resource_models(
+        config, workdir,
+        margin=params.get("margin", 0.2),
+        retry_factor=params.get("retry_factor", 1.5))
+    if not params.get("model", True):
+        models.rules = {}
+    return models
+
+
+def models_table(models):
+    """
+    one row per rule, mem_mb and runtime predicted for its largest input seen
+    """
+    rows = []
+    for rule, model in models["rules"].items():
+        row = {"rule": rule, "jobs": model["jobs"],
+               "threads": ",".join(map(str, model["threads"])),
+               "input_gb_max": model["input_gb_max"]}
+        for target in ["mem_mb", "runtime"]:
+            params = model[target]
+            row[target] = evaluate(
+                params, model["input_gb_max"], model["threads"][-1]) * params["ratio"]
+            row[target + "_features"] = "+".join(params["features"][1:]) or "constant"
+        rows.append(row)
+    return pd.DataFrame(rows, columns=["rule", "jobs", "threads", "input_gb_max",
+                                       "mem_mb", "mem_mb_features", "runtime", "runtime_features"])
@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+
+import concurrent.futures
+import glob
+import heapq
+import io
+import json
+import os
+import re
+
+import pandas as pd
+
+from strainpi import configer, sampler, tooler, tracker
+
+
+# columns of a snakemake benchmark file
+BENCHMARK_DTYPES = {
+    "s": "float64",
+    "h:m:s": "str",
+    "max_rss": "float64",
+    "max_vms": "float64",
+    "max_uss": "float64",
+    "max_pss": "float64",
+    "io_in": "float64",
+    "io_out": "float64",
+    "mean_load": "float64",
+    "cpu_time": "float64"
+}
+
+# the step whose manifest holds the reads a rule works on, steps left out
+# by the config are skipped towards raw
+UPSTREAM = {
+    "raw": ["raw"],
+    "trimming": ["raw"],
+    "rmhost": ["trimming", "raw"],
+    "alignment": ["rmhost", "trimming", "raw"],
+}
+
+RULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules")
+
+RULE_RE = re.compile(r"^\s*(?:local)?rule (\w+):")
+THREADS_RE = re.compile(r"^\s*threads:\s*(.*)$")
+CONFIG_KEY_RE = re.compile(r"\[\"([^\"]+)\"\]")
+LOG_THREADS_RE = re.compile(r"^\s+threads: (\d+)$")
+
+
+def input_steps(rule):
+    """
+    steps whose manifests may hold the reads of a rule, the first one found wins,
+    reports and fastqc read the manifest of their own step
+    """
+    step = rule.split("_")[0]
+    if step not in UPSTREAM:
+        return []
+    if rule.endswith(("_report", "_fastqc")):
+        return [step]
+    return UPSTREAM[step]
+
+
+def rule_threads(conf):
+    """
+    {rule: threads} of the rule files, a `threads: config[...]` is looked up in conf
+    """
+    threads = {}
+    for smk in sorted(glob.glob(os.path.join(RULES_DIR, "*.smk"))):
+        rule = None
+        pending = False
+        with open(smk, "rt") as ih:
+            for line in ih:
+                matched = RULE_RE.match(line)
+                if matched is not None:
+                    rule, pending = matched.group(1), False
+                    continue
+                matched = THREADS_RE.match(line)
+                if matched is not None:
+                    value, pending = matched.group(1).strip(), True
+                elif pending and line.strip():
+                    value = line.strip()
+                else:
+                    continue
+                if not value:
+                    continue
+                pending = False
+                if value.isdigit():
+                    threads[rule] = int(value)
+                elif value.startswith("config["):
+                    node = conf
+                    try:
+                        for key in CONFIG_KEY_RE.findall(value):
+                            node = node[key]
+                        threads[rule] = int(node)
+                    except (KeyError, TypeError, ValueError):
+                        pass
+    return threads
+
+
+def log_threads(workdir):
+    """
+    {(rule, key): threads} of the jobs in the snakemake logs of a project, the
+    threads a job really got, snakemake scales them down to --cores and only
+    logs them when they are not 1, later runs win
+    """
+    threads = {}
+    for log in sorted(glob.glob(os.path.join(workdir, ".snakemake/log/*.snakemake.log"))):
+        job = None
+        with open(log, "rt", errors="replace") as ih:
+            for line in ih:
+                matched = tracker.RULE_RE.match(line.rstrip("\n"))
+                if matched is not None:
+                    job = [matched.group(1), matched.group(1), 1]
+                    continue
+                if job is None:
+                    continue
+                if line.strip() == "":
+                    threads[(job[0], job[1])] = job[2]
+                    job = None
+                    continue
+                matched = tracker.WILDCARDS_RE.match(line)
+                if matched is not None:
+                    job[1] = matched.group(1).strip()
+                    continue
+                matched = LOG_THREADS_RE.match(line)
+                if matched is not None:
+                    job[2] = int(matched.group(1))
+    return threads
+
+
+def benchmark_files(outputs, workers=16, dir_rules=None):
+    """
+    [(rule, key, path)] of <output>/benchmark/<dir>/<key>.txt, the rule of a
+    directory comes from dir_rules (tracker.benchmark_dir_rules)
+    """
+    dir_rules = dir_rules or {}
+    rule_dirs = []
+    for out in outputs:
+        bench_dir = os.path.join(out, "benchmark")
+        if os.path.isdir(bench_dir):
+            rule_dirs += [entry.path for entry in os.scandir(bench_dir) if entry.is_dir()]
+
+    def scan(rule_dir):
+        rule = tracker.benchmark_rule(rule_dir, dir_rules)
+        return [(rule, entry.name[:-4], entry.path)
+                for entry in os.scandir(rule_dir) if entry.name.endswith(".txt")]
+
+    files = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for found in executor.map(scan, sorted(rule_dirs)):
+            files += found
+    return files
+
+
+def read_benchmark(item):
+    """
+    header and rows of a benchmark file, rows are prefixed with rule, key and
+    the end time of the job, which is the mtime of the benchmark file
+    """
+    rule, key, path = item
+    try:
+        end = os.stat(path).st_mtime
+        header, body = tooler.read_header_body(path)
+    except FileNotFoundError:
+        return None
+    if body.strip() == b"":
+        return None
+    prefix = ("%s\t%s\t%.3f\t" % (rule, key, end)).encode()
+    rows = b"".join(prefix + line.rstrip(b"\r\n") + b"\n"
+                    for line in body.splitlines() if line.strip())
+    return header.rstrip(b"\r\n"), rows
+
+
+def reads_size(manifest, workdir):
+    """
+    bytes of the reads listed in a {sample}.json manifest, None when none of
+    them could be sized, virtual reads are sized by the files they are made of
+    """
+    try:
+        with open(manifest, "rt") as ih:
+            reads = json.load(ih)
+    except (OSError, ValueError):
+        return None
+    virtual = reads.get("VIRTUAL", {})
+    paths = []
+    for key in sampler.FQ_HEADERS:
+        fqs = virtual[key]["sources"] if key in virtual else reads.get(key, [])
+        for fq in [fqs] if isinstance(fqs, str) else fqs:
+            path = os.path.join(workdir, fq)
+            # both mates of interleaved reads share their sources
+            if path not in paths:
+                paths.append(path)
+    size = None
+    for path in paths:
+        try:
+            size = (size or 0) + os.path.getsize(path)
+        except OSError:
+            pass
+    return size
+
+
+def input_sizes(workdir, conf, samples, workers=16):
+    """
+    {step: {sample: bytes}} of the reads in the manifests of raw, trimming and rmhost
+    """
+    jobs = []
+    for step in ["raw", "trimming", "rmhost"]:
+        if step not in conf["output"]:
+            continue
+        reads_dir = os.path.join(workdir, conf["output"][step], "reads")
+        for sample in samples:
+            jobs.append((step, sample, os.path.join(reads_dir, sample, sample + ".json")))
+
+    sizes = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for (step, sample, _), size in zip(jobs, executor.map(
+                lambda job: reads_size(job[2], workdir), jobs)):
+            if size is not None:
+                sizes.setdefault(step, {})[sample] = size
+    return sizes
+
+
+def benchmark_table(workdir="./", config=None, workers=16, batch_size=10000):
+    """
+    one row per job of every benchmark file of a project, with its threads,
+    the input size of its sample, start and end time and the cpu efficiency,
+    cpu_time / (s * threads)
+    """
+    workdir = os.path.realpath(workdir)
+    conf = configer.parse_yaml(config or os.path.join(workdir, "config.yaml"))
+    outputs = [os.path.join(workdir, out) for out in dict.fromkeys(conf["output"].values())]
+
+    batches = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for table in executor.map(read_benchmark, benchmark_files(
+                outputs, workers, tracker.benchmark_dir_rules(workdir, conf))):
+            if table is not None:
+                batches.setdefault(table[0], []).append(table[1])
+
+    dtypes = {"rule": "str", "sample": "str", "end": "float64", **BENCHMARK_DTYPES}
+    df_list = []
+    for header, bodies in batches.items():
+        header = b"rule\tsample\tend\t" + header + b"\n"
+        for i in range(0, len(bodies), batch_size):
+            data = header + b"".join(bodies[i:i + batch_size])
+            names = header.decode().rstrip("\n").split("\t")
+            df_list.append(pd.read_csv(
+                io.BytesIO(data), sep="\t", keep_default_na=False,
+                na_values={k: ["NA", "-", ""] for k, v in dtypes.items() if v == "float64"},
+                dtype={k: v for k, v in dtypes.items() if k in names}))
+    if len(df_list) > 0:
+        df = pd.concat(df_list, ignore_index=True)
+    else:
+        df = pd.DataFrame({k: pd.Series(dtype=v) for k, v in dtypes.items()})
+    df = df.drop(columns=["h:m:s"], errors="ignore")
+
+    samples = set(tracker.read_samples(os.path.join(workdir, conf["params"]["samples"])))
+    df["step"] = df["rule"].str.split("_").str[0]
+    df["per_sample"] = df["sample"].isin(samples)
+
+    # threads of the job in the snakemake logs, or of its rule in the config
+    threads = log_threads(workdir)
+    df["threads"] = pd.Series(
+        [threads.get(job) for job in zip(df["rule"], df["sample"])], index=df.index, dtype="float64")
+    df["threads"] = df["threads"].fillna(df["rule"].map(rule_threads(conf))).fillna(1).astype("int64")
+    df["start"] = df["end"] - df["s"].fillna(0)
+    df["cpu_efficiency"] = df["cpu_time"] / (df["s"] * df["threads"]).where(df["s"] > 0)
+
+    sizes = input_sizes(workdir, conf, sorted(samples), workers)
+    df["input_bytes"] = float("nan")
+    for rule in df.loc[df["per_sample"], "rule"].unique():
+        rows = (df["rule"] == rule) & df["per_sample"]
+        for source in input_steps(rule):
+            pending = rows & df["input_bytes"].isna()
+            df.loc[pending, "input_bytes"] = df.loc[pending, "sample"].map(sizes.get(source, {}))
+
+    columns = ["step", "rule", "sample", "threads", "s", "cpu_time", "cpu_efficiency",
+               "max_rss", "max_vms", "max_uss", "max_pss", "io_in", "io_out", "mean_load",
+               "input_bytes", "start", "end", "per_sample"]
+    return df[[c for c in columns if c in df.columns]].sort_values(["start", "rule"], ignore_index=True)
+
+
+def bottleneck_summary(df):
+    """
+    per-rule core-hours, wall time, memory, io and cpu efficiency, ranked by core-hours
+    """
+    df = df.assign(
+        core_s=df["s"] * df["threads"],
+        input_gb=df["input_bytes"] / 1e9,
+        sized_s=df["s"].where(df["input_bytes"] > 0))
+    grouped = df.groupby(["step", "rule"])
+    summary = pd.DataFrame({
+        "jobs": grouped.size(),
+        "threads": grouped["threads"].max(),
+        "core_hours": grouped["core_s"].sum() / 3600,
+        "wall_hours": grouped["s"].sum() / 3600,
+        "mean_s": grouped["s"].mean(),
+        "p95_s": grouped["s"].quantile(0.95),
+        "max_s": grouped["s"].max(),
+        "cpu_efficiency": grouped["cpu_time"].sum() / grouped["core_s"].sum(),
+        "mean_rss_mb": grouped["max_rss"].mean(),
+        "max_rss_mb": grouped["max_rss"].max(),
+        "io_in_gb": grouped["io_in"].sum() / 1024,
+        "io_out_gb": grouped["io_out"].sum() / 1024,
+        "input_gb": grouped["input_gb"].sum(min_count=1),
+        "sized_s": grouped["sized_s"].sum(min_count=1),
+    }).reset_index()
+    summary["core_hours_pct"] = 100 * summary["core_hours"] / summary["core_hours"].sum()
+    # wall time of the jobs with a known input size only, empty without any
+    summary["s_per_input_gb"] = summary["sized_s"] / summary["input_gb"].where(summary["input_gb"] > 0)
+    summary = summary.drop(columns="sized_s")
+    summary = summary.sort_values("core_hours", ascending=False, ignore_index=True)
+    summary.insert(0, "rank", range(1, len(summary) + 1))
+    return summary
+
+
+def busy_cores(df):
+    """
+    threads of the running jobs, indexed by the time they change
+    """
+    return pd.concat([
+        pd.Series(df["threads"].values, index=df["start"].values),
+        pd.Series(-df["threads"].values, index=df["end"].values)
+    ]).groupby(level=0).sum().cumsum()
+
+
+def packing(df):
+    """
+    makespan and mean/peak busy cores of the jobs
+    """
+    df = df.dropna(subset=["s"])
+    if df.empty:
+        return {"makespan_hours": 0, "core_hours": 0, "mean_busy_cores": 0, "peak_busy_cores": 0}
+    makespan = df["end"].max() - df["start"].min()
+    core_s = (df["s"] * df["threads"]).sum()
+    return {
+        "makespan_hours": makespan / 3600,
+        "core_hours": core_s / 3600,
+        "mean_busy_cores": core_s / makespan if makespan > 0 else 0,
+        "peak_busy_cores": int(busy_cores(df).max())
+    }
+
+
+def trace_events(df):
+    """
+    chrome trace events (chrome://tracing, ui.perfetto.dev) of the jobs,
+    overlapping jobs are packed into lanes, a counter shows the busy cores
+    """
+    df = df.dropna(subset=["s"]).sort_values(["start", "end"])
+    origin = df["start"].min() if not df.empty else 0
+    events = [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "strainpi jobs"}},
+              {"name": "process_name", "ph": "M", "pid": 2, "args": {"name": "busy cores"}}]
+
+    # lane end time heap, a job goes to the lane that has been free the longest
+    free = []
+    lanes = 0
+    for row in df.itertuples(index=False):
+        if free and free[0][0] <= row.start:
+            _, lane = heapq.heappop(free)
+        else:
+            lane = lanes
+            lanes += 1
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": lane,
+                           "args": {"name": "lane %d" % lane}})
+        heapq.heappush(free, (row.end, lane))
+        events.append({
+            "name": row.rule, "cat": row.step, "ph": "X", "pid": 1, "tid": lane,
+            "ts": round((row.start - origin) * 1e6), "dur": round(row.s * 1e6),
+            "args": {
+                "sample": row.sample, "threads": int(row.threads),
+                "cpu_efficiency": None if pd.isna(row.cpu_efficiency) else round(row.cpu_efficiency, 3),
+                "max_rss_mb": None if pd.isna(row.max_rss) else row.max_rss}})
+
+    for ts, cores in busy_cores(df).items():
+        events.append({"name": "cores", "ph": "C", "pid": 2,
+                       "ts": round((ts - origin) * 1e6), "args": {"busy": int(cores)}})
+    return events
+
+
+def benchmark_report(workdir="./", config=None, out_dir=None, workers=16):
+    """
+    collect every benchmark file of a project into benchmark.tsv and
+    benchmark.parquet, rank rules by core-hours in benchmark_summary.tsv and
+    write a chrome trace timeline of the jobs to benchmark_trace.json
+    """
+    workdir = os.path.realpath(workdir)
+    out_dir = out_dir or os.path.join(workdir, "benchmark_report")
+    os.makedirs(out_dir, exist_ok=True)
+
+    df = benchmark_table(workdir, config, workers)
+    summary = bottleneck_summary(df)
+    usage = packing(df)
+
+    df.to_csv(os.path.join(out_dir, "benchmark.tsv"), sep="\t", index=False)
+    tooler.write_parquet(df, os.path.join(out_dir, "benchmark.parquet"))
+    summary.to_csv(os.path.join(out_dir, "benchmark_summary.tsv"), sep="\t", index=False)
+    with open(os.path.join(out_dir, "benchmark_trace.json"), "wt") as oh:
+        json.dump({"traceEvents": trace_events(df), "displayTimeUnit": "ms",
+                   "otherData": usage}, oh)
+    return df, summary, usage
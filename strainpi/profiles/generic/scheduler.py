@@ -36,6 +36,14 @@ for res in ['time','mem']:
     if (res in job_properties["resources"]) and (res not in cluster_param):
         cluster_param[res] = job_properties["resources"][res]
 
+# snakemake standard mem_mb and runtime (minutes) in GB and hours,
+# those learned by strainpi resource-model win over the cluster config
+learned = job_properties["resources"].get("strainpi_model")
+if ("mem_mb" in job_properties["resources"]) and (learned or ("mem" not in cluster_param)):
+    cluster_param["mem"] = -(-job_properties["resources"]["mem_mb"] // 1024)
+if ("runtime" in job_properties["resources"]) and (learned or ("time" not in cluster_param)):
+    cluster_param["time"] = job_properties["resources"]["runtime"] / 60
+
 # time in hours
 if "time" in cluster_param:
     cluster_param["time"]=int(cluster_param["time"]*60)
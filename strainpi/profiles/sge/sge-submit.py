@@ -245,7 +245,19 @@ update_double_dict(qsub_settings, parse_qsub_settings(cluster_config["__default_
 # resources defined in the snakemake file (note that these must be integer)
 # we pass an empty dictionary for option_mapping because options should not be
 # specified in the snakemake file
-update_double_dict(qsub_settings, parse_qsub_settings(job_properties.get("resources", {}), option_mapping={}))
+resources = dict(job_properties.get("resources", {}))
+# snakemake standard resources, mem_mb and runtime (minutes) in SGE units, disk has no SGE resource
+sized = {}
+for key in ("mem_mib", "disk_mb", "disk_mib"):
+    resources.pop(key, None)
+if "mem_mb" in resources:
+    sized["h_vmem"] = str(resources.pop("mem_mb")) + "M"
+if "runtime" in resources:
+    sized["h_rt"] = resources.pop("runtime") * 60
+# mem_mb and runtime learned by strainpi resource-model win over the cluster config
+learned = sized if resources.pop("strainpi_model", None) else {}
+update_double_dict(qsub_settings, parse_qsub_settings(resources, option_mapping={}))
+update_double_dict(qsub_settings, {"options": {}, "resources": sized})
 
 # get any rule specific options/resources from the default cluster config
 update_double_dict(qsub_settings, parse_qsub_settings(cluster_config.get(job_properties.get("rule"), {})))
@@ -253,6 +265,8 @@ update_double_dict(qsub_settings, parse_qsub_settings(cluster_config.get(job_pro
 # get any options/resources specified through the --cluster-config command line argument
 update_double_dict(qsub_settings, parse_qsub_settings(job_properties.get("cluster", {})))
 
+update_double_dict(qsub_settings, {"options": {}, "resources": learned})
+
 # ensure qsub output dirs exist
 for o in ("o", "e"):
     ensure_directory_exists(qsub_settings["options"][o]) if o in qsub_settings["options"] else None
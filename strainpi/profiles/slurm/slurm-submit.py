@@ -45,6 +45,12 @@ sbatch_options.update(cluster_config.get(job_properties.get("rule"), {}))
 # 5) cluster_config options
 sbatch_options.update(job_properties.get("cluster", {}))
 
+# 5.1) mem_mb and runtime learned by strainpi resource-model win over the cluster_config
+if job_properties.get("resources", {}).get("strainpi_model"):
+    sbatch_options.update(slurm_utils.convert_job_properties(
+        {"resources": {k: v for k, v in job_properties["resources"].items() if k in ("mem_mb", "runtime")}},
+        RESOURCE_MAPPING))
+
 # 6) Advanced conversion of parameters
 if ADVANCED_ARGUMENT_CONVERSION:
     sbatch_options = slurm_utils.advanced_argument_conversion(sbatch_options)
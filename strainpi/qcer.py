@@ -2,136 +2,151 @@
 
 import sys
 from strainpi import tooler
-import seaborn as sns
-import matplotlib.pyplot as plt
+from strainpi import fqstats
 import argparse
+import concurrent.futures
 import os
 import json
+import pickle
 import pandas as pd
 import numpy as np
 
-import matplotlib
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# column prefix: where the section is in a fastp json report
+FASTP_SECTIONS = {
+    "before_filtering": ("summary", "before_filtering"),
+    "read1_before_filtering": ("read1_before_filtering",),
+    "read2_before_filtering": ("read2_before_filtering",),
+    "after_filtering": ("summary", "after_filtering"),
+    "read1_after_filtering": ("read1_after_filtering",),
+    "read2_after_filtering": ("read2_after_filtering",),
+    "filtering_result": ("filtering_result",)
+}
+
+SUMMARY_FIELDS = [
+    "total_reads", "total_bases", "q20_bases", "q30_bases", "q20_rate", "q30_rate",
+    "gc_content", "read1_mean_length", "read2_mean_length"]
+READS_FIELDS = ["total_reads", "total_bases", "q20_bases", "q30_bases", "total_cycles"]
+FILTERING_FIELDS = [
+    "passed_filter_reads", "low_quality_reads", "too_many_N_reads", "too_short_reads"]
+
+# column: key path in a fastp json report
+FASTP_SCHEMA = {
+    f"{section}_{field}": path + (field,)
+    for section, path in FASTP_SECTIONS.items()
+    for field in (SUMMARY_FIELDS if path[0] == "summary" else
+                  FILTERING_FIELDS if section == "filtering_result" else READS_FIELDS)
+}
+
+
+def load_json(json_f):
+    """
+    orjson when it is installed, it parses several times faster than json
+    """
+    if orjson is not None:
+        with open(json_f, "rb") as ih:
+            return orjson.loads(ih.read())
+    with open(json_f, "r") as ih:
+        return json.load(ih)
+
 
-matplotlib.use("agg")
+def flatten_json(json_ob, schema):
+    """
+    {column: value at the key path}, None when a key is missing
+    """
+    flat = {}
+    for column, path in schema.items():
+        value = json_ob
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        flat[column] = value
+    return flat
 
 
 def parse_fastp_json(json_f, paired):
-    trimming_dict = {}
     sample_id = os.path.basename(json_f).split(".")[0]
-    with open(json_f, "r") as ih:
-        json_ob = json.load(ih)
-        trimming_dict["sample_id"] = sample_id
-        trimming_dict["before_filtering_total_reads"] = json_ob["summary"][
-            "before_filtering"
-        ]["total_reads"]
-        trimming_dict["before_filtering_total_bases"] = json_ob["summary"][
-            "before_filtering"
-        ]["total_bases"]
-        trimming_dict["before_filtering_q20_bases"] = json_ob["summary"][
-            "before_filtering"
-        ]["q20_bases"]
-        trimming_dict["before_filtering_q30_bases"] = json_ob["summary"][
-            "before_filtering"
-        ]["q30_bases"]
-        trimming_dict["before_filtering_q20_rate"] = json_ob["summary"][
-            "before_filtering"
-        ]["q20_rate"]
-        trimming_dict["before_filtering_q30_rate"] = json_ob["summary"][
-            "before_filtering"
-        ]["q30_rate"]
-        trimming_dict["before_filtering_qc_content"] = json_ob["summary"][
-            "before_filtering"
-        ]["qc_content"]
-        trimming_dict["before_filtering_read1_mean_length"] = json_ob["summary"][
-            "before_filtering"
-        ]["read1_mean_length"]
-        if paired:
-            trimming_dict["before_filtering_read2_mean_length"] = json_ob["summary"][
-                "before_filtering"
-            ]["read2_mean_length"]
-
-        trimming_dict["read1_before_filtering_total_reads"] = json_ob[
-            "read1_before_filtering"
-        ]["total_reads"]
-        trimming_dict["read1_before_filtering_total_bases"] = json_ob[
-            "read1_before_filtering"
-        ]["total_bases"]
-        trimming_dict["read1_before_filtering_q20_bases"] = json_ob[
-            "read1_before_filtering"
-        ]["q20_bases"]
-        trimming_dict["read1_before_filtering_q30_bases"] = json_ob[
-            "read1_before_filtering"
-        ]["q30_bases"]
-        if paired:
-            trimming_dict["read2_before_filtering_total_reads"] = json_ob[
-                "read2_before_filtering"
-            ]["total_reads"]
-            trimming_dict["read2_before_filtering_total_bases"] = json_ob[
-                "read2_before_filtering"
-            ]["total_bases"]
-            trimming_dict["read2_before_filtering_q20_bases"] = json_ob[
-                "read2_before_filtering"
-            ]["q20_bases"]
-            trimming_dict["read2_before_filtering_q30_bases"] = json_ob[
-                "read2_before_filtering"
-            ]["q30_bases"]
-
-        trimming_dict["after_filtering_total_reads"] = json_ob["summary"][
-            "after_filtering"
-        ]["total_reads"]
-        trimming_dict["after_filtering_total_bases"] = json_ob["summary"][
-            "after_filtering"
-        ]["total_bases"]
-        trimming_dict["after_filtering_q20_bases"] = json_ob["summary"][
-            "after_filtering"
-        ]["q20_bases"]
-        trimming_dict["after_filtering_q30_bases"] = json_ob["summary"][
-            "after_filtering"
-        ]["q30_bases"]
-        trimming_dict["after_filtering_q20_rate"] = json_ob["summary"][
-            "after_filtering"
-        ]["q20_rate"]
-        trimming_dict["after_filtering_q30_rate"] = json_ob["summary"][
-            "after_filtering"
-        ]["q30_rate"]
-        trimming_dict["after_filtering_qc_content"] = json_ob["summary"][
-            "after_filtering"
-        ]["qc_content"]
-        trimming_dict["after_filtering_read1_mean_length"] = json_ob["summary"][
-            "after_filtering"
-        ]["read1_mean_length"]
-        if paired:
-            trimming_dict["after_filtering_read2_mean_length"] = json_ob["summary"][
-                "after_filtering"
-            ]["read2_mean_length"]
-
-        trimming_dict["read1_after_filtering_total_reads"] = json_ob[
-            "read1_after_filtering"
-        ]["total_reads"]
-        trimming_dict["read1_after_filtering_total_bases"] = json_ob[
-            "read1_after_filtering"
-        ]["total_bases"]
-        trimming_dict["read1_after_filtering_q20_bases"] = json_ob[
-            "read1_after_filtering"
-        ]["q20_bases"]
-        trimming_dict["read1_after_filtering_q30_bases"] = json_ob[
-            "read1_after_filtering"
-        ]["q30_bases"]
-        if paired:
-            trimming_dict["read2_after_filtering_total_reads"] = json_ob[
-                "read2_after_filtering"
-            ]["total_reads"]
-            trimming_dict["read2_after_filtering_total_bases"] = json_ob[
-                "read2_after_filtering"
-            ]["total_bases"]
-            trimming_dict["read2_after_filtering_q20_bases"] = json_ob[
-                "read2_after_filtering"
-            ]["q20_bases"]
-            trimming_dict["read2_after_filtering_q30_bases"] = json_ob[
-                "read2_after_filtering"
-            ]["q30_bases"]
-
-        return trimming_dict
+    trimming_dict = {"sample_id": sample_id}
+    trimming_dict.update(flatten_json(load_json(json_f), FASTP_SCHEMA))
+    if not paired:
+        trimming_dict = {k: v for k, v in trimming_dict.items() if "read2" not in k}
+    return trimming_dict
+
+
+def parse_trimmomatic_summary(summary_f):
+    """
+    trimmomatic -summary file, "Input Read Pairs: 100" -> {"Input Read Pairs": 100}
+    """
+    summary = {}
+    with open(summary_f, "r") as ih:
+        for line in ih:
+            key, sep, value = line.partition(":")
+            if sep == "":
+                continue
+            value = value.strip()
+            try:
+                summary[key.strip()] = float(value) if "." in value else int(value)
+            except ValueError:
+                summary[key.strip()] = value
+    return summary
+
+
+def stats_row(fq, num_seqs):
+    """
+    a seqkit stats --all --tabular row, what a trimmer summary does not know is left empty
+    """
+    row = dict.fromkeys(tooler.SEQKIT_STATS_DTYPES)
+    row.update({"file": os.path.basename(fq), "format": "FASTQ", "type": "DNA", "num_seqs": num_seqs})
+    return row
+
+
+def trimming_records(manifest):
+    """
+    seqkit stats rows of the trimmed reads listed in a trimming {sample}.json,
+    built from the PE_TRIMMING_REPORT and SE_TRIMMING_REPORT of it:
+    a fastp json report or a trimmomatic -summary file
+    """
+    with open(manifest.strip(), "r") as ih:
+        reads = json.load(ih)
+
+    records = []
+    for report_key, fq_keys in [("PE_TRIMMING_REPORT", ["PE_FORWARD", "PE_REVERSE"]),
+                                ("SE_TRIMMING_REPORT", ["SE"])]:
+        report = reads.get(report_key, "")
+        if report == "":
+            continue
+        fqs = [reads[k] for k in fq_keys]
+
+        if report.endswith(".json"):
+            records.extend(fqstats.fastp_rows(load_json(report), [os.path.basename(fq) for fq in fqs]))
+        else:
+            summary = parse_trimmomatic_summary(report)
+            num_seqs = summary.get("Both Surviving Reads", summary.get("Surviving Reads"))
+            for fq in fqs:
+                records.append(stats_row(fq, num_seqs))
+    return records
+
+
+def trimming_summary(manifests, workers=8, **kwargs):
+    """
+    a trimming_stats.tsv from the fastp/trimmomatic reports of all samples,
+    the trimmed reads are not read again
+    """
+    rows = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for records in executor.map(trimming_records, [str(i) for i in manifests]):
+            rows.extend(records)
+
+    df = pd.DataFrame(rows, columns=list(tooler.SEQKIT_STATS_DTYPES), dtype=object)
+    if "output" in kwargs:
+        df.to_csv(kwargs["output"], sep="\t", index=False)
+    if kwargs.get("output_parquet") is not None:
+        tooler.write_parquet(df.infer_objects(), kwargs["output_parquet"])
+    return df
 
 
 def change(input_file, output_file, sample_id, step, fq_type, reads_list):
@@ -143,102 +158,63 @@ def change(input_file, output_file, sample_id, step, fq_type, reads_list):
     df.to_csv(output_file, sep="\t", index=False)
 
 
-def update_qcstats_row(row):
-    rows = row["file"].split(".")
-    sample_id = rows[0]
-    step = rows[1]
-    fq_type = rows[2]
-
-    reads = "fq1"
-    if "pe.2.fq.gz" in row["file"]:
-        reads = "fq2"
-
-    return pd.Series([sample_id, reads, step, fq_type])
-
-
 def update_qcstats_df(df):
+    """
+    set id, reads, step and fq_type from file names like
+    {sample}.{step}.{fq_type}.1.fq.gz, as categoricals
+    """
     stats_df = df.copy()
-    stats_df[["id", "reads", "step", "fq_type"]] = stats_df.apply(
-        lambda row: update_qcstats_row(row), axis=1, result_type="expand")
+    names = stats_df["file"].str.extract(r"^([^.]*)\.([^.]*)\.([^.]*)")
+    paired_2 = stats_df["file"].str.contains("pe.2.fq", regex=False).fillna(False)
+
+    stats_df["id"] = names[0].astype("category")
+    stats_df["reads"] = pd.Categorical(np.where(paired_2, "fq2", "fq1"))
+    stats_df["step"] = names[1].astype("category")
+    stats_df["fq_type"] = names[2].astype("category")
     return stats_df
 
 
 def compute_host_rate(df, steps, samples_id_list, allow_miss_samples=True, **kwargs):
-    all_state_set = set()
-    have_state_set = set()
-    sample_reads = {}
-    host_rate = {}
+    df = update_qcstats_df(df)
 
-    for step in steps:
-        for sample_id in samples_id_list:
-            all_state_set.add((sample_id, step))
+    na_id = df["id"].isna()
+    if na_id.any():
+        print("WARNING: found NA sample id in qcreport summary")
 
-    df = update_qcstats_df(df)
-    df = df.set_index("id")
-    for sample_id in df.index.unique():
-        if not pd.isnull(sample_id):
-            sample_reads[sample_id] = {}
-
-            for step in steps:
-                step_df = df.loc[
-                    [sample_id],
-                ].query(f'''reads=="fq1" and step=="{step}"''')
-                if not step_df.empty:
-                    num_seqs = sum(step_df["num_seqs"].to_list())
-                    #print(num_seqs)
-                    if num_seqs >= 0:
-                        #print(sample_id)
-                        have_state_set.add((sample_id, step))
-                        sample_reads[sample_id][step] = num_seqs
-                    else:
-                        print(f'''WARNING: {sample_id}_{step}_num_seqs: {num_seqs}''')
-        else:
-            print("WARNING: found NA sample id in qcreport summary")
+    # num_seqs of fq1 per (id, step)
+    fq1_df = df.loc[(df["reads"] == "fq1") & df["step"].isin(steps) & ~na_id, ["id", "step", "num_seqs"]]
+    sample_reads = fq1_df.groupby(["id", "step"], observed=True)["num_seqs"].sum()
 
-    not_have_state_set = all_state_set - have_state_set
+    for (sample_id, step), num_seqs in sample_reads[sample_reads < 0].items():
+        print(f'''WARNING: {sample_id}_{step}_num_seqs: {num_seqs}''')
+    sample_reads = sample_reads[sample_reads >= 0]
 
-    #print("\n")
-    #print(all_state_set)
-    #print("\n")
-    #print(have_state_set)
-    #print("\n")
-    #print(not_have_state_set)
-    #print("\n")
+    have_state_set = set(sample_reads.index)
+    not_have_state_list = [
+        (sample_id, step)
+        for sample_id in dict.fromkeys(samples_id_list)
+        for step in steps
+        if (sample_id, step) not in have_state_set]
 
-    if len(not_have_state_set) > 0:
-        for j in not_have_state_set:
+    if len(not_have_state_list) > 0:
+        for j in not_have_state_list:
             print(f"""WARNING: there are no {j[0]} full stats report for {j[1]} step""")
         if not allow_miss_samples:
             print("Please check stats report again for each sample")
             sys.exit(1)
 
-    for sample_id in df.index.unique():
-        if not pd.isnull(sample_id):
-            if sample_id in sample_reads:
-                if "rmhost" in steps:
-                    if "trimming" in steps:
-                        if ("trimming" in sample_reads[sample_id]) and ("rmhost" in sample_reads[sample_id]):
-                            host_rate[sample_id] = (
-                                sample_reads[sample_id]["trimming"]
-                                - sample_reads[sample_id]["rmhost"]
-                                ) / sample_reads[sample_id]["trimming"]
-                        else:
-                            host_rate[sample_id] = np.nan
-                    elif "raw" in steps:
-                        if ("raw" in sample_reads[sample_id]) and ("rmhost" in sample_reads[sample_id]):
-                            host_rate[sample_id] = (
-                                sample_reads[sample_id]["raw"]
-                                - sample_reads[sample_id]["rmhost"]
-                                ) / sample_reads[sample_id]["raw"]
-                        else:
-                            host_rate[sample_id] = np.nan
-                else:
-                    host_rate[sample_id] = np.nan
-            else:
-                host_rate[sample_id] = np.nan
-
-    df = df.reset_index()
-    df["host_rate"] = df.apply(lambda x: host_rate[x["id"]], axis=1)
+    # host rate = (trimming or raw - rmhost) / (trimming or raw)
+    sample_reads = sample_reads.unstack("step")
+    sample_reads.index = sample_reads.index.astype(object)
+    sample_reads.columns = sample_reads.columns.astype(object)
+    host_rate = pd.Series(np.nan, index=sample_reads.index)
+    if "rmhost" in steps:
+        before = "trimming" if "trimming" in steps else "raw"
+        if (before in sample_reads.columns) and ("rmhost" in sample_reads.columns):
+            host_rate = (sample_reads[before] - sample_reads["rmhost"]) / sample_reads[before]
+
+    df = df.loc[:, ["id"] + [i for i in df.columns if i != "id"]].reset_index(drop=True)
+    df["host_rate"] = df["id"].astype(object).map(host_rate).astype(float)
 
     if "output" in kwargs:
         df.to_csv(kwargs["output"], sep="\t", index=False)
@@ -253,7 +229,7 @@ def qc_summary_merge(df, **kwargs):
         "num_seqs", "sum_len", "min_len", "avg_len", "max_len",
         "Q1", "Q2", "Q3", "sum_gap", "Q20(%)", "Q30(%)"]]
 
-    df_w = df_l.groupby(["id", "format", "type", "step", "fq_type"])\
+    df_w = df_l.groupby(["id", "format", "type", "step", "fq_type"], observed=True)\
             .agg(
                 num_seqs=("num_seqs", "sum"),
                 sum_len=("sum_len", "sum"),
@@ -271,9 +247,162 @@ def qc_summary_merge(df, **kwargs):
 
     if "output" in kwargs:
         df_summary.to_csv(kwargs["output"], sep="\t", index=False)
+    return df_summary
+
+
+def sample_stats(source):
+    """
+    body of the seqkit stats rows of a sample at a step, from its stats table
+    or, for a trimming {sample}.json, from its trimmer report
+    """
+    if source.endswith(".json"):
+        df = pd.DataFrame(trimming_records(source), columns=list(tooler.SEQKIT_STATS_DTYPES), dtype=object)
+        if len(df) == 0:
+            return None
+        return df.to_csv(sep="\t", index=False).encode()
+    return tooler.read_table(source)
+
+
+def split_lines(df):
+    """
+    header and rows of a table as tsv bytes
+    """
+    lines = df.to_csv(sep="\t", index=False).encode().splitlines(keepends=True)
+    return lines[0], lines[1:]
+
+
+def qc_summary_store(sources, steps, store, output_l, output_w, workers=1,
+                     allow_miss_samples=True, output_parquet=None):
+    """
+    compute_host_rate and qc_summary_merge of the stats of all samples, the
+    rows of both are kept per sample in a pickled store keyed by the
+    (size, mtime) fingerprints of the sample's sources, so a rerun only reads
+    and recomputes the samples which are new or changed
+
+    sources is {step: {sample: stats table or trimming {sample}.json}}
+
+    return the number of samples recomputed
+    """
+    entries = {"header_l": b"", "header_w": b"", "samples": {}}
+    if os.path.exists(store):
+        try:
+            entries = tooler.load_pickle(store)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            print("%s is broken, rebuild it" % store)
+
+    samples = list(dict.fromkeys(s for step in steps for s in sources.get(step, {})))
+    fingerprints = {
+        s: tuple((step, sources[step][s], tooler.file_fingerprint(sources[step][s]))
+                 for step in steps if s in sources.get(step, {}))
+        for s in samples}
+    changed = [s for s in samples
+               if (s not in entries["samples"]) or (entries["samples"][s][0] != fingerprints[s])]
+
+    if len(changed) > 0:
+        tasks = [(s, step, path) for s in changed for step, path, _ in fingerprints[s]]
+        batches = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for (s, step, path), table in zip(tasks, executor.map(lambda t: sample_stats(t[2]), tasks)):
+                if table is not None:
+                    batches.setdefault(table[0], []).append((s, step, table[1]))
+
+        df_list = []
+        for header, bodies in batches.items():
+            df_ = tooler.parse_table_bytes(header + b"".join(b for _, _, b in bodies),
+                                           tooler.SEQKIT_STATS_DTYPES)
+            df_["sample"] = np.repeat([s for s, _, _ in bodies], [b.count(b"\n") for _, _, b in bodies])
+            df_["source"] = np.repeat([step for _, step, _ in bodies], [b.count(b"\n") for _, _, b in bodies])
+            df_list.append(df_)
+
+        new = {s: (fingerprints[s], {}, {}) for s in changed}
+        if len(df_list) > 0:
+            df = pd.concat(df_list, ignore_index=True)
+            keys = df.loc[:, ["sample", "source"]]
+            df = df.drop(columns=["sample", "source"])
+
+            df_l = compute_host_rate(df, steps, changed, allow_miss_samples)
+            entries["header_l"], lines = split_lines(df_l)
+            for line, s, step in zip(lines, keys["sample"], keys["source"]):
+                new[s][1][step] = new[s][1].get(step, b"") + line
+
+            sample_of = dict(zip(df_l["id"].astype(object), keys["sample"]))
+            df_w = qc_summary_merge(df_l)
+            entries["header_w"], lines = split_lines(df_w)
+            for line, sample_id in zip(lines, df_w["id"].astype(object)):
+                w_rows = new[sample_of[sample_id]][2]
+                w_rows[sample_id] = w_rows.get(sample_id, b"") + line
+        entries["samples"].update(new)
+
+    stale = len(entries["samples"]) - len(samples)
+    entries["samples"] = {s: entries["samples"][s] for s in samples}
+
+    # rows in the order of merging the step tables, and of grouping by id
+    with open(output_l, "wb") as oh:
+        oh.write(entries["header_l"])
+        for step in steps:
+            for s in sources.get(step, {}):
+                oh.write(entries["samples"][s][1].get(step, b""))
+    w_rows = {}
+    for s in samples:
+        w_rows.update(entries["samples"][s][2])
+    with open(output_w, "wb") as oh:
+        oh.write(entries["header_w"])
+        for sample_id in sorted(w_rows):
+            oh.write(w_rows[sample_id])
+
+    if (output_parquet is not None) and (entries["header_l"] != b""):
+        with open(output_l, "rb") as ih:
+            tooler.write_parquet(tooler.parse_table_bytes(ih.read(), tooler.SEQKIT_STATS_DTYPES),
+                                 output_parquet)
+
+    if (len(changed) > 0) or (stale > 0) or (not os.path.exists(store)):
+        os.makedirs(os.path.dirname(os.path.abspath(store)), exist_ok=True)
+        tooler.dump_pickle(entries, store)
+    return len(changed)
+
+
+QC_STEPS = ["raw", "trimming", "rmhost"]
+
+
+def qc_reads_table(df):
+    """
+    fq1 num_seqs per sample (rows) and step (columns), sorted by sample id
+    """
+    df_ = df.loc[df["reads"] == "fq1"]
+    table = df_.groupby(["id", "step"], observed=True)["num_seqs"].sum().unstack("step")
+    table.index = table.index.astype(object)
+    table.columns = table.columns.astype(object)
+    return table.reindex(columns=[i for i in QC_STEPS if i in table.columns]).sort_index()
+
+
+def qc_stacked_table(table):
+    """
+    split raw reads into reads removed by trimming, by rmhost and clean reads
+    """
+    table = table.reindex(columns=QC_STEPS).fillna(0)
+    return pd.DataFrame({
+        "clean": table["rmhost"],
+        "rmhost": table["trimming"] - table["rmhost"],
+        "trim": table["raw"] - table["trimming"]
+    }, index=table.index)
+
+
+def load_pyplot():
+    """
+    matplotlib and seaborn are most of the import time of strainpi,
+    they are loaded by the first plot
+    """
+    import matplotlib
+
+    matplotlib.use("agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    return plt, sns
 
 
 def qc_bar_plot(df, engine, stacked=False, **kwargs):
+    plt, sns = load_pyplot()
     if engine == "seaborn":
         # seaborn don't like stacked barplot
         f, ax = plt.subplots(figsize=(10, 7))
@@ -283,65 +412,11 @@ def qc_bar_plot(df, engine, stacked=False, **kwargs):
 
     elif engine == "pandas":
         if not stacked:
-            df_ = (
-                df.query('reads=="fq1"')
-                .pivot(index="id", columns="step", values="num_seqs")
-                .loc[:, ["raw", "trimming", "rmhost"]]
-            )
+            df_ = qc_reads_table(df)
             df_.plot(kind="bar", figsize=(10, 7))
 
         else:
-            dict_ = {"id": [], "clean": [], "rmhost": [], "trim": []}
-            df = df.set_index("id")
-            for i in df.index.unique():
-                reads_total = 0
-
-                reads_trimmed = 0
-                reads_host = 0
-                reads_clean = 0
-
-                if (
-                    not df.loc[
-                        [i],
-                    ]
-                    .query('reads=="fq1" and step=="raw"')
-                    .empty
-                ):
-                    reads_total = df.loc[[i],].query('reads=="fq1" and step=="raw"')[
-                        "num_seqs"
-                    ][0]
-
-                if (
-                    not df.loc[
-                        [i],
-                    ]
-                    .query('reads=="fq1" and step=="trimming"')
-                    .empty
-                ):
-                    reads_trim = df.loc[[i],].query(
-                        'reads=="fq1" and step=="trimming"'
-                    )["num_seqs"][0]
-
-                if (
-                    not df.loc[
-                        [i],
-                    ]
-                    .query('reads=="fq1" and step=="rmhost"')
-                    .empty
-                ):
-                    reads_clean = df.loc[[i],].query('reads=="fq1" and step=="rmhost"')[
-                        "num_seqs"
-                    ][0]
-
-                reads_trimmed = reads_total - reads_trim
-                reads_host = reads_trim - reads_clean
-
-                dict_["id"].append(i)
-                dict_["trim"].append(reads_trimmed)
-                dict_["rmhost"].append(reads_host)
-                dict_["clean"].append(reads_clean)
-
-            df_ = pd.DataFrame(dict_).sort_values("id").set_index("id")
+            df_ = qc_stacked_table(qc_reads_table(df))
 
             colors = ["#2ca02c", "#ff7f0e", "#1f77b4"]
 
@@ -355,6 +430,94 @@ def qc_bar_plot(df, engine, stacked=False, **kwargs):
         plt.savefig(kwargs["output"])
 
 
+def qc_bar_page(table, output, stacked=False, dpi=150, rasterized=True, title=None):
+    """
+    one page of the barplot, the figure gets wider with the number of samples
+    """
+    plt, _ = load_pyplot()
+    f, ax = plt.subplots(figsize=(max(10, 0.15 * len(table) + 2), 7))
+    f.subplots_adjust(bottom=0.2)
+
+    x = np.arange(len(table))
+    colors = ["#2ca02c", "#ff7f0e", "#1f77b4"] if stacked else [None] * len(table.columns)
+    width = 0.8 if stacked else 0.8 / max(1, len(table.columns))
+    bottom = np.zeros(len(table))
+    for i, (column, color) in enumerate(zip(table.columns, colors)):
+        values = table[column].fillna(0).to_numpy()
+        if stacked:
+            ax.bar(x, values, width, bottom=bottom, color=color, label=column, zorder=0)
+            bottom += values
+        else:
+            ax.bar(x - 0.4 + width * (i + 0.5), values, width, label=column, zorder=0)
+    if rasterized:
+        # vector formats keep text and axes as vectors, all bars become one image
+        ax.set_rasterization_zorder(0.5)
+
+    ax.set_xticks(x)
+    ax.set_xticklabels(table.index, rotation=90, fontsize=6)
+    ax.set_xlim(-0.5, len(table) - 0.5)
+    ax.legend()
+    ax.set_xlabel("Sample ID")
+    ax.set_ylabel("The number of reads(-pair)")
+    ax.set_title(title or "Fastq quality control barplot", fontsize=11)
+    f.savefig(output, dpi=dpi)
+    plt.close(f)
+    return output
+
+
+def qc_bar_pages(df, pages_dir, chunk_size=200, fmt="pdf", dpi=150,
+                 rasterized=True, stacked=False, workers=1):
+    """
+    barplot of a large cohort, chunk_size samples per page, pages are drawn
+    in parallel worker processes
+    """
+    table = qc_reads_table(df)
+    if stacked:
+        table = qc_stacked_table(table)
+
+    os.makedirs(pages_dir, exist_ok=True)
+    chunks = [table.iloc[i:i + chunk_size] for i in range(0, len(table), chunk_size)]
+    pages = len(chunks)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                qc_bar_page, chunk,
+                os.path.join(pages_dir, f"qc_reads_num_barplot.{page + 1:04d}.{fmt}"),
+                stacked, dpi, rasterized,
+                f"Fastq quality control barplot ({page + 1}/{pages})")
+            for page, chunk in enumerate(chunks)]
+        return [future.result() for future in futures]
+
+
+def qc_dist_plot(df, output, dpi=150):
+    """
+    distribution of reads per step and of reads retained after quality
+    control, the size of the plot doesn't depend on the number of samples
+    """
+    plt, sns = load_pyplot()
+    table = qc_reads_table(df)
+    steps = list(table.columns)
+
+    f, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 5))
+
+    reads_df = table.melt(var_name="step", value_name="num_seqs").dropna()
+    reads_df["num_seqs"] = np.log10(reads_df["num_seqs"].clip(lower=1))
+    sns.violinplot(x="step", y="num_seqs", data=reads_df, order=steps, cut=0, ax=ax1)
+    ax1.set_ylabel("log10(the number of reads(-pair))")
+    ax1.set_title(f"Reads per step ({len(table)} samples)", fontsize=11)
+
+    if len(steps) > 1:
+        retained = (table[steps[-1]] / table[steps[0]]).dropna()
+        ax2.hist(retained, bins=50, range=(0, 1))
+        ax2.set_xlabel(f"Reads retained ({steps[-1]} / {steps[0]})")
+    ax2.set_ylabel("The number of samples")
+    ax2.set_title("Reads retained after quality control", fontsize=11)
+
+    f.tight_layout()
+    f.savefig(output, dpi=dpi)
+    plt.close(f)
+
+
 def main():
     parser = argparse.ArgumentParser(description="quality control reporter")
     parser.add_argument("--raw_stats_list", help="raw stats list")
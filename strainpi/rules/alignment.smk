@@ -24,17 +24,27 @@ rule alignment_bowtie2:
     benchmark:
         os.path.join(config["output"]["alignment"], "benchmark/bowtie2/{sample}.txt")
     params:
+        scratch_sh = os.path.join(WRAPPER_DIR, "scratch.sh"),
+        scratch_dir = config["params"]["scratch"]["dir"],
+        stage_inputs = config["params"]["scratch"]["stage_inputs"],
         pe_bam_dir = os.path.join(config["output"]["alignment"], "bam/bowtie2/{sample}/pe"),
         se_bam_dir = os.path.join(config["output"]["alignment"], "bam/bowtie2/{sample}/se"),
         report_dir = os.path.join(config["output"]["alignment"], "report/bowtie2/{sample}"),
         presets = config["params"]["alignment"]["bowtie2"]["preset"],
-        index_prefix = config["params"]["alignment"]["bowtie2"]["index_prefix"]
+        index_prefix = config["params"]["alignment"]["bowtie2"]["index_prefix"],
+        aligner_threads = SIZER.aligner_threads("alignment_bowtie2"),
+        sort_threads = SIZER.sort_threads,
+        sort_mem = SIZER.sort_mem
     priority:
         24
     conda:
         config["envs"]["bowtie2"]
     threads:
         config["params"]["alignment"]["threads"]
+    resources:
+        mem_mb = SIZER.mem_mb,
+        disk_mb = SIZER.disk_mb,
+        runtime = SIZER.runtime
     shell:
         '''
         OUTDIR=$(dirname {output})
@@ -46,6 +56,10 @@ rule alignment_bowtie2:
         R2=$(jq -r -M '.PE_REVERSE' {input.reads} | sed 's/^null$//g')
         RS=$(jq -r -M '.SE' {input.reads} | sed 's/^null$//g')
 
+        source {params.scratch_sh}
+        strainpi_scratch_init '{params.scratch_dir}' {params.stage_inputs}
+        strainpi_stage_reads
+
         BAMPE=""
         BAIPE=""
         BAMSE=""
@@ -59,21 +73,28 @@ rule alignment_bowtie2:
 
             BAMPE={params.pe_bam_dir}/sorted.bam
             BAIPE={params.pe_bam_dir}/sorted.bam.bai
-            STATSPE={params.report_dir}/align_stats.PE.txt
+            STATSPE={params.report_dir}/align_stats.pe.json
+
+            mkfifo $SCRATCH/pe.flagstat
+            samtools flagstat -O json $SCRATCH/pe.flagstat > $STATSPE &
+            FLAGSTAT_PID=$!
 
             bowtie2 \
-            --threads {threads} \
+            --threads {params.aligner_threads} \
             -x {params.index_prefix} \
             -1 $R1 \
             -2 $R2 \
             {params.presets} \
             2> {log} | \
-            tee >(samtools flagstat -@4 - > $STATSPE) | \
+            tee $SCRATCH/pe.flagstat | \
             samtools sort \
-            -m 3G \
-            -@4 \
-            -T {params.pe_bam_dir}/temp \
-            -O BAM -o $BAMPE -
+            -m {params.sort_mem} \
+            -@{params.sort_threads} \
+            -T $SCRATCH/pe.temp \
+            -O BAM -o $SCRATCH/pe.sorted.bam -
+
+            wait $FLAGSTAT_PID
+            strainpi_commit $SCRATCH/pe.sorted.bam $BAMPE
 
             samtools index -@{threads} $BAMPE $BAIPE 2>> {log}
         fi
@@ -84,20 +105,27 @@ rule alignment_bowtie2:
 
             BAMSE={params.se_bam_dir}/sorted.bam
             BAISE={params.se_bam_dir}/sorted.bam.bai
-            STATSSE={params.report_dir}/align_stats.PE.txt
+            STATSSE={params.report_dir}/align_stats.se.json
+
+            mkfifo $SCRATCH/se.flagstat
+            samtools flagstat -O json $SCRATCH/se.flagstat > $STATSSE &
+            FLAGSTAT_PID=$!
 
             bowtie2 \
             {params.presets} \
-            --threads {threads} \
+            --threads {params.aligner_threads} \
             -x {params.index_prefix} \
             -U $RS \
             2> {log} | \
-            tee >(samtools flagstat -@4 - > $STATSSE) | \
+            tee $SCRATCH/se.flagstat | \
             samtools sort \
-            -m 3G \
-            -@4 \
-            -T {params.se_bam_dir}/temp \
-            -O BAM -o $BAMSE -
+            -m {params.sort_mem} \
+            -@{params.sort_threads} \
+            -T $SCRATCH/se.temp \
+            -O BAM -o $SCRATCH/se.sorted.bam -
+
+            wait $FLAGSTAT_PID
+            strainpi_commit $SCRATCH/se.sorted.bam $BAMSE
 
             samtools index -@{threads} $BAMSE $BAISE 2>> {log}
         fi
@@ -114,11 +142,27 @@ rule alignment_bowtie2:
 
 
 if config["params"]["alignment"]["bowtie2"]["do"]:
-    rule alignment_bowtie2_all:
+    rule alignment_bowtie2_report:
         input:
             expand(os.path.join(
                 config["output"]["alignment"], "bam/bowtie2/{sample}/{sample}.json"),
                 sample=SAMPLES_ID_LIST)
+        output:
+            os.path.join(config["output"]["alignment"], "report/alignment_bowtie2_stats.tsv")
+        priority:
+            24
+        threads:
+            config["params"]["qcreport"]["seqkit"]["threads"]
+        run:
+            strainpi.flagstats_summary(input, 2, threads, output=output[0])
+
+
+    rule alignment_bowtie2_all:
+        input:
+            expand(os.path.join(
+                config["output"]["alignment"], "bam/bowtie2/{sample}/{sample}.json"),
+                sample=SAMPLES_ID_LIST),
+            rules.alignment_bowtie2_report.output
 
 else:
     rule alignment_bowtie2_all:
@@ -140,17 +184,27 @@ rule alignment_strobealign:
     benchmark:
         os.path.join(config["output"]["alignment"], "benchmark/strobealign/{sample}.txt")
     params:
+        scratch_sh = os.path.join(WRAPPER_DIR, "scratch.sh"),
+        scratch_dir = config["params"]["scratch"]["dir"],
+        stage_inputs = config["params"]["scratch"]["stage_inputs"],
         pe_bam_dir = os.path.join(config["output"]["alignment"], "bam/strobealign/{sample}/pe"),
         se_bam_dir = os.path.join(config["output"]["alignment"], "bam/strobealign/{sample}/se"),
         report_dir = os.path.join(config["output"]["alignment"], "report/strobealign/{sample}"),
         index_prefix = config["params"]["alignment"]["strobealign"]["index_prefix"],
-        read_length = config["params"]["alignment"]["strobealign"]["read_length"]
+        read_length = config["params"]["alignment"]["strobealign"]["read_length"],
+        aligner_threads = SIZER.aligner_threads("alignment_strobealign"),
+        sort_threads = SIZER.sort_threads,
+        sort_mem = SIZER.sort_mem
     priority:
         24
     conda:
         config["envs"]["strobealign"]
     threads:
         config["params"]["alignment"]["threads"]
+    resources:
+        mem_mb = SIZER.mem_mb,
+        disk_mb = SIZER.disk_mb,
+        runtime = SIZER.runtime
     shell:
         '''
         OUTDIR=$(dirname {output})
@@ -162,6 +216,10 @@ rule alignment_strobealign:
         R2=$(jq -r -M '.PE_REVERSE' {input.reads} | sed 's/^null$//g')
         RS=$(jq -r -M '.SE' {input.reads} | sed 's/^null$//g')
 
+        source {params.scratch_sh}
+        strainpi_scratch_init '{params.scratch_dir}' {params.stage_inputs}
+        strainpi_stage_reads
+
         BAMPE=""
         BAIPE=""
         BAMSE=""
@@ -175,22 +233,29 @@ rule alignment_strobealign:
 
             BAMPE={params.pe_bam_dir}/sorted.bam
             BAIPE={params.pe_bam_dir}/sorted.bam.bai
-            STATSPE={params.report_dir}/align_stats.PE.txt
+            STATSPE={params.report_dir}/align_stats.pe.json
+
+            mkfifo $SCRATCH/pe.flagstat
+            samtools flagstat -O json $SCRATCH/pe.flagstat > $STATSPE &
+            FLAGSTAT_PID=$!
 
             strobealign \
             --use-index \
-            --threads {threads} \
+            --threads {params.aligner_threads} \
             -r {params.read_length} \
             {params.index_prefix} \
             $R1 \
             $R2 \
             2> {log} | \
-            tee >(samtools flagstat -@4 - > $STATSPE) | \
+            tee $SCRATCH/pe.flagstat | \
             samtools sort \
-            -m 3G \
-            -@4 \
-            -T {params.pe_bam_dir}/temp \
-            -O BAM -o $BAMPE -
+            -m {params.sort_mem} \
+            -@{params.sort_threads} \
+            -T $SCRATCH/pe.temp \
+            -O BAM -o $SCRATCH/pe.sorted.bam -
+
+            wait $FLAGSTAT_PID
+            strainpi_commit $SCRATCH/pe.sorted.bam $BAMPE
 
             samtools index -@{threads} $BAMPE $BAIPE 2>> {log}
         fi
@@ -201,21 +266,28 @@ rule alignment_strobealign:
 
             BAMSE={params.se_bam_dir}/sorted.bam
             BAISE={params.se_bam_dir}/sorted.bam.bai
-            STATSSE={params.report_dir}/align_stats.PE.txt
+            STATSSE={params.report_dir}/align_stats.se.json
+
+            mkfifo $SCRATCH/se.flagstat
+            samtools flagstat -O json $SCRATCH/se.flagstat > $STATSSE &
+            FLAGSTAT_PID=$!
 
             strobealign \
             --use-index \
-            --threads {threads} \
+            --threads {params.aligner_threads} \
             -r {params.read_length} \
             {params.index_prefix} \
             $RS \
             2> {log} | \
-            tee >(samtools flagstat -@4 - > $STATSSE) | \
+            tee $SCRATCH/se.flagstat | \
             samtools sort \
-            -m 3G \
-            -@4 \
-            -T {params.se_bam_dir}/temp \
-            -O BAM -o $BAMSE -
+            -m {params.sort_mem} \
+            -@{params.sort_threads} \
+            -T $SCRATCH/se.temp \
+            -O BAM -o $SCRATCH/se.sorted.bam -
+
+            wait $FLAGSTAT_PID
+            strainpi_commit $SCRATCH/se.sorted.bam $BAMSE
 
             samtools index -@{threads} $BAMSE $BAISE 2>> {log}
         fi
@@ -232,11 +304,27 @@ rule alignment_strobealign:
 
 
 if config["params"]["alignment"]["strobealign"]["do"]:
-    rule alignment_strobealign_all:
+    rule alignment_strobealign_report:
         input:
             expand(os.path.join(
                 config["output"]["alignment"], "bam/strobealign/{sample}/{sample}.json"),
                 sample=SAMPLES_ID_LIST)
+        output:
+            os.path.join(config["output"]["alignment"], "report/alignment_strobealign_stats.tsv")
+        priority:
+            24
+        threads:
+            config["params"]["qcreport"]["seqkit"]["threads"]
+        run:
+            strainpi.flagstats_summary(input, 2, threads, output=output[0])
+
+
+    rule alignment_strobealign_all:
+        input:
+            expand(os.path.join(
+                config["output"]["alignment"], "bam/strobealign/{sample}/{sample}.json"),
+                sample=SAMPLES_ID_LIST),
+            rules.alignment_strobealign_report.output
 
 else:
     rule alignment_strobealign_all:
@@ -18,29 +18,54 @@ if config["params"]["qcreport"]["do"]:
             30
         threads:
             config["params"]["qcreport"]["seqkit"]["threads"]
+        params:
+            # the per-sample sources of the merged step tables
+            sources = {step: dict(zip(SAMPLES_ID_LIST, getattr(rules, f"{step}_report_merge").input))
+                       for step in STEPS},
+            store = os.path.join(config["output"]["qcreport"], "store/qc_summary.pkl"),
+            parquet = os.path.join(config["output"]["qcreport"], "qc_stats.parquet") \
+            if config["params"]["qcreport"]["parquet"] else None
         run:
-            df = strainpi.merge(input, strainpi.parse, threads)
-            df = strainpi.compute_host_rate(df, STEPS, SAMPLES_ID_LIST, allow_miss_samples=True, output=output.summary_l)
-            strainpi.qc_summary_merge(df, output=output.summary_w)
+            strainpi.qc_summary_store(
+                params.sources, STEPS, params.store, output.summary_l, output.summary_w,
+                threads, allow_miss_samples=True, output_parquet=params.parquet)
 
 
+    QCREPORT_PLOT = config["params"]["qcreport"]["plot"]
+    QCREPORT_PLOT_PAGES = len(SAMPLES_ID_LIST) > QCREPORT_PLOT["max_samples"]
+
     rule qcreport_plot:
         input:
             rules.qcreport_summary.output
         output:
-            os.path.join(config["output"]["qcreport"], "qc_reads_num_barplot.pdf")
+            barplot = directory(os.path.join(config["output"]["qcreport"], "qc_reads_num_barplot")) \
+                if QCREPORT_PLOT_PAGES else \
+                os.path.join(config["output"]["qcreport"], f"qc_reads_num_barplot.{QCREPORT_PLOT['format']}"),
+            distribution = os.path.join(config["output"]["qcreport"], f"qc_reads_num_violin.{QCREPORT_PLOT['format']}")
         priority:
             30
+        threads:
+            config["params"]["qcreport"]["seqkit"]["threads"]
         run:
             df = strainpi.parse(input[0])
-            strainpi.qc_bar_plot(df, "seaborn", output=output[0])
+            if QCREPORT_PLOT_PAGES:
+                strainpi.qc_bar_pages(
+                    df, output.barplot,
+                    chunk_size=QCREPORT_PLOT["chunk_size"],
+                    fmt=QCREPORT_PLOT["format"],
+                    dpi=QCREPORT_PLOT["dpi"],
+                    rasterized=QCREPORT_PLOT["rasterized"],
+                    workers=threads)
+            else:
+                strainpi.qc_bar_plot(df, "seaborn", output=output.barplot)
+            strainpi.qc_dist_plot(df, output.distribution, dpi=QCREPORT_PLOT["dpi"])
 
 
     rule qcreport_all:
         input:
             os.path.join(config["output"]["qcreport"], "qc_stats_l.tsv"),
             os.path.join(config["output"]["qcreport"], "qc_stats_w.tsv"),
-            os.path.join(config["output"]["qcreport"], "qc_reads_num_barplot.pdf")
+            rules.qcreport_plot.output
 
 else:
     rule qcreport_summary:
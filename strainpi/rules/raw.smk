@@ -11,7 +11,13 @@ rule raw_prepare_reads:
         sample_id = "{sample}",
         input_files = lambda wildcards: strainpi.get_raw_input_dict(wildcards, SAMPLES, DATA_TYPE),
         headers = strainpi.HEADERS,
-        check_paired = config["params"]["raw"]["check_paired"]
+        check_paired = config["params"]["raw"]["check_paired"],
+        resync_buffer = config["params"]["raw"]["resync_buffer"],
+        sra_stream = config["params"]["raw"]["sra_stream"],
+        virtual_input = config["params"]["raw"]["virtual_input"],
+        scratch_dir = config["params"]["scratch"]["dir"],
+        inline_stats = config["params"]["qcreport"]["inline_stats"],
+        fq_encoding = config["params"]["fq_encoding"]
     threads:
         config["params"]["raw"]["threads"]
     conda:
@@ -35,6 +41,8 @@ rule raw_fastqc:
         os.path.join(config["output"]["raw"], "logs/raw_fastqc/{sample}.log")
     benchmark:
         os.path.join(config["output"]["raw"], "benchmark/raw_fastqc/{sample}.txt")
+    params:
+        reads_sh = os.path.join(WRAPPER_DIR, "reads.sh")
     threads:
         config["params"]["raw"]["threads"]
     conda:
@@ -43,9 +51,8 @@ rule raw_fastqc:
         '''
         mkdir -p {output}
 
-        R1=$(jq -r -M '.PE_FORWARD' {input} | sed 's/^null$//g')
-        R2=$(jq -r -M '.PE_REVERSE' {input} | sed 's/^null$//g')
-        RS=$(jq -r -M '.SE' {input} | sed 's/^null$//g')
+        source {params.reads_sh}
+        strainpi_reads {input}
 
         fastqc \
         --outdir {output} \
@@ -53,6 +60,8 @@ rule raw_fastqc:
         --format fastq \
         $R1 $R2 $RS \
         >{log} 2>&1
+
+        strainpi_reads_wait
         '''
 
 
@@ -107,27 +116,35 @@ rule raw_report:
     benchmark:
         os.path.join(config["output"]["raw"], "benchmark/raw_report/{sample}.txt")
     params:
-        fq_encoding = config["params"]["fq_encoding"]
+        reads_sh = os.path.join(WRAPPER_DIR, "reads.sh"),
+        fq_encoding = config["params"]["fq_encoding"],
+        inline_stats = config["params"]["qcreport"]["inline_stats"]
     threads:
         config["params"]["qcreport"]["seqkit"]["threads"]
     conda:
         config["envs"]["report"]
     shell:
         '''
-        R1=$(jq -r -M '.PE_FORWARD' {input} | sed 's/^null$//g')
-        R2=$(jq -r -M '.PE_REVERSE' {input} | sed 's/^null$//g')
-        RS=$(jq -r -M '.SE' {input} | sed 's/^null$//g')
-        RL=$(jq -r -M '.LONG' {input} | sed 's/^null$//g')
-
-        seqkit stats \
-        --all \
-        --basename \
-        --tabular \
-        --fq-encoding {params.fq_encoding} \
-        --out-file {output} \
-        --threads {threads} \
-        $R1 $R2 $RS $RL \
-        >{log} 2>&1
+        # counted by raw_prepare_reads while the reads were written
+        STATS=$(jq -r -M '.SEQ_STATS // empty' {input})
+        if [ "{params.inline_stats}" == "True" ] && [ "$STATS" != "" ] && [ -s "$STATS" ]; then
+            cp $STATS {output}
+        else
+            source {params.reads_sh}
+            strainpi_reads {input} stream PE_FORWARD PE_REVERSE SE LONG
+
+            seqkit stats \
+            --all \
+            --basename \
+            --tabular \
+            --fq-encoding {params.fq_encoding} \
+            --out-file {output} \
+            --threads {threads} \
+            $R1 $R2 $RS $RL \
+            >{log} 2>&1
+
+            strainpi_reads_wait
+        fi
         '''
 
 
@@ -143,14 +160,14 @@ rule raw_report_merge:
         os.path.join(config["output"]["raw"], "benchmark/raw_report_merge/raw_report_merge.txt")
     threads:
         config["params"]["qcreport"]["seqkit"]["threads"]
-    shell:
-        '''
-        head -1 {input[0]} > {output}
-        for report in {input}
-        do
-            tail -q -n +2 $report >> {output} 2>>{log}
-        done
-        '''
+    params:
+        store = os.path.join(config["output"]["qcreport"], "store/raw_stats.pkl"),
+        parquet = os.path.join(config["output"]["qcreport"], "raw_stats.parquet") \
+        if config["params"]["qcreport"]["parquet"] else None
+    run:
+        parsed = strainpi.merge_stats_store(input, params.store, output[0], threads, params.parquet)
+        with open(log[0], "a") as oh:
+            oh.write(f"{parsed} of {len(input)} stats files are new or changed\n")
 
 
 if config["params"]["qcreport"]["do"]:
@@ -173,5 +190,6 @@ rule raw_all:
 localrules:
     raw_prepare_reads_all,
     raw_fastqc_all,
+    raw_report_merge,
     raw_report_all,
     raw_all
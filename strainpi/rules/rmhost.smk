@@ -26,6 +26,9 @@ if config["params"]["rmhost"]["bwa"]["do"]:
             bwa = "bwa-mem2" if config["params"]["rmhost"]["bwa"]["algorithms"] == "mem2" else "bwa"
         priority:
             20
+        resources:
+            mem_mb = SIZER.mem_mb,
+            runtime = SIZER.runtime
         conda:
             config["envs"]["bwa"]
         shell:
@@ -48,20 +51,34 @@ if config["params"]["rmhost"]["bwa"]["do"]:
         benchmark:
             os.path.join(config["output"]["rmhost"], "benchmark/rmhost_bwa/{sample}.txt")
         params:
+            scratch_sh = os.path.join(WRAPPER_DIR, "scratch.sh"),
+            scratch_dir = config["params"]["scratch"]["dir"],
+            stage_inputs = config["params"]["scratch"]["stage_inputs"],
+            reads_sh = os.path.join(WRAPPER_DIR, "reads.sh"),
             pe_prefix = os.path.join(config["output"]["rmhost"], "reads/{sample}/pe/{sample}"),
             se_prefix = os.path.join(config["output"]["rmhost"], "reads/{sample}/se/{sample}"),
             report_dir = os.path.join(config["output"]["rmhost"], "report/flagstat/{sample}"),
             compression = config["params"]["rmhost"]["compression"],
+            seqstats = os.path.join(WRAPPER_DIR, "seqstats.py"),
+            inline_stats = config["params"]["qcreport"]["inline_stats"],
+            fq_encoding = config["params"]["fq_encoding"],
             bwa = "bwa-mem2" if config["params"]["rmhost"]["bwa"]["algorithms"] == "mem2" else "bwa",
             minimum_seed_length = config["params"]["rmhost"]["bwa"]["minimum_seed_length"],
             index_prefix = config["params"]["rmhost"]["bwa"]["index_prefix"],
             pe_bam_dir = os.path.join(config["output"]["rmhost"], "bam/{sample}/pe"),
             se_bam_dir = os.path.join(config["output"]["rmhost"], "bam/{sample}/se"),
-            save_bam = "yes" if config["params"]["rmhost"]["save_bam"] else "no"
+            save_bam = "yes" if config["params"]["rmhost"]["save_bam"] else "no",
+            aligner_threads = SIZER.aligner_threads("rmhost_bwa"),
+            sort_threads = SIZER.sort_threads,
+            sort_mem = SIZER.sort_mem
         priority:
             20
         threads:
             config["params"]["rmhost"]["threads"]
+        resources:
+            mem_mb = SIZER.mem_mb,
+            disk_mb = SIZER.disk_mb,
+            runtime = SIZER.runtime
         conda:
             config["envs"]["bwa"]
         shell:
@@ -73,21 +90,29 @@ if config["params"]["rmhost"]["bwa"]["do"]:
             rm -rf $OUTDIR $OUTPE $OUTSE
             mkdir -p $OUTDIR {params.report_dir}
 
-            R1=$(jq -r -M '.PE_FORWARD' {input.reads} | sed 's/^null$//g')
-            R2=$(jq -r -M '.PE_REVERSE' {input.reads} | sed 's/^null$//g')
-            RS=$(jq -r -M '.SE' {input.reads} | sed 's/^null$//g')
+            source {params.reads_sh}
+            strainpi_reads {input.reads} lockstep
+
+            source {params.scratch_sh}
+            strainpi_scratch_init '{params.scratch_dir}' {params.stage_inputs}
+            strainpi_stage_reads
 
             FQ1=""
             FQ2=""
             FQS=""
             STATSPE=""
             STATSSE=""
+            SEQSTATS=""
+            if [ "{params.inline_stats}" == "True" ];
+            then
+                SEQSTATS=$OUTDIR/{wildcards.sample}.rmhost.seq_stats.tsv
+            fi
 
             if [ "$R1" != "" ];
             then
                 FQ1={params.pe_prefix}.rmhost.pe.1.fq.gz
                 FQ2={params.pe_prefix}.rmhost.pe.2.fq.gz
-                STATSPE={params.report_dir}/rmhost.pe.align_stats.txt
+                STATSPE={params.report_dir}/rmhost.pe.align_stats.json
 
                 mkdir -p $OUTPE
                 rm -rf {params.pe_bam_dir}
@@ -97,45 +122,64 @@ if config["params"]["rmhost"]["bwa"]["do"]:
 
                 if [ "{params.save_bam}" == "yes" ];
                 then
+                    mkfifo $SCRATCH/pe.flagstat $SCRATCH/pe.fastq
+                    samtools flagstat \
+                        -O json $SCRATCH/pe.flagstat > $STATSPE &
+                    FLAGSTAT_PID=$!
+                    samtools fastq \
+                        -N -f 12 -F 256 $SCRATCH/pe.fastq | \
+                        python {params.seqstats} stream \
+                        --out $FQ1 $FQ2 \
+                        --stats "$SEQSTATS" \
+                        --threads {threads} \
+                        --level {params.compression} \
+                        --fq-encoding {params.fq_encoding} &
+                    FASTQ_PID=$!
+
                     {params.bwa} mem \
                     -k {params.minimum_seed_length} \
-                    -t {threads} \
+                    -t {params.aligner_threads} \
                     {params.index_prefix} \
                     $R1 $R2 2> {log} | \
-                    tee >(samtools flagstat \
-                        -@4 - > $STATSPE) | \
-                    tee >(samtools fastq \
-                        -@4 \
-                        -c {params.compression} \
-                        -N -f 12 -F 256 \
-                        -1 $FQ1 \
-                        -2 $FQ2 -) | \
+                    tee $SCRATCH/pe.flagstat $SCRATCH/pe.fastq | \
                     samtools sort \
-                    -m 3G \
-                    -@4 \
-                    -T {params.pe_bam_dir}/temp \
-                    -O BAM -o $BAM -
+                    -m {params.sort_mem} \
+                    -@{params.sort_threads} \
+                    -T $SCRATCH/pe.temp \
+                    -O BAM -o $SCRATCH/pe.sorted.bam -
+
+                    wait $FLAGSTAT_PID
+                    wait $FASTQ_PID
+                    strainpi_commit $SCRATCH/pe.sorted.bam $BAM
                 else
+                    mkfifo $SCRATCH/pe.flagstat
+                    samtools flagstat \
+                        -O json $SCRATCH/pe.flagstat > $STATSPE &
+                    FLAGSTAT_PID=$!
+
                     {params.bwa} mem \
                     -k {params.minimum_seed_length} \
-                    -t {threads} \
+                    -t {params.aligner_threads} \
                     {params.index_prefix} \
                     $R1 $R2 2> {log} | \
-                    tee >(samtools flagstat \
-                        -@4 - > $STATSPE) | \
+                    tee $SCRATCH/pe.flagstat | \
                     samtools fastq \
-                    -@4 \
-                    -c {params.compression} \
-                    -N -f 12 -F 256 \
-                    -1 $FQ1 \
-                    -2 $FQ2 -
+                    -N -f 12 -F 256 - | \
+                    python {params.seqstats} stream \
+                    --out $FQ1 $FQ2 \
+                    --stats "$SEQSTATS" \
+                    --threads {threads} \
+                    --level {params.compression} \
+                    --fq-encoding {params.fq_encoding}
+
+                    wait $FLAGSTAT_PID
                 fi
             fi
 
             if [ "$RS" != "" ];
             then
                 FQS={params.se_prefix}.rmhost.se.fq.gz
-                STATSSE={params.report_dir}/rmhost.se.align_stats.txt
+                STATSSE={params.report_dir}/rmhost.se.align_stats.json
 
                 mkdir -p $OUTSE
                 rm -rf {params.se_bam_dir}
@@ -145,47 +189,69 @@ if config["params"]["rmhost"]["bwa"]["do"]:
 
                 if [ "{params.save_bam}" == "yes" ];
                 then
+                    mkfifo $SCRATCH/se.flagstat $SCRATCH/se.fastq
+                    samtools flagstat \
+                        -O json $SCRATCH/se.flagstat > $STATSSE &
+                    FLAGSTAT_PID=$!
+                    samtools fastq \
+                        -N -f 4 -F 256 $SCRATCH/se.fastq | \
+                        python {params.seqstats} stream \
+                        --out $FQS \
+                        --stats "$SEQSTATS" \
+                        --threads {threads} \
+                        --level {params.compression} \
+                        --fq-encoding {params.fq_encoding} &
+                    FASTQ_PID=$!
+
                     {params.bwa} mem \
                     -k {params.minimum_seed_length} \
-                    -t {threads} \
+                    -t {params.aligner_threads} \
                     {params.index_prefix} \
                     $RS 2>> {log} | \
-                    tee >(samtools flagstat \
-                        -@4 - > $STATSSE) | \
-                    tee >(samtools fastq \
-                        -@4 \
-                        -c {params.compression} \
-                        -N -f 4 -F 256 - | \
-                        pigz -cf -p {threads} \
-                        > $FQS) | \
+                    tee $SCRATCH/se.flagstat $SCRATCH/se.fastq | \
                     samtools sort \
-                    -m 3G \
-                    -@4 \
-                    -T {params.se_bam_dir}/temp \
-                    -O BAM -o $BAM -
+                    -m {params.sort_mem} \
+                    -@{params.sort_threads} \
+                    -T $SCRATCH/se.temp \
+                    -O BAM -o $SCRATCH/se.sorted.bam -
+
+                    wait $FLAGSTAT_PID
+                    wait $FASTQ_PID
+                    strainpi_commit $SCRATCH/se.sorted.bam $BAM
                 else
+                    mkfifo $SCRATCH/se.flagstat
+                    samtools flagstat \
+                        -O json $SCRATCH/se.flagstat > $STATSSE &
+                    FLAGSTAT_PID=$!
+
                     {params.bwa} mem \
                     -k {params.minimum_seed_length} \
-                    -t {threads} \
+                    -t {params.aligner_threads} \
                     {params.index_prefix} \
                     $RS 2>> {log} | \
-                    tee >(samtools flagstat \
-                        -@4 - > $STATSSE) | \
+                    tee $SCRATCH/se.flagstat | \
                     samtools fastq \
-                    -@4 \
-                    -c {params.compression} \
                     -N -f 4 -F 256 - | \
-                    pigz -cf -p {threads} \
-                    > $FQS
+                    python {params.seqstats} stream \
+                    --out $FQS \
+                    --stats "$SEQSTATS" \
+                    --threads {threads} \
+                    --level {params.compression} \
+                    --fq-encoding {params.fq_encoding}
+
+                    wait $FLAGSTAT_PID
                 fi
             fi
 
+            strainpi_reads_wait
+
             echo "{{ \
             \\"PE_FORWARD\\": \\"$FQ1\\", \
             \\"PE_REVERSE\\": \\"$FQ2\\", \
             \\"SE\\": \\"$FQS\\", \
             \\"PE_ALIGN_STATS\\": \\"$STATSPE\\", \
-            \\"SE_ALIGN_STATS\\": \\"$STATSSE\\" }}" | \
+            \\"SE_ALIGN_STATS\\": \\"$STATSSE\\", \
+            \\"SEQ_STATS\\": \\"$SEQSTATS\\" }}" | \
             jq . > {output}
             '''
 
@@ -213,13 +279,16 @@ if config["params"]["rmhost"]["bowtie2"]["do"]:
         log:
             os.path.join(config["output"]["rmhost"], "logs/rmhost_bowtie2_index/rmhost_bowtie2_index.log")
         benchmark:
-            os.path.join(config["output"]["rmhost"], "benchmark/rmhost_bwotie2_index/rmhost_bowtie2_index.txt")
+            os.path.join(config["output"]["rmhost"], "benchmark/rmhost_bowtie2_index/rmhost_bowtie2_index.txt")
         params:
             index_prefix = config["params"]["rmhost"]["bowtie2"]["index_prefix"]
         priority:
             20
         threads:
             config["params"]["rmhost"]["threads"]
+        resources:
+            mem_mb = SIZER.mem_mb,
+            runtime = SIZER.runtime
         conda:
             config["envs"]["bowtie2"]
         shell:
@@ -242,19 +311,33 @@ if config["params"]["rmhost"]["bowtie2"]["do"]:
         benchmark:
             os.path.join(config["output"]["rmhost"], "benchmark/rmhost_bowtie2/{sample}.txt")
         params:
+            scratch_sh = os.path.join(WRAPPER_DIR, "scratch.sh"),
+            scratch_dir = config["params"]["scratch"]["dir"],
+            stage_inputs = config["params"]["scratch"]["stage_inputs"],
+            reads_sh = os.path.join(WRAPPER_DIR, "reads.sh"),
             pe_prefix = os.path.join(config["output"]["rmhost"], "reads/{sample}/pe/{sample}"),
             se_prefix = os.path.join(config["output"]["rmhost"], "reads/{sample}/se/{sample}"),
             report_dir = os.path.join(config["output"]["rmhost"], "report/flagstat/{sample}"),
             presets = config["params"]["rmhost"]["bowtie2"]["presets"],
             compression = config["params"]["rmhost"]["compression"],
+            seqstats = os.path.join(WRAPPER_DIR, "seqstats.py"),
+            inline_stats = config["params"]["qcreport"]["inline_stats"],
+            fq_encoding = config["params"]["fq_encoding"],
             index_prefix = config["params"]["rmhost"]["bowtie2"]["index_prefix"],
             pe_bam_dir = os.path.join(config["output"]["rmhost"], "bam/{sample}/pe"),
             se_bam_dir = os.path.join(config["output"]["rmhost"], "bam/{sample}/se"),
-            save_bam = "yes" if config["params"]["rmhost"]["save_bam"] else "no"
+            save_bam = "yes" if config["params"]["rmhost"]["save_bam"] else "no",
+            aligner_threads = SIZER.aligner_threads("rmhost_bowtie2"),
+            sort_threads = SIZER.sort_threads,
+            sort_mem = SIZER.sort_mem
         priority:
             20
         threads:
             config["params"]["rmhost"]["threads"]
+        resources:
+            mem_mb = SIZER.mem_mb,
+            disk_mb = SIZER.disk_mb,
+            runtime = SIZER.runtime
         conda:
             config["envs"]["bowtie2"]
         shell:
@@ -266,21 +349,29 @@ if config["params"]["rmhost"]["bowtie2"]["do"]:
             rm -rf $OUTDIR $OUTPE $OUTSE
             mkdir -p $OUTDIR {params.report_dir}
 
-            R1=$(jq -r -M '.PE_FORWARD' {input.reads} | sed 's/^null$//g')
-            R2=$(jq -r -M '.PE_REVERSE' {input.reads} | sed 's/^null$//g')
-            RS=$(jq -r -M '.SE' {input.reads} | sed 's/^null$//g')
+            source {params.reads_sh}
+            strainpi_reads {input.reads} lockstep
+
+            source {params.scratch_sh}
+            strainpi_scratch_init '{params.scratch_dir}' {params.stage_inputs}
+            strainpi_stage_reads
 
             FQ1=""
             FQ2=""
             FQS=""
             STATSPE=""
             STATSSE=""
+            SEQSTATS=""
+            if [ "{params.inline_stats}" == "True" ];
+            then
+                SEQSTATS=$OUTDIR/{wildcards.sample}.rmhost.seq_stats.tsv
+            fi
 
             if [ "$R1" != "" ];
             then
                 FQ1={params.pe_prefix}.rmhost.pe.1.fq.gz
                 FQ2={params.pe_prefix}.rmhost.pe.2.fq.gz
-                STATSPE={params.report_dir}/rmhost.pe.align_stats.txt
+                STATSPE={params.report_dir}/rmhost.pe.align_stats.json
 
                 mkdir -p $OUTPE
                 rm -rf {params.pe_bam_dir}
@@ -290,49 +381,68 @@ if config["params"]["rmhost"]["bowtie2"]["do"]:
 
                 if [ "{params.save_bam}" == "yes" ];
                 then
+                    mkfifo $SCRATCH/pe.flagstat $SCRATCH/pe.fastq
+                    samtools flagstat \
+                        -O json $SCRATCH/pe.flagstat > $STATSPE &
+                    FLAGSTAT_PID=$!
+                    samtools fastq \
+                        -N -f 12 -F 256 $SCRATCH/pe.fastq | \
+                        python {params.seqstats} stream \
+                        --out $FQ1 $FQ2 \
+                        --stats "$SEQSTATS" \
+                        --threads {threads} \
+                        --level {params.compression} \
+                        --fq-encoding {params.fq_encoding} &
+                    FASTQ_PID=$!
+
                     bowtie2 \
-                    --threads {threads} \
+                    --threads {params.aligner_threads} \
                     -x {params.index_prefix} \
                     -1 $R1 \
                     -2 $R2 \
                     {params.presets} \
                     2> {log} | \
-                    tee >(samtools flagstat \
-                        -@4 - $STATSPE) | \
-                    tee >(samtools fastq \
-                        -@4 \
-                        -c {params.compression} \
-                        -N -f 12 -F 256 \
-                        -1 $FQ1 \
-                        -2 $FQ2 -) | \
+                    tee $SCRATCH/pe.flagstat $SCRATCH/pe.fastq | \
                     samtools sort \
-                    -m 3G \
-                    -@4 \
-                    -T {params.pe_bam_dir}/temp \
-                    -O BAM -o $BAM -
+                    -m {params.sort_mem} \
+                    -@{params.sort_threads} \
+                    -T $SCRATCH/pe.temp \
+                    -O BAM -o $SCRATCH/pe.sorted.bam -
+
+                    wait $FLAGSTAT_PID
+                    wait $FASTQ_PID
+                    strainpi_commit $SCRATCH/pe.sorted.bam $BAM
                 else
+                    mkfifo $SCRATCH/pe.flagstat
+                    samtools flagstat \
+                        -O json $SCRATCH/pe.flagstat > $STATSPE &
+                    FLAGSTAT_PID=$!
+
                     bowtie2 \
-                    --threads {threads} \
+                    --threads {params.aligner_threads} \
                     -x {params.index_prefix} \
                     -1 $R1 \
                     -2 $R2 \
                     {params.presets} \
                     2> {log} | \
-                    tee >(samtools flagstat \
-                        -@4 - > $STATSPE) | \
+                    tee $SCRATCH/pe.flagstat | \
                     samtools fastq \
-                    -@4 \
-                    -c {params.compression} \
-                    -N -f 12 -F 256 \
-                    -1 $FQ1 \
-                    -2 $FQ2 -
+                    -N -f 12 -F 256 - | \
+                    python {params.seqstats} stream \
+                    --out $FQ1 $FQ2 \
+                    --stats "$SEQSTATS" \
+                    --threads {threads} \
+                    --level {params.compression} \
+                    --fq-encoding {params.fq_encoding}
+
+                    wait $FLAGSTAT_PID
                 fi
             fi
 
             if [ "$RS" != "" ];
             then
                 FQS={params.se_prefix}.rmhost.se.fq.gz
-                STATSSE={params.report_dir}/rmhost.se.align_stats.txt
+                STATSSE={params.report_dir}/rmhost.se.align_stats.json
 
                 mkdir -p $OUTSE
                 rm -rf {params.se_bam_dir}
@@ -342,49 +452,71 @@ if config["params"]["rmhost"]["bowtie2"]["do"]:
 
                 if [ "{params.save_bam}" == "yes" ];
                 then
+                    mkfifo $SCRATCH/se.flagstat $SCRATCH/se.fastq
+                    samtools flagstat \
+                        -O json $SCRATCH/se.flagstat > $STATSSE &
+                    FLAGSTAT_PID=$!
+                    samtools fastq \
+                        -N -f 4 -F 256 $SCRATCH/se.fastq | \
+                        python {params.seqstats} stream \
+                        --out $FQS \
+                        --stats "$SEQSTATS" \
+                        --threads {threads} \
+                        --level {params.compression} \
+                        --fq-encoding {params.fq_encoding} &
+                    FASTQ_PID=$!
+
                     bowtie2 \
                     {params.presets} \
-                    --threads {threads} \
+                    --threads {params.aligner_threads} \
                     -x {params.index_prefix} \
                     -U $RS \
                     2> {log} | \
-                    tee >(samtools flagstat \
-                        -@4 - > $STATSSE) | \
-                    tee >(samtools fastq \
-                        -@4 \
-                        -c {params.compression} \
-                        -N -f 4 -F 256 - | \
-                        pigz -cf -p {threads} \
-                        > $FQS) | \
+                    tee $SCRATCH/se.flagstat $SCRATCH/se.fastq | \
                     samtools sort \
-                    -m 3G \
-                    -@4 \
-                    -T {params.se_bam_dir}/temp \
-                    -O BAM -o $BAM -
+                    -m {params.sort_mem} \
+                    -@{params.sort_threads} \
+                    -T $SCRATCH/se.temp \
+                    -O BAM -o $SCRATCH/se.sorted.bam -
+
+                    wait $FLAGSTAT_PID
+                    wait $FASTQ_PID
+                    strainpi_commit $SCRATCH/se.sorted.bam $BAM
                 else
+                    mkfifo $SCRATCH/se.flagstat
+                    samtools flagstat \
+                        -O json $SCRATCH/se.flagstat > $STATSSE &
+                    FLAGSTAT_PID=$!
+
                     bowtie2 \
                     {params.presets} \
-                    --threads {threads} \
+                    --threads {params.aligner_threads} \
                     -x {params.index_prefix} \
                     -U $RS \
                     2> {log} | \
-                    tee >(samtools flagstat \
-                        -@4 - > $STATSSE) | \
+                    tee $SCRATCH/se.flagstat | \
                     samtools fastq \
-                    -@4 \
-                    -c {params.compression} \
                     -N -f 4 -F 256 - | \
-                    pigz -cf -p {threads} \
-                    > $FQS
+                    python {params.seqstats} stream \
+                    --out $FQS \
+                    --stats "$SEQSTATS" \
+                    --threads {threads} \
+                    --level {params.compression} \
+                    --fq-encoding {params.fq_encoding}
+
+                    wait $FLAGSTAT_PID
                 fi
             fi
 
+            strainpi_reads_wait
+
             echo "{{ \
             \\"PE_FORWARD\\": \\"$FQ1\\", \
             \\"PE_REVERSE\\": \\"$FQ2\\", \
             \\"SE\\": \\"$FQS\\", \
             \\"PE_ALIGN_STATS\\": \\"$STATSPE\\", \
-            \\"SE_ALIGN_STATS\\": \\"$STATSSE\\" }}" | \
+            \\"SE_ALIGN_STATS\\": \\"$STATSSE\\", \
+            \\"SEQ_STATS\\": \\"$SEQSTATS\\" }}" | \
             jq . > {output}
             '''
 
@@ -416,11 +548,14 @@ if config["params"]["rmhost"]["minimap2"]["do"]:
             20
         threads:
             config["params"]["rmhost"]["threads"]
+        resources:
+            mem_mb = SIZER.mem_mb,
+            runtime = SIZER.runtime
         conda:
             config["envs"]["minimap2"]
         shell:
             '''
-            minimap2 -t {threads} -I {params.split_size} -d {output} {intput} >{log} 2>&1
+            minimap2 -t {threads} -I {params.split_size} -d {output} {input} >{log} 2>&1
             '''
 
 
@@ -435,18 +570,32 @@ if config["params"]["rmhost"]["minimap2"]["do"]:
         benchmark:
             os.path.join(config["output"]["rmhost"], "benchmark/rmhost_minimap2/{sample}.txt")
         params:
+            scratch_sh = os.path.join(WRAPPER_DIR, "scratch.sh"),
+            scratch_dir = config["params"]["scratch"]["dir"],
+            stage_inputs = config["params"]["scratch"]["stage_inputs"],
+            reads_sh = os.path.join(WRAPPER_DIR, "reads.sh"),
             pe_prefix = os.path.join(config["output"]["rmhost"], "reads/{sample}/pe/{sample}"),
             se_prefix = os.path.join(config["output"]["rmhost"], "reads/{sample}/se/{sample}"),
             report_dir = os.path.join(config["output"]["rmhost"], "report/flagstat/{sample}"),
             preset = config["params"]["rmhost"]["minimap2"]["preset"],
             compression = config["params"]["rmhost"]["compression"],
+            seqstats = os.path.join(WRAPPER_DIR, "seqstats.py"),
+            inline_stats = config["params"]["qcreport"]["inline_stats"],
+            fq_encoding = config["params"]["fq_encoding"],
             pe_bam_dir = os.path.join(config["output"]["rmhost"], "bam/{sample}/pe"),
             se_bam_dir = os.path.join(config["output"]["rmhost"], "bam/{sample}/se"),
-            save_bam = "yes" if config["params"]["rmhost"]["save_bam"] else "no"
+            save_bam = "yes" if config["params"]["rmhost"]["save_bam"] else "no",
+            aligner_threads = SIZER.aligner_threads("rmhost_minimap2"),
+            sort_threads = SIZER.sort_threads,
+            sort_mem = SIZER.sort_mem
         priority:
             20
         threads:
             config["params"]["rmhost"]["threads"]
+        resources:
+            mem_mb = SIZER.mem_mb,
+            disk_mb = SIZER.disk_mb,
+            runtime = SIZER.runtime
         conda:
             config["envs"]["align"]
         shell:
@@ -458,21 +607,29 @@ if config["params"]["rmhost"]["minimap2"]["do"]:
             rm -rf $OUTDIR $OUTPE $OUTSE
             mkdir -p $OUTDIR {params.report_dir}
 
-            R1=$(jq -r -M '.PE_FORWARD' {input.reads} | sed 's/^null$//g')
-            R2=$(jq -r -M '.PE_REVERSE' {input.reads} | sed 's/^null$//g')
-            RS=$(jq -r -M '.SE' {input.reads} | sed 's/^null$//g')
+            source {params.reads_sh}
+            strainpi_reads {input.reads} lockstep
+
+            source {params.scratch_sh}
+            strainpi_scratch_init '{params.scratch_dir}' {params.stage_inputs}
+            strainpi_stage_reads
 
             FQ1=""
             FQ2=""
             FQS=""
             STATSPE=""
             STATSSE=""
+            SEQSTATS=""
+            if [ "{params.inline_stats}" == "True" ];
+            then
+                SEQSTATS=$OUTDIR/{wildcards.sample}.rmhost.seq_stats.tsv
+            fi
 
             if [ "$R1" != "" ];
             then
                 FQ1={params.pe_prefix}.rmhost.pe.1.fq.gz
                 FQ2={params.pe_prefix}.rmhost.pe.2.fq.gz
-                STATSPE={params.report_dir}/rmhost.pe.align_stats.txt
+                STATSPE={params.report_dir}/rmhost.pe.align_stats.json
 
                 mkdir -p $OUTPE
                 rm -rf {params.pe_bam_dir}
@@ -482,45 +639,64 @@ if config["params"]["rmhost"]["minimap2"]["do"]:
 
                 if [ "{params.save_bam}" == "yes" ];
                 then
+                    mkfifo $SCRATCH/pe.flagstat $SCRATCH/pe.fastq
+                    samtools flagstat \
+                        -O json $SCRATCH/pe.flagstat > $STATSPE &
+                    FLAGSTAT_PID=$!
+                    samtools fastq \
+                        -N -f 12 -F 256 $SCRATCH/pe.fastq | \
+                        python {params.seqstats} stream \
+                        --out $FQ1 $FQ2 \
+                        --stats "$SEQSTATS" \
+                        --threads {threads} \
+                        --level {params.compression} \
+                        --fq-encoding {params.fq_encoding} &
+                    FASTQ_PID=$!
+
                     minimap2 \
-                    -t {threads} \
+                    -t {params.aligner_threads} \
                     -ax {params.preset} \
                     {input.index} \
                     $R1 $R2 2> {log} | \
-                    tee >(samtools flagstat \
-                        -@4 - > $STATSPE) | \
-                    tee >(samtools fastq \
-                        -@4 \
-                        -c {params.compression} \
-                        -N -f 12 -F 256 \
-                        -1 $FQ1 \
-                        -2 $FQ2 -) | \
+                    tee $SCRATCH/pe.flagstat $SCRATCH/pe.fastq | \
                     samtools sort \
-                    -m 3G \
-                    -@4 \
-                    -T {params.pe_bam_dir}/temp \
-                    -O BAM -o $BAM -
+                    -m {params.sort_mem} \
+                    -@{params.sort_threads} \
+                    -T $SCRATCH/pe.temp \
+                    -O BAM -o $SCRATCH/pe.sorted.bam -
+
+                    wait $FLAGSTAT_PID
+                    wait $FASTQ_PID
+                    strainpi_commit $SCRATCH/pe.sorted.bam $BAM
                 else
+                    mkfifo $SCRATCH/pe.flagstat
+                    samtools flagstat \
+                        -O json $SCRATCH/pe.flagstat > $STATSPE &
+                    FLAGSTAT_PID=$!
+
                     minimap2 \
-                    -t {threads} \
+                    -t {params.aligner_threads} \
                     -ax {params.preset} \
                     {input.index} \
                     $R1 $R2 2> {log} | \
-                    tee >(samtools flagstat \
-                        -@4 - > $STATSPE) | \
+                    tee $SCRATCH/pe.flagstat | \
                     samtools fastq \
-                    -@4 \
-                    -c {params.compression} \
-                    -N -f 12 -F 256 \
-                    -1 $FQ1 \
-                    -2 $FQ2 -
+                    -N -f 12 -F 256 - | \
+                    python {params.seqstats} stream \
+                    --out $FQ1 $FQ2 \
+                    --stats "$SEQSTATS" \
+                    --threads {threads} \
+                    --level {params.compression} \
+                    --fq-encoding {params.fq_encoding}
+
+                    wait $FLAGSTAT_PID
                 fi
             fi
 
             if [ "$RS" != "" ];
             then
                 FQS={params.se_prefix}.rmhost.se.fq.gz
-                STATSSE={params.report_dir}/rmhost.se.align_stats.txt
+                STATSSE={params.report_dir}/rmhost.se.align_stats.json
 
                 mkdir -p $OUTSE
                 rm -rf {params.se_bam_dir}
@@ -530,45 +706,67 @@ if config["params"]["rmhost"]["minimap2"]["do"]:
 
                 if [ "{params.save_bam}" == "yes" ];
                 then
+                    mkfifo $SCRATCH/se.flagstat $SCRATCH/se.fastq
+                    samtools flagstat \
+                        -O json $SCRATCH/se.flagstat > $STATSSE &
+                    FLAGSTAT_PID=$!
+                    samtools fastq \
+                        -N -f 4 -F 256 $SCRATCH/se.fastq | \
+                        python {params.seqstats} stream \
+                        --out $FQS \
+                        --stats "$SEQSTATS" \
+                        --threads {threads} \
+                        --level {params.compression} \
+                        --fq-encoding {params.fq_encoding} &
+                    FASTQ_PID=$!
+
                     minimap2 \
-                    -t {threads} \
+                    -t {params.aligner_threads} \
                     {input.index} \
                     $RS 2> {log} | \
-                    tee >(samtools flagstat \
-                        -@4 - > $STATSSE) | \
-                    tee >(samtools fastq \
-                        -@4 \
-                        -c {params.compression} \
-                        -N -f 4 -F 256 - | \
-                        pigz -cf -p {threads} \
-                        > $FQS) | \
+                    tee $SCRATCH/se.flagstat $SCRATCH/se.fastq | \
                     samtools sort \
-                    -m 3G \
-                    -@4 \
-                    -T {params.se_bam_dir}/temp \
-                    -O BAM -o $BAM -
+                    -m {params.sort_mem} \
+                    -@{params.sort_threads} \
+                    -T $SCRATCH/se.temp \
+                    -O BAM -o $SCRATCH/se.sorted.bam -
+
+                    wait $FLAGSTAT_PID
+                    wait $FASTQ_PID
+                    strainpi_commit $SCRATCH/se.sorted.bam $BAM
                 else
+                    mkfifo $SCRATCH/se.flagstat
+                    samtools flagstat \
+                        -O json $SCRATCH/se.flagstat > $STATSSE &
+                    FLAGSTAT_PID=$!
+
                     minimap2 \
-                    -t {threads} \
+                    -t {params.aligner_threads} \
                     {input.index} \
                     $RS 2> {log} | \
-                    tee >(samtools flagstat \
-                        -@4 - > $STATSSE) | \
+                    tee $SCRATCH/se.flagstat | \
                     samtools fastq \
-                    -@4 \
-                    -c {params.compression} \
                     -N -f 4 -F 256 - | \
-                    pigz -cf -p {threads} \
-                    > $FQS
+                    python {params.seqstats} stream \
+                    --out $FQS \
+                    --stats "$SEQSTATS" \
+                    --threads {threads} \
+                    --level {params.compression} \
+                    --fq-encoding {params.fq_encoding}
+
+                    wait $FLAGSTAT_PID
                 fi
             fi
 
+            strainpi_reads_wait
+
             echo "{{ \
             \\"PE_FORWARD\\": \\"$FQ1\\", \
             \\"PE_REVERSE\\": \\"$FQ2\\", \
             \\"SE\\": \\"$FQS\\", \
             \\"PE_ALIGN_STATS\\": \\"$STATSPE\\", \
-            \\"SE_ALIGN_STATS\\": \\"$STATSSE\\" }}" | \
+            \\"SE_ALIGN_STATS\\": \\"$STATSSE\\", \
+            \\"SEQ_STATS\\": \\"$SEQSTATS\\" }}" | \
             jq . > {output}
             '''
 
@@ -595,6 +793,7 @@ if config["params"]["rmhost"]["kraken2"]["do"]:
         benchmark:
             os.path.join(config["output"]["rmhost"], "benchmark/rmhost_kraken2/{sample}.txt")
         params:
+            reads_sh = os.path.join(WRAPPER_DIR, "reads.sh"),
             pe_prefix = os.path.join(config["output"]["rmhost"], "reads/{sample}/pe/{sample}"),
             se_prefix = os.path.join(config["output"]["rmhost"], "reads/{sample}/se/{sample}"),
             confidence = config["params"]["rmhost"]["kraken2"]["confidence"],
@@ -605,6 +804,10 @@ if config["params"]["rmhost"]["kraken2"]["do"]:
             20
         threads:
             config["params"]["rmhost"]["threads"]
+        resources:
+            mem_mb = SIZER.mem_mb,
+            disk_mb = SIZER.disk_mb,
+            runtime = SIZER.runtime
         conda:
             config["envs"]["kraken2"]
         shell:
@@ -616,9 +819,8 @@ if config["params"]["rmhost"]["kraken2"]["do"]:
             rm -rf $OUTDIR $OUTPE $OUTSE
             mkdir -p $OUTDIR
 
-            R1=$(jq -r -M '.PE_FORWARD' {input.reads} | sed 's/^null$//g')
-            R2=$(jq -r -M '.PE_REVERSE' {input.reads} | sed 's/^null$//g')
-            RS=$(jq -r -M '.SE' {input.reads} | sed 's/^null$//g')
+            source {params.reads_sh}
+            strainpi_reads {input.reads}
 
             FQ1=""
             FQ2=""
@@ -649,6 +851,9 @@ if config["params"]["rmhost"]["kraken2"]["do"]:
 
                 pigz -f -p {threads} ${{REPORT%.gz}}
 
+                # the reads are read a second time
+                strainpi_reads {input.reads} stream PE_FORWARD PE_REVERSE
+
                 extract_kraken2_reads.py \
                 -k $TABLE \
                 --taxid {params.host_taxid} \
@@ -686,6 +891,8 @@ if config["params"]["rmhost"]["kraken2"]["do"]:
 
                 pigz -f -p {threads} ${{REPORT%.gz}}
 
+                strainpi_reads {input.reads} stream SE
+
                 extract_kraken2_reads.py \
                 -k $TABLE \
                 --taxid {params.host_taxid} \
@@ -698,6 +905,8 @@ if config["params"]["rmhost"]["kraken2"]["do"]:
                 >>{log} 2>&1
             fi
 
+            strainpi_reads_wait
+
             echo "{{ \
             \\"PE_FORWARD\\": \\"$FQ1\\", \
             \\"PE_REVERSE\\": \\"$FQ2\\", \
@@ -727,6 +936,7 @@ if config["params"]["rmhost"]["kneaddata"]["do"]:
         benchmark:
             os.path.join(config["output"]["rmhost"], "benchmark/rmhost_kneaddata/{sample}.txt")
         params:
+            reads_sh = os.path.join(WRAPPER_DIR, "reads.sh"),
             pe_prefix = os.path.join(config["output"]["rmhost"], "reads/{sample}/pe/{sample}"),
             se_prefix = os.path.join(config["output"]["rmhost"], "reads/{sample}/se/{sample}"),
             trf_options = "--run-trf" if config["params"]["rmhost"]["kneaddata"]["do_trf"] else "--bypass-trf",
@@ -743,6 +953,10 @@ if config["params"]["rmhost"]["kneaddata"]["do"]:
             20
         threads:
             config["params"]["rmhost"]["threads"]
+        resources:
+            mem_mb = SIZER.mem_mb,
+            disk_mb = SIZER.disk_mb,
+            runtime = SIZER.runtime
         conda:
             config["envs"]["kneaddata"]
         shell:
@@ -754,9 +968,8 @@ if config["params"]["rmhost"]["kneaddata"]["do"]:
             rm -rf $OUTDIR $OUTPE $OUTSE
             mkdir -p $OUTDIR
 
-            R1=$(jq -r -M '.PE_FORWARD' {input.reads} | sed 's/^null$//g')
-            R2=$(jq -r -M '.PE_REVERSE' {input.reads} | sed 's/^null$//g')
-            RS=$(jq -r -M '.SE' {input.reads} | sed 's/^null$//g')
+            source {params.reads_sh}
+            strainpi_reads {input.reads} materialize
 
             FQ1=""
             FQ2=""
@@ -920,6 +1133,8 @@ if config["params"]["rmhost"]["kneaddata"]["do"]:
                 mv $OUTSE/{params.output_prefix}.fastq.gz $FQS
             fi
 
+            strainpi_reads_wait
+
             echo "{{ \
             \\"PE_FORWARD\\": \\"$FQ1\\", \
             \\"PE_REVERSE\\": \\"$FQ2\\", \
@@ -949,9 +1164,10 @@ and (not config["params"]["rmhost"]["kneaddata"]["do"]):
             os.path.join(config["output"]["rmhost"], "report/rmhost_align2host_stats.tsv")
         priority:
             20
+        threads:
+            config["params"]["qcreport"]["seqkit"]["threads"]
         run:
-            input_list = [str(i) for i in input]
-            strainpi.flagstats_summary(input_list, 2, output=str(output))
+            strainpi.flagstats_summary(input, 2, threads, output=output[0])
 
 
     rule rmhost_alignment_report_all:
@@ -974,7 +1190,8 @@ if RMHOST_DO and config["params"]["qcreport"]["do"]:
         benchmark:
             os.path.join(config["output"]["rmhost"], "benchmark/rmhost_report/{sample}.txt")
         params:
-            fq_encoding = config["params"]["fq_encoding"]
+            fq_encoding = config["params"]["fq_encoding"],
+            inline_stats = config["params"]["qcreport"]["inline_stats"]
         priority:
             10
         threads:
@@ -983,19 +1200,25 @@ if RMHOST_DO and config["params"]["qcreport"]["do"]:
             config["envs"]["report"]
         shell:
             '''
-            R1=$(jq -r -M '.PE_FORWARD' {input} | sed 's/^null$//g')
-            R2=$(jq -r -M '.PE_REVERSE' {input} | sed 's/^null$//g')
-            RS=$(jq -r -M '.SE' {input} | sed 's/^null$//g')
-
-            seqkit stats \
-            --all \
-            --basename \
-            --tabular \
-            --fq-encoding {params.fq_encoding} \
-            --out-file {output} \
-            --threads {threads} \
-            $R1 $R2 $RS \
-            >{log} 2>&1
+            # counted by the host removal rule while the reads were written
+            STATS=$(jq -r -M '.SEQ_STATS // empty' {input})
+            if [ "{params.inline_stats}" == "True" ] && [ "$STATS" != "" ] && [ -s "$STATS" ]; then
+                cp $STATS {output}
+            else
+                R1=$(jq -r -M '.PE_FORWARD' {input} | sed 's/^null$//g')
+                R2=$(jq -r -M '.PE_REVERSE' {input} | sed 's/^null$//g')
+                RS=$(jq -r -M '.SE' {input} | sed 's/^null$//g')
+
+                seqkit stats \
+                --all \
+                --basename \
+                --tabular \
+                --fq-encoding {params.fq_encoding} \
+                --out-file {output} \
+                --threads {threads} \
+                $R1 $R2 $RS \
+                >{log} 2>&1
+            fi
             '''
 
 
@@ -1013,20 +1236,24 @@ if RMHOST_DO and config["params"]["qcreport"]["do"]:
             10
         threads:
             config["params"]["qcreport"]["seqkit"]["threads"]
-        shell:
-            '''
-            head -1 {input[0]} > {output}
-            for report in {input}
-            do
-                tail -q -n +2 $report >> {output} 2>>{log}
-            done
-            '''
+        params:
+            store = os.path.join(config["output"]["qcreport"], "store/rmhost_stats.pkl"),
+            parquet = os.path.join(config["output"]["qcreport"], "rmhost_stats.parquet") \
+            if config["params"]["qcreport"]["parquet"] else None
+        run:
+            parsed = strainpi.merge_stats_store(input, params.store, output[0], threads, params.parquet)
+            with open(log[0], "a") as oh:
+                oh.write(f"{parsed} of {len(input)} stats files are new or changed\n")
 
 
     rule rmhost_report_all:
         input:
             rules.rmhost_report_merge.output
 
+
+    localrules:
+        rmhost_report_merge
+
 else:
     rule rmhost_report_all:
         input:
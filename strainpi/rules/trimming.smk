@@ -1,3 +1,9 @@
+# fastp and trimmomatic write a summary of their outputs, trimming_stats.tsv is
+# built from these, sickle has none and its reads are counted by seqkit
+TRIMMING_SUMMARY = config["params"]["qcreport"]["trimming_summary"] and \
+    not config["params"]["trimming"]["sickle"]["do"]
+
+
 if config["params"]["trimming"]["sickle"]["do"]:
     rule trimming_sickle:
         input:
@@ -9,6 +15,7 @@ if config["params"]["trimming"]["sickle"]["do"]:
         benchmark:
             os.path.join(config["output"]["trimming"], "benchmark/trimming_sickle/{sample}.txt")
         params:
+            reads_sh = os.path.join(WRAPPER_DIR, "reads.sh"),
             pe_prefix = os.path.join(config["output"]["trimming"], "reads/{sample}/pe/{sample}"),
             se_prefix = os.path.join(config["output"]["trimming"], "reads/{sample}/se/{sample}"),
             quality_type = config["params"]["trimming"]["sickle"]["quality_type"],
@@ -29,9 +36,8 @@ if config["params"]["trimming"]["sickle"]["do"]:
             rm -rf $OUTDIR $OUTPE $OUTSE
             mkdir -p $OUTDIR
 
-            R1=$(jq -r -M '.PE_FORWARD' {input} | sed 's/^null$//g')
-            R2=$(jq -r -M '.PE_REVERSE' {input} | sed 's/^null$//g')
-            RS=$(jq -r -M '.SE' {input} | sed 's/^null$//g')
+            source {params.reads_sh}
+            strainpi_reads {input} lockstep
 
             FQ1=""
             FQ2=""
@@ -76,6 +82,8 @@ if config["params"]["trimming"]["sickle"]["do"]:
                 >>{log} 2>&1
             fi
 
+            strainpi_reads_wait
+
             echo "{{\\"PE_FORWARD\\": \\"$FQ1\\", \\"PE_REVERSE\\": \\"$FQ2\\", \\"SE\\": \\"$FQS\\"}}" | \
             jq . > {output}
             '''
@@ -103,6 +111,13 @@ if config["params"]["trimming"]["fastp"]["do"]:
         benchmark:
             os.path.join(config["output"]["trimming"], "benchmark/trimming_fastp/{sample}.txt")
         params:
+            scratch_sh = os.path.join(WRAPPER_DIR, "scratch.sh"),
+            scratch_dir = config["params"]["scratch"]["dir"],
+            stage_inputs = config["params"]["scratch"]["stage_inputs"],
+            reads_sh = os.path.join(WRAPPER_DIR, "reads.sh"),
+            seqstats = os.path.join(WRAPPER_DIR, "seqstats.py"),
+            # trimming_stats.tsv is built from the fastp reports of all samples
+            inline_stats = config["params"]["qcreport"]["inline_stats"] and not TRIMMING_SUMMARY,
             pe_prefix = os.path.join(config["output"]["trimming"], "reads/{sample}/pe/{sample}"),
             se_prefix = os.path.join(config["output"]["trimming"], "reads/{sample}/se/{sample}"),
             adapter_sequence = config["params"]["trimming"]["fastp"]["adapter_sequence"],
@@ -128,6 +143,10 @@ if config["params"]["trimming"]["fastp"]["do"]:
             10
         threads:
             config["params"]["trimming"]["threads"]
+        resources:
+            mem_mb = SIZER.mem_mb,
+            disk_mb = SIZER.disk_mb,
+            runtime = SIZER.runtime
         conda:
             config["envs"]["trimming"]
         shell:
@@ -139,13 +158,24 @@ if config["params"]["trimming"]["fastp"]["do"]:
             rm -rf $OUTDIR $OUTPE $OUTSE
             mkdir -p $OUTDIR
 
-            R1=$(jq -r -M '.PE_FORWARD' {input} | sed 's/^null$//g')
-            R2=$(jq -r -M '.PE_REVERSE' {input} | sed 's/^null$//g')
-            RS=$(jq -r -M '.SE' {input} | sed 's/^null$//g')
+            source {params.reads_sh}
+            strainpi_reads {input} lockstep
+
+            source {params.scratch_sh}
+            strainpi_scratch_init '{params.scratch_dir}' {params.stage_inputs}
+            strainpi_stage_reads
 
             FQ1=""
             FQ2=""
             FQS=""
+            REPORTPE=""
+            REPORTSE=""
+            SEQSTATS=""
+            if [ "{params.inline_stats}" == "True" ];
+            then
+                SEQSTATS=$OUTDIR/{wildcards.sample}.trimming.seq_stats.tsv
+            fi
+
             ADAPTER_OPERATION_PE=""
             ADAPTER_OPERATION_SE=""
 
@@ -173,6 +203,7 @@ if config["params"]["trimming"]["fastp"]["do"]:
                 FQ2={params.pe_prefix}.trimming.pe.2.fq.gz
                 HTML={params.pe_prefix}.fastp.pe.html
                 JSON={params.pe_prefix}.fastp.pe.json
+                REPORTPE=$JSON
 
                 mkdir -p $OUTPE
 
@@ -181,8 +212,8 @@ if config["params"]["trimming"]["fastp"]["do"]:
                     fastp \
                     --in1 $R1 \
                     --in2 $R2 \
-                    --out1 $FQ1 \
-                    --out2 $FQ2 \
+                    --out1 $SCRATCH/$(basename $FQ1) \
+                    --out2 $SCRATCH/$(basename $FQ2) \
                     --compression {params.compression} \
                     $ADAPTER_OPERATION_PE \
                     {params.dedup} \
@@ -202,8 +233,8 @@ if config["params"]["trimming"]["fastp"]["do"]:
                     fastp \
                     --in1 $R1 \
                     --in2 $R2 \
-                    --out1 $FQ1 \
-                    --out2 $FQ2 \
+                    --out1 $SCRATCH/$(basename $FQ1) \
+                    --out2 $SCRATCH/$(basename $FQ2) \
                     --compression {params.compression} \
                     $ADAPTER_OPERATION_PE \
                     {params.dedup} \
@@ -220,6 +251,14 @@ if config["params"]["trimming"]["fastp"]["do"]:
                     --json $JSON \
                     >{log} 2>&1
                 fi
+
+                strainpi_commit $SCRATCH/$(basename $FQ1) $FQ1
+                strainpi_commit $SCRATCH/$(basename $FQ2) $FQ2
+
+                if [ "$SEQSTATS" != "" ];
+                then
+                    python {params.seqstats} fastp --json $JSON --out $FQ1 $FQ2 --stats $SEQSTATS
+                fi
             fi
 
             if [ "$RS" != "" ];
@@ -227,6 +266,7 @@ if config["params"]["trimming"]["fastp"]["do"]:
                 FQS={params.se_prefix}.trimming.se.fq.gz
                 HTML={params.se_prefix}.fastp.se.html
                 JSON={params.se_prefix}.fastp.se.json
+                REPORTSE=$JSON
 
                 mkdir -p $OUTSE
 
@@ -234,7 +274,7 @@ if config["params"]["trimming"]["fastp"]["do"]:
                 then
                     fastp \
                     --in1 $RS \
-                    --out1 $FQS \
+                    --out1 $SCRATCH/$(basename $FQS) \
                     --compression {params.compression} \
                     $ADAPTER_OPERATION_SE \
                     {params.dedup} \
@@ -253,7 +293,7 @@ if config["params"]["trimming"]["fastp"]["do"]:
                 else
                     fastp \
                     --in1 $RS \
-                    --out1 $FQS \
+                    --out1 $SCRATCH/$(basename $FQS) \
                     --compression {params.compression} \
                     $ADAPTER_OPERATION_SE \
                     {params.dedup} \
@@ -270,9 +310,20 @@ if config["params"]["trimming"]["fastp"]["do"]:
                     --json $JSON \
                     >>{log} 2>&1
                 fi
+
+                strainpi_commit $SCRATCH/$(basename $FQS) $FQS
+
+                if [ "$SEQSTATS" != "" ];
+                then
+                    python {params.seqstats} fastp --json $JSON --out $FQS --stats $SEQSTATS
+                fi
             fi
 
-            echo "{{\\"PE_FORWARD\\": \\"$FQ1\\", \\"PE_REVERSE\\": \\"$FQ2\\", \\"SE\\": \\"$FQS\\"}}" | \
+            strainpi_reads_wait
+
+            echo "{{\\"PE_FORWARD\\": \\"$FQ1\\", \\"PE_REVERSE\\": \\"$FQ2\\", \\"SE\\": \\"$FQS\\", \
+            \\"PE_TRIMMING_REPORT\\": \\"$REPORTPE\\", \\"SE_TRIMMING_REPORT\\": \\"$REPORTSE\\", \
+            \\"SEQ_STATS\\": \\"$SEQSTATS\\"}}" | \
             jq . > {output}
             '''
 
@@ -298,6 +349,7 @@ if config["params"]["trimming"]["trimmomatic"]["do"]:
         benchmark:
             os.path.join(config["output"]["trimming"], "benchmark/trimming_trimmomatic/{sample}.txt")
         params:
+            reads_sh = os.path.join(WRAPPER_DIR, "reads.sh"),
             pe_prefix = os.path.join(config["output"]["trimming"], "reads/{sample}/pe/{sample}"),
             se_prefix = os.path.join(config["output"]["trimming"], "reads/{sample}/se/{sample}"),
             trimmomatic_options = config["params"]["trimming"]["trimmomatic"]["trimmomatic_options"],
@@ -318,25 +370,27 @@ if config["params"]["trimming"]["trimmomatic"]["do"]:
             rm -rf $OUTDIR $OUTPE $OUTSE
             mkdir -p $OUTDIR
 
-            R1=$(jq -r -M '.PE_FORWARD' {input} | sed 's/^null$//g')
-            R2=$(jq -r -M '.PE_REVERSE' {input} | sed 's/^null$//g')
-            RS=$(jq -r -M '.SE' {input} | sed 's/^null$//g')
+            source {params.reads_sh}
+            strainpi_reads {input} lockstep
 
             FQ1=""
             FQ2=""
             FQS=""
+            REPORTPE=""
+            REPORTSE=""
 
             if [ "$R1" != "" ];
             then
                 FQ1={params.pe_prefix}.trimming.pe.1.fq.gz
                 FQ2={params.pe_prefix}.trimming.pe.2.fq.gz
+                REPORTPE={params.pe_prefix}.summary.txt
 
                 mkdir -p $OUTPE
 
                 trimmomatic PE \
                 {params.phred} \
                 -threads {threads} \
-                -summary {params.pe_prefix}.summary.txt \
+                -summary $REPORTPE \
                 $R1 $R2 \
                 $FQ1 $FQ1.unpaired.gz \
                 $FQ2 $FQ2.unpaired.gz \
@@ -353,20 +407,24 @@ if config["params"]["trimming"]["trimmomatic"]["do"]:
             if [ "$RS" != "" ];
             then
                 FQS={params.se_prefix}.trimming.se.fq.gz
+                REPORTSE={params.se_prefix}.summary.txt
 
                 mkdir -p $OUTSE
 
                 trimmomatic SE \
                 {params.phred} \
                 -threads {threads} \
-                -summary {params.se_prefix}.summary.txt \
+                -summary $REPORTSE \
                 $RS \
                 $FQS \
                 {params.trimmomatic_options} \
                 >>{log} 2>&1
             fi
 
-            echo "{{\\"PE_FORWARD\\": \\"$FQ1\\", \\"PE_REVERSE\\": \\"$FQ2\\", \\"SE\\": \\"$FQS\\"}}" | \
+            strainpi_reads_wait
+
+            echo "{{\\"PE_FORWARD\\": \\"$FQ1\\", \\"PE_REVERSE\\": \\"$FQ2\\", \\"SE\\": \\"$FQS\\", \
+            \\"PE_TRIMMING_REPORT\\": \\"$REPORTPE\\", \\"SE_TRIMMING_REPORT\\": \\"$REPORTSE\\"}}" | \
             jq . > {output}
             '''
 
@@ -381,7 +439,33 @@ else:
         input:
 
 
-if TRIMMING_DO and config["params"]["qcreport"]["do"]:
+if TRIMMING_DO and config["params"]["qcreport"]["do"] and TRIMMING_SUMMARY:
+    rule trimming_report_merge:
+        input:
+            expand(os.path.join(config["output"]["trimming"], "reads/{sample}/{sample}.json"),
+            sample=SAMPLES_ID_LIST)
+        output:
+            os.path.join(config["output"]["qcreport"], "trimming_stats.tsv")
+        priority:
+            10
+        threads:
+            config["params"]["qcreport"]["seqkit"]["threads"]
+        params:
+            parquet = os.path.join(config["output"]["qcreport"], "trimming_stats.parquet") \
+            if config["params"]["qcreport"]["parquet"] else None
+        run:
+            strainpi.trimming_summary(input, threads, output=output[0], output_parquet=params.parquet)
+
+
+    rule trimming_report_all:
+        input:
+            rules.trimming_report_merge.output
+
+
+    localrules:
+        trimming_report_merge
+
+elif TRIMMING_DO and config["params"]["qcreport"]["do"]:
     rule trimming_report:
         input:
             os.path.join(config["output"]["trimming"], "reads/{sample}/{sample}.json")
@@ -392,7 +476,8 @@ if TRIMMING_DO and config["params"]["qcreport"]["do"]:
         benchmark:
             os.path.join(config["output"]["trimming"], "benchmark/trimming_report/{sample}.txt")
         params:
-            fq_encoding = config["params"]["fq_encoding"]
+            fq_encoding = config["params"]["fq_encoding"],
+            inline_stats = config["params"]["qcreport"]["inline_stats"]
         priority:
             10
         threads:
@@ -401,19 +486,25 @@ if TRIMMING_DO and config["params"]["qcreport"]["do"]:
             config["envs"]["report"]
         shell:
             '''
-            R1=$(jq -r -M '.PE_FORWARD' {input} | sed 's/^null$//g')
-            R2=$(jq -r -M '.PE_REVERSE' {input} | sed 's/^null$//g')
-            RS=$(jq -r -M '.SE' {input} | sed 's/^null$//g')
-
-            seqkit stats \
-            --all \
-            --basename \
-            --tabular \
-            --fq-encoding {params.fq_encoding} \
-            --out-file {output} \
-            --threads {threads} \
-            $R1 $R2 $RS \
-            >{log} 2>&1
+            # counted by the trimmer rule while the reads were written
+            STATS=$(jq -r -M '.SEQ_STATS // empty' {input})
+            if [ "{params.inline_stats}" == "True" ] && [ "$STATS" != "" ] && [ -s "$STATS" ]; then
+                cp $STATS {output}
+            else
+                R1=$(jq -r -M '.PE_FORWARD' {input} | sed 's/^null$//g')
+                R2=$(jq -r -M '.PE_REVERSE' {input} | sed 's/^null$//g')
+                RS=$(jq -r -M '.SE' {input} | sed 's/^null$//g')
+
+                seqkit stats \
+                --all \
+                --basename \
+                --tabular \
+                --fq-encoding {params.fq_encoding} \
+                --out-file {output} \
+                --threads {threads} \
+                $R1 $R2 $RS \
+                >{log} 2>&1
+            fi
             '''
 
 
@@ -431,20 +522,24 @@ if TRIMMING_DO and config["params"]["qcreport"]["do"]:
             10
         threads:
             config["params"]["qcreport"]["seqkit"]["threads"]
-        shell:
-            '''
-            head -1 {input[0]} > {output}
-            for report in {input}
-            do
-                tail -q -n +2 $report >> {output} 2>>{log}
-            done
-            '''
+        params:
+            store = os.path.join(config["output"]["qcreport"], "store/trimming_stats.pkl"),
+            parquet = os.path.join(config["output"]["qcreport"], "trimming_stats.parquet") \
+            if config["params"]["qcreport"]["parquet"] else None
+        run:
+            parsed = strainpi.merge_stats_store(input, params.store, output[0], threads, params.parquet)
+            with open(log[0], "a") as oh:
+                oh.write(f"{parsed} of {len(input)} stats files are new or changed\n")
 
 
     rule trimming_report_all:
         input:
             rules.trimming_report_merge.output
 
+
+    localrules:
+        trimming_report_merge
+
 else:
     rule trimming_report_all:
         input:
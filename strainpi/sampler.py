@@ -1,14 +1,19 @@
 #!/usr/bin/env python
 
 import glob
+import hashlib
 import os
 import sys
 import json
+import weakref
 
 from ruamel.yaml import YAML
 from executor import execute
 import pandas as pd
 
+from strainpi import tooler
+from strainpi.__about__ import __version__
+
 
 SRA_HEADERS = {
     "PE": "sra_pe",
@@ -30,15 +35,13 @@ HEADERS = {
 }
 
 
-def pass_gzip_format(fq_list):
-    cancel = False
-    for fq in fq_list:
-        if pd.isna(fq):
-            pass
-        elif not fq.endswith(".gz"):
-            cancel = True
-            print(f"{fq} is not gzip format")
-    return cancel
+# id(samples_df) -> (weakref to samples_df, reads index)
+_READS_INDEX = {}
+
+
+def not_gzip_format(fq_series):
+    fqs = fq_series.dropna().astype(str)
+    return fqs[~fqs.str.endswith(".gz")]
 
 
 def parse_samples(samples_tsv):
@@ -47,116 +50,180 @@ def parse_samples(samples_tsv):
 
     samples_df = samples_df.set_index(["sample_id"])
 
-    cancel = False
+    # collect every error in one pass, then quit once with a complete report
+    errors = []
 
     # check header
-    is_sra = False
-    is_fastq = False
-    for sra_k, sra_v in SRA_HEADERS.items():
-        if sra_v in samples_df.columns:
-            is_sra = True
-    for fq_k, fq_v in FQ_HEADERS.items():
-        if fq_v in samples_df.columns:
-            is_fastq = True
+    is_sra = any(sra_v in samples_df.columns for sra_v in SRA_HEADERS.values())
+    is_fastq = any(fq_v in samples_df.columns for fq_v in FQ_HEADERS.values())
     if is_sra and is_fastq:
-        cancel = True
-        print("Can't process sra and fastq at the same time, please provide fastq only or sra only")
-    if cancel:
-        sys.exit(-1)
+        errors.append("Can't process sra and fastq at the same time, please provide fastq only or sra only")
 
     # check sample_id
-    for sample_id in samples_df.index.get_level_values("sample_id").unique():
-        if "." in sample_id:
-            if "." in sample_id:
-                print(f"{sample_id} contain '.', please remove '.'")
-                cancel = True
-    if cancel:
-        print(f"{samples_tsv} sample_id contain '.' please remove '.', now quiting :)")
+    samples_id = samples_df.index.unique().astype(str)
+    for sample_id in samples_id[samples_id.str.contains(".", regex=False)]:
+        errors.append(f"{sample_id} contain '.', please remove '.'")
 
     # check fastq headers
+    has_pe_forward = FQ_HEADERS["PE_FORWARD"] in samples_df.columns
+    has_pe_reverse = FQ_HEADERS["PE_REVERSE"] in samples_df.columns
     if is_fastq:
-        if (FQ_HEADERS["PE_FORWARD"] in samples_df.columns) and (FQ_HEADERS["PE_REVERSE"] in samples_df.columns):
+        if has_pe_forward and has_pe_reverse:
             if FQ_HEADERS["INTERLEAVED"] in samples_df.columns:
-                cancel = True
-                print(f'''can't specific {FQ_HEADERS["PE_FORWARD"]}, {FQ_HEADERS["PE_REVERSE"]} and {FQ_HEADERS["INTERLEAVED"]} at the same time''')
-                print(f'''please only specific {FQ_HEADERS["PE_FORWARD"]} and {FQ_HEADERS["PE_REVERSE"]}, or {FQ_HEADERS["INTERLEAVED"]}''')
-            else:
-                pass
-        elif (FQ_HEADERS["PE_FORWARD"] in samples_df.columns) or (FQ_HEADERS["PE_REVERSE"] in samples_df.columns):
-            cancel = True
-            print(f'''please only specific {FQ_HEADERS["PE_FORWARD"]} and {FQ_HEADERS["PE_REVERSE"]} at the same time''')
-        else:
-            pass
-
-    # check reads_format
-    for sample_id in samples_df.index.get_level_values("sample_id").unique():
-        # check short paired-end reads
-        if (FQ_HEADERS["PE_FORWARD"] in samples_df.columns) and (FQ_HEADERS["PE_REVERSE"] in samples_df.columns):
-            forward_reads = samples_df.loc[[sample_id]][FQ_HEADERS["PE_FORWARD"]].dropna().tolist()
-            reverse_reads = samples_df.loc[[sample_id]][FQ_HEADERS["PE_REVERSE"]].dropna().tolist()
-
-            for forward_read, reverse_read in zip(forward_reads, reverse_reads):
-                if pd.isna(forward_read) and pd.isna(reverse_read):
-                    pass
-                elif (not pd.isna(forward_read)) and (not pd.isna(reverse_read)):
-                    if forward_read.endswith(".gz") and reverse_read.endswith(".gz"):
-                        pass
-                    else:
-                        cancel = True
-                        print(f"{forward_read} or {reverse_read} is not gzip format")
-                else:
-                    cancel = True
-                    print(f"It seems short paired-end reads only specific forward or reverse reads, please check again!")
-
-        # check short single-end reads
-        if FQ_HEADERS["SE"] in samples_df.columns:
-            single_reads = samples_df.loc[[sample_id]][FQ_HEADERS["SE"]].dropna().tolist()
-            cancel = pass_gzip_format(single_reads)
-
-        # check long reads
-        if FQ_HEADERS["LONG"] in samples_df.columns:
-            long_reads = samples_df.loc[[sample_id]][FQ_HEADERS["LONG"]].dropna().tolist()
-            cancel = pass_gzip_format(long_reads)
-
-        # check short_interleaved
-        if FQ_HEADERS["INTERLEAVED"] in samples_df.columns:
-            interleaved_reads = samples_df.loc[[sample_id]][FQ_HEADERS["INTERLEAVED"]].tolist()
-            cancel = pass_gzip_format(interleaved_reads)
-
-    if cancel:
+                errors.append(f'''can't specific {FQ_HEADERS["PE_FORWARD"]}, {FQ_HEADERS["PE_REVERSE"]} and {FQ_HEADERS["INTERLEAVED"]} at the same time''')
+                errors.append(f'''please only specific {FQ_HEADERS["PE_FORWARD"]} and {FQ_HEADERS["PE_REVERSE"]}, or {FQ_HEADERS["INTERLEAVED"]}''')
+        elif has_pe_forward or has_pe_reverse:
+            errors.append(f'''please only specific {FQ_HEADERS["PE_FORWARD"]} and {FQ_HEADERS["PE_REVERSE"]} at the same time''')
+
+    # check reads format, whole column at a time
+    if has_pe_forward and has_pe_reverse:
+        forward_reads = samples_df[FQ_HEADERS["PE_FORWARD"]]
+        reverse_reads = samples_df[FQ_HEADERS["PE_REVERSE"]]
+
+        unpaired = (forward_reads.isna() ^ reverse_reads.isna()).to_numpy()
+        for sample_id in samples_df.index[unpaired].unique():
+            errors.append(f"{sample_id}: It seems short paired-end reads only specific forward or reverse reads, please check again!")
+
+        paired = (forward_reads.notna() & reverse_reads.notna()).to_numpy()
+        forward_reads = forward_reads[paired].astype(str)
+        reverse_reads = reverse_reads[paired].astype(str)
+        not_gzip = ~(forward_reads.str.endswith(".gz") & reverse_reads.str.endswith(".gz")).to_numpy()
+        for forward_read, reverse_read in zip(forward_reads[not_gzip], reverse_reads[not_gzip]):
+            errors.append(f"{forward_read} or {reverse_read} is not gzip format")
+
+    for fq_k in ["SE", "LONG", "INTERLEAVED"]:
+        if FQ_HEADERS[fq_k] in samples_df.columns:
+            for fq in not_gzip_format(samples_df[FQ_HEADERS[fq_k]]):
+                errors.append(f"{fq} is not gzip format")
+
+    if len(errors) > 0:
+        for error in errors:
+            print(error)
+        print(f"{samples_tsv} has {len(errors)} error(s), now quiting :)")
         sys.exit(-1)
     else:
+        build_reads_index(samples_df)
         if is_sra:
             return samples_df, "SRA"
         else:
             return samples_df, "FQ"
 
 
+def build_reads_index(samples_df):
+    """
+    build a sample_id -> {column: (paths, ...)} index with a single groupby,
+    so the input functions snakemake calls for every job are plain dict lookups
+    """
+    index = {sample_id: {} for sample_id in samples_df.index.unique()}
+
+    long_df = samples_df.reset_index().melt(
+        id_vars="sample_id", var_name="column", value_name="path"
+    ).dropna(subset=["path"])
+
+    paths = long_df["path"].to_numpy()
+    groups = long_df.groupby(["sample_id", "column"], sort=False).indices
+    for (sample_id, col), rows in groups.items():
+        index[sample_id][col] = tuple(paths[rows])
+
+    register_reads_index(samples_df, index)
+    return index
+
+
+def register_reads_index(samples_df, index):
+    key = id(samples_df)
+    _READS_INDEX[key] = (
+        weakref.ref(samples_df, lambda _: _READS_INDEX.pop(key, None)),
+        index
+    )
+
+
+def get_reads_index(samples_df):
+    ref_index = _READS_INDEX.get(id(samples_df))
+    if (ref_index is not None) and (ref_index[0]() is samples_df):
+        return ref_index[1]
+    return build_reads_index(samples_df)
+
+
+def samples_cache_key(samples_tsv):
+    """
+    key a sample sheet on its path, size, mtime and content,
+    plus the strainpi version which parsed it
+    """
+    samples_tsv = os.path.realpath(samples_tsv)
+    stat = os.stat(samples_tsv)
+
+    content_hash = hashlib.sha256()
+    with open(samples_tsv, "rb") as ih:
+        for chunk in iter(lambda: ih.read(1 << 20), b""):
+            content_hash.update(chunk)
+
+    key = "\t".join([
+        __version__, samples_tsv, str(stat.st_size), str(stat.st_mtime_ns),
+        content_hash.hexdigest()])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def parse_samples_cached(samples_tsv, cache_dir):
+    """
+    parse_samples, but load the result from a pickle under cache_dir
+    when the sample sheet has not changed since it was written
+
+    every cluster job re-evaluates the snakefile, so this saves thousands
+    of jobs from re-reading and re-validating the same sample sheet
+    """
+    key = samples_cache_key(samples_tsv)
+    cache_file = os.path.join(cache_dir, f"samples.{key[:16]}.pkl")
+
+    if os.path.exists(cache_file):
+        try:
+            cache = tooler.load_pickle(cache_file)
+            if cache["key"] == key:
+                register_reads_index(cache["samples_df"], cache["reads_index"])
+                return cache["samples_df"], cache["data_type"]
+        except Exception as e:
+            print(f"{cache_file} can't be loaded ({e}), rebuilding it")
+
+    samples_df, data_type = parse_samples(samples_tsv)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tooler.dump_pickle({
+        "key": key,
+        "samples_df": samples_df,
+        "data_type": data_type,
+        "reads_index": get_reads_index(samples_df)}, cache_file)
+
+    # stale caches of older sample sheets
+    for stale_file in glob.glob(os.path.join(cache_dir, "samples.*.pkl")):
+        if stale_file != cache_file:
+            try:
+                os.remove(stale_file)
+            except OSError:
+                pass
+
+    return samples_df, data_type
+
+
 def get_raw_input_list(wildcards, samples_df, data_type):
     fqs = []
-    headers = HEADERS[data_type]
-    for k, v in headers.items():
-        if v in samples_df.columns:
-            reads = get_reads(samples_df, wildcards, v)
-            if len(reads) > 0:
-                fqs += reads
+    sample_reads = get_reads_index(samples_df)[wildcards.sample]
+    for k, v in HEADERS[data_type].items():
+        if v in sample_reads:
+            fqs += sample_reads[v]
     return fqs
 
 
 def get_raw_input_dict(wildcards, samples_df, data_type):
     fqs = {}
-    headers = HEADERS[data_type]
-    for k, v in headers.items():
-        if v in samples_df.columns:
-            reads = get_reads(samples_df, wildcards, v)
-            if len(reads) > 0:
-                fqs[v] = reads
+    sample_reads = get_reads_index(samples_df)[wildcards.sample]
+    for k, v in HEADERS[data_type].items():
+        if v in sample_reads:
+            fqs[v] = list(sample_reads[v])
     return fqs
 
 
 def get_reads(sample_df, wildcards, col):
-    return sample_df.loc[[wildcards.sample]][col].dropna().tolist()
+    return list(get_reads_index(sample_df)[wildcards.sample].get(col, ()))
 
 
 def get_sample_id(sample_df, wildcards, col):
-    return sample_df.loc[[wildcards.sample]][col].dropna()[0]
+    return get_reads_index(sample_df)[wildcards.sample][col][0]
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+import glob
+import math
+import os
+
+from strainpi import profiler
+
+
+MB = 1e6
+
+# rough footprints of the tools, strainpi resource-model replaces mem_mb and
+# runtime of a rule once it has learned them from benchmarks
+BAM_PER_READS = 1.5     # sorted bam bytes per byte of gzipped reads
+INDEX_MEM = 1.2         # aligner memory per byte of its index on disk
+THREAD_MEM_MB = 100     # tool working memory per thread
+BASE_MEM_MB = 1024      # seqstats stream, samtools flagstat and fastq, shell
+MIN_DISK_MB = 1000
+BASE_RUNTIME = 20
+
+# samtools sort -m bounds, per thread
+SORT_MEM_MB = (256, 3072)
+
+# samtools sort threads and memory per thread (MB) when the reads can't be sized
+SORT_DEFAULT = (4, 3072)
+
+# threads of the samtools reading the aligner output next to it, flagstat and
+# fastq for rmhost, flagstat for alignment
+HELPER_THREADS = {"rmhost": 2, "alignment": 1}
+
+# memory of an index build per byte of the fasta
+BUILD_MEM = {"bwa": 6, "bwa-mem2": 30, "bowtie2": 4, "minimap2": 3}
+
+# minutes of one thread per GB of gzipped reads, or of fasta for index builds
+MINUTES_PER_GB = {
+    "fastp": 4,
+    "bwa": 60,
+    "bowtie2": 90,
+    "minimap2": 15,
+    "strobealign": 15,
+    "kraken2": 10,
+    "kneaddata": 120,
+    "index": 120,
+}
+
+# fastp --dup_calc_accuracy 1 to 6
+FASTP_DEDUP_MB = [1024, 2048, 4096, 8192, 16384, 24576]
+
+
+def files_size(paths):
+    """
+    bytes of files, of the files in a directory, or of the files starting with
+    a prefix when the path itself is missing (bowtie2 style index prefixes)
+    """
+    size = 0
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, f) for f in os.listdir(path)]
+        elif os.path.exists(path):
+            files = [path]
+        else:
+            files = glob.glob(glob.escape(path) + "*")
+        for f in files:
+            try:
+                size += os.path.getsize(f)
+            except OSError:
+                pass
+    return size
+
+
+class rule_sizer:
+    """
+    resources of the heavy rules from the size of their reads and of their
+    reference index, the methods are snakemake resource and params callables
+    """
+    def __init__(self, config, workdir="./"):
+        self.config = config
+        self.workdir = workdir
+        self.index_sizes = {}
+
+    def tool(self, rulename):
+        tool = rulename.split("_")[1]
+        if tool == "bwa" and self.config["params"]["rmhost"]["bwa"]["algorithms"] == "mem2":
+            return "bwa-mem2"
+        return tool
+
+    def sorts(self, rulename):
+        """
+        whether the rule sorts a bam with samtools sort
+        """
+        if rulename.startswith("alignment_"):
+            return True
+        return self.tool(rulename) in ("bwa", "bwa-mem2", "bowtie2", "minimap2") and \
+            self.config["params"]["rmhost"]["save_bam"]
+
+    def reads_bytes(self, input):
+        """
+        bytes of the reads in the manifest of a job, None until they can be sized
+        """
+        return profiler.reads_size(input[0], self.workdir)
+
+    def index_bytes(self, paths):
+        """
+        bytes of an index, cached once it exists
+        """
+        if paths not in self.index_sizes:
+            size = files_size(paths)
+            if size == 0:
+                return 0
+            self.index_sizes[paths] = size
+        return self.index_sizes[paths]
+
+    def index_paths(self, rulename, input):
+        if rulename.endswith("_index"):
+            return list(input)
+        names = [name for name in ("index", "database") if name in input.keys()]
+        index = getattr(input, names[0]) if names else []
+        paths = [index] if isinstance(index, str) else list(index)
+        if rulename == "alignment_strobealign":
+            # the .sti files are the index input already, only add the fasta
+            fasta = self.config["params"]["alignment"]["strobealign"]["index_prefix"]
+            if os.path.exists(fasta):
+                paths.append(fasta)
+        elif rulename == "rmhost_kneaddata":
+            paths.append(self.config["params"]["rmhost"]["kneaddata"]["bowtie2_database"])
+        return paths
+
+    def sort_plan(self, input, threads):
+        """
+        samtools sort threads and memory per thread (MB), enough threads, at most
+        half of the job's, for the whole bam to be sorted in memory
+        """
+        size = self.reads_bytes(input)
+        if size is None:
+            return min(SORT_DEFAULT[0], max(1, threads // 2)), SORT_DEFAULT[1]
+        bam_mb = size * BAM_PER_READS / MB
+        sort_threads = max(1, min(max(1, threads // 2), math.ceil(bam_mb / SORT_MEM_MB[1])))
+        sort_mem = min(SORT_MEM_MB[1], max(SORT_MEM_MB[0], math.ceil(bam_mb / sort_threads)))
+        return sort_threads, sort_mem
+
+    def sort_threads(self, wildcards, input, threads):
+        return self.sort_plan(input, threads)[0]
+
+    def sort_mem(self, wildcards, input, threads):
+        return "%dM" % self.sort_plan(input, threads)[1]
+
+    def aligner_threads(self, rulename):
+        """
+        params callable of the aligner threads, those of the job less the
+        samtools sort and the helper threads
+        """
+        def threads_of(wildcards, input, threads):
+            helpers = HELPER_THREADS.get(rulename.split("_")[0], 0)
+            if self.sorts(rulename):
+                helpers += self.sort_plan(input, threads)[0]
+            return max(1, threads - helpers)
+        return threads_of
+
+    def mem_mb(self, wildcards, input, threads, rulename):
+        tool = self.tool(rulename)
+        index_mb = self.index_bytes(tuple(self.index_paths(rulename, input))) / MB
+        if rulename.endswith("_index"):
+            return math.ceil(BASE_MEM_MB + index_mb * BUILD_MEM.get(tool, INDEX_MEM))
+
+        mem = BASE_MEM_MB + index_mb * INDEX_MEM + threads * THREAD_MEM_MB
+        if self.sorts(rulename):
+            sort_threads, sort_mem = self.sort_plan(input, threads)
+            mem += sort_threads * sort_mem
+        if tool == "fastp" and self.config["params"]["trimming"]["fastp"]["dedup"]:
+            accuracy = self.config["params"]["trimming"]["fastp"]["dup_calc_accuracy"]
+            mem += FASTP_DEDUP_MB[min(max(int(accuracy), 1), 6) - 1]
+        return math.ceil(mem)
+
+    def disk_mb(self, wildcards, input, threads, rulename):
+        """
+        scratch space: staged reads, the sorted bam and the temp files of
+        samtools sort when the bam doesn't fit in its memory, unset until the
+        reads can be sized
+        """
+        size = self.reads_bytes(input)
+        if size is None:
+            return None
+        reads_mb = size / MB
+        disk = reads_mb if self.config["params"]["scratch"]["stage_inputs"] else 0
+        if self.sorts(rulename):
+            bam_mb = reads_mb * BAM_PER_READS
+            sort_threads, sort_mem = self.sort_plan(input, threads)
+            disk += bam_mb
+            if bam_mb > sort_threads * sort_mem:
+                disk += bam_mb
+        return max(MIN_DISK_MB, math.ceil(disk))
+
+    def runtime(self, wildcards, input, threads, rulename):
+        """
+        walltime in minutes, unset until the reads can be sized
+        """
+        if rulename.endswith("_index"):
+            gb = self.index_bytes(tuple(self.index_paths(rulename, input))) / 1e9
+            minutes = MINUTES_PER_GB["index"]
+        else:
+            size = self.reads_bytes(input)
+            if size is None:
+                return None
+            gb = size / 1e9
+            minutes = MINUTES_PER_GB.get(self.tool(rulename), MINUTES_PER_GB["bowtie2"])
+        return math.ceil(BASE_RUNTIME + gb * minutes / max(1, threads))
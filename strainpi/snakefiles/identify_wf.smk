@@ -41,9 +41,17 @@ if config["params"]["identify"]["instrain"]["do"]:
     IDENTIFIERS += ["instrain"]
 
 
-SAMPLES, DATA_TYPE = strainpi.parse_samples(config["params"]["samples"])
+# parsed samples are cached next to the config, every cluster job reuses it
+CONFIG_FILES = getattr(workflow, "configfiles", None)
+SAMPLES_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(CONFIG_FILES[0])) if CONFIG_FILES else os.getcwd(),
+    ".strainpi")
+SAMPLES, DATA_TYPE = strainpi.parse_samples_cached(config["params"]["samples"], SAMPLES_CACHE_DIR)
 SAMPLES_ID_LIST = SAMPLES.index.get_level_values("sample_id").unique()
 
+# mem_mb, disk_mb and runtime of the heavy rules from their input and index sizes
+SIZER = strainpi.rule_sizer(config)
+
 
 include: "../rules/raw.smk"
 include: "../rules/trimming.smk"
@@ -59,3 +67,8 @@ rule all:
         rules.rmhost_all.input,
         rules.qcreport_all.input,
         rules.alignment_all.input
+
+
+# mem_mb and runtime of rules learned from past benchmarks, see strainpi resource-model
+RESOURCE_MODELS = strainpi.load_resource_models(config, os.path.dirname(SAMPLES_CACHE_DIR))
+RESOURCE_MODELS.apply(workflow.rules)
@@ -1,10 +1,39 @@
 #!/usr/bin/env python3
 
+import io
 import os
+import pickle
+import tempfile
 import concurrent.futures
 import pandas as pd
 
 
+# columns of `seqkit stats --all --tabular`, fixed up front so every
+# batch parses to the same dtypes, the integers a trimmer report doesn't
+# know are left empty in its rows
+SEQKIT_STATS_DTYPES = {
+    "file": "str",
+    "format": "str",
+    "type": "str",
+    "num_seqs": "int64",
+    "sum_len": "Int64",
+    "min_len": "Int64",
+    "avg_len": "float64",
+    "max_len": "Int64",
+    "Q1": "float64",
+    "Q2": "float64",
+    "Q3": "float64",
+    "sum_gap": "Int64",
+    "N50": "Int64",
+    "Q20(%)": "float64",
+    "Q30(%)": "float64",
+    "AvgQual": "float64",
+    "GC(%)": "float64"
+}
+
+WRITE_BUFFER = 1 << 23
+
+
 def parse(stats_file):
     if os.path.exists(stats_file):
         try:
@@ -29,7 +58,7 @@ def merge(input_list, func, workers, **kwargs):
             if df is not None:
                 df_list.append(df)
 
-    df_ = pd.concat(df_list)
+    df_ = pd.concat(df_list) if len(df_list) > 0 else pd.DataFrame()
 
     if "output" in kwargs:
         df_.to_csv(kwargs["output"], sep="\t", index=False)
@@ -46,8 +75,8 @@ def merge2(input_list, func, workers, **kwargs):
             if df2 is not None:
                 df2_list.append(df2)
 
-    df_1 = pd.concat(df1_list)
-    df_2 = pd.concat(df2_list)
+    df_1 = pd.concat(df1_list) if len(df1_list) > 0 else pd.DataFrame()
+    df_2 = pd.concat(df2_list) if len(df2_list) > 0 else pd.DataFrame()
 
     if "output_1" in kwargs:
         df_1.to_csv(kwargs["output_1"], sep="\t", index=False)
@@ -55,3 +84,173 @@ def merge2(input_list, func, workers, **kwargs):
         df_2.to_csv(kwargs["output_2"], sep="\t", index=False)
 
     return df_1, df_2
+
+
+def read_table(table_file):
+    """
+    read a tsv as (header line, body bytes), the same checks as parse
+    """
+    try:
+        with open(table_file, "rb") as ih:
+            header = ih.readline()
+            body = ih.read()
+    except FileNotFoundError:
+        print("%s is not exists" % table_file)
+        return None
+
+    if header.strip() == b"":
+        print("%s is empty, please check" % table_file)
+        return None
+    if body.strip() == b"":
+        return None
+
+    if not header.endswith(b"\n"):
+        header += b"\n"
+    if not body.endswith(b"\n"):
+        body += b"\n"
+    return header, body
+
+
+def parse_table_bytes(data, dtypes):
+    header = data[:data.index(b"\n")].decode().rstrip("\r").split("\t")
+    dtype = {k: v for k, v in dtypes.items() if k in header}
+    try:
+        return pd.read_csv(io.BytesIO(data), sep="\t", dtype=dtype)
+    except (ValueError, TypeError):
+        # missing values in an integer column, let pandas infer the dtypes
+        return pd.read_csv(io.BytesIO(data), sep="\t")
+
+
+def merge_tables(input_list, workers, dtypes=SEQKIT_STATS_DTYPES, batch_size=10000, **kwargs):
+    """
+    merge tsv tables with one header, like merge(input_list, parse, workers),
+    without a process per file: files are read on a thread pool, tables with
+    the same header are joined into batches of batch_size files and each batch
+    is parsed by one read_csv call
+
+    an empty input gives an empty table with the columns of dtypes, the
+    parquet output needs pyarrow or fastparquet
+    """
+    batches = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for table in executor.map(read_table, input_list):
+            if table is not None:
+                batches.setdefault(table[0], []).append(table[1])
+
+    df_list = []
+    for header, bodies in batches.items():
+        for i in range(0, len(bodies), batch_size):
+            df_list.append(parse_table_bytes(
+                header + b"".join(bodies[i:i + batch_size]), dtypes))
+
+    if len(df_list) > 0:
+        df_ = pd.concat(df_list, ignore_index=True)
+    else:
+        df_ = pd.DataFrame({k: pd.Series(dtype=v) for k, v in dtypes.items()})
+
+    if "output" in kwargs:
+        df_.to_csv(kwargs["output"], sep="\t", index=False)
+    if kwargs.get("output_parquet") is not None:
+        write_parquet(df_, kwargs["output_parquet"])
+    return df_
+
+
+def write_parquet(df, parquet_file):
+    """
+    parquet needs pyarrow or fastparquet, without them it is skipped
+    """
+    try:
+        df.to_parquet(parquet_file, index=False)
+    except ImportError as e:
+        print(f"can't write {parquet_file}: {e}")
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_header_body(path):
+    with open(path, "rb") as ih:
+        return ih.readline(), ih.read()
+
+
+def merge_stats_store(input_list, store, output, workers=1, output_parquet=None):
+    """
+    merge per-sample stats tables byte for byte like
+    `head -1 input[0] > output; tail -q -n +2 input >> output`
+
+    the header and rows of every table are kept in a pickled store, keyed by
+    path and (size, mtime) fingerprint, so a rerun only reads the tables which
+    are new or changed since the last merge, tables no longer in input_list
+    leave the store
+
+    every table must have the same header, an empty table is skipped,
+    output_parquet is a typed copy of the merged table
+
+    return the number of tables read
+    """
+    entries = {}
+    if os.path.exists(store):
+        try:
+            entries = load_pickle(store)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            print("%s is broken, rebuild it" % store)
+
+    fingerprints = {path: file_fingerprint(path) for path in input_list}
+    changed = [path for path in fingerprints
+               if (path not in entries) or (entries[path][0] != fingerprints[path])]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, (header, body) in zip(changed, executor.map(read_header_body, changed)):
+            entries[path] = (fingerprints[path], header, body)
+
+    stale = len(entries) - len(fingerprints)
+    entries = {path: entries[path] for path in fingerprints}
+
+    header = b""
+    for path in input_list:
+        if entries[path][1].strip() == b"":
+            continue
+        if header == b"":
+            header, first = entries[path][1], path
+        elif entries[path][1] != header:
+            raise ValueError("%s has a different header from %s:\n%s%s" % (
+                path, first, entries[path][1].decode(), header.decode()))
+
+    with open(output, "wb", buffering=WRITE_BUFFER) as oh:
+        oh.write(header)
+        for path in input_list:
+            oh.write(entries[path][2])
+
+    if (output_parquet is not None) and (header != b""):
+        data = header + b"".join(entries[path][2] for path in input_list)
+        write_parquet(parse_table_bytes(data, SEQKIT_STATS_DTYPES), output_parquet)
+
+    if (len(changed) > 0) or (stale > 0) or (not os.path.exists(store)):
+        os.makedirs(os.path.dirname(os.path.abspath(store)), exist_ok=True)
+        dump_pickle(entries, store)
+    return len(changed)
+
+
+def load_pickle(pickle_file):
+    with open(pickle_file, "rb") as ih:
+        return pickle.load(ih)
+
+
+def dump_pickle(obj, pickle_file):
+    """
+    write to a temp file in the same directory, then rename it into place,
+    so concurrent readers only ever see a complete pickle
+    """
+    fd, temp_file = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(pickle_file)),
+        prefix=os.path.basename(pickle_file) + ".",
+        suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as oh:
+            pickle.dump(obj, oh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, pickle_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
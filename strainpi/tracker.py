@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+
+import concurrent.futures
+import functools
+import os
+import pickle
+import re
+import time
+
+from strainpi import configer
+
+
+# per-sample manifests of a step: <output>/<dir>/{sample}/{sample}.json
+MANIFEST_DIRS = {
+    "raw": ["reads"],
+    "trimming": ["reads"],
+    "rmhost": ["reads"],
+    "alignment": ["bam/bowtie2", "bam/strobealign"],
+}
+
+CACHE_FILE = ".snakemake/strainpi/status.pickle"
+CACHE_VERSION = 2
+
+# a directory changed this recently may still get files within the same mtime tick
+MTIME_SLACK = 2
+
+# completions used to measure the throughput of a run
+RATE_WINDOW = 200
+
+RULE_RE = re.compile(r"^\s*(?:local)?(?:rule|checkpoint) (\S+):$")
+ERROR_RE = re.compile(r"^\s*Error in rule (\S+):$")
+JOBID_RE = re.compile(r"^\s+jobid: (\d+)$")
+WILDCARDS_RE = re.compile(r"^\s+wildcards: (?:.*, )?sample=([^,]+)")
+FINISHED_RE = re.compile(r"^\s*Finished job (\d+)\.$")
+PROGRESS_RE = re.compile(r"^\s*(\d+) of (\d+) steps \(.*\) done$")
+STATS_RE = re.compile(r"^(\S+)\s+(\d+)$")
+
+RULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules")
+SMK_RULE_RE = re.compile(r"^\s*(?:local)?rule (\w+):")
+BENCHMARK_DIR_RE = re.compile(r"config\[\"output\"\]\[\"(\w+)\"\],\s*\"benchmark/([^/\"]+)/")
+
+# benchmark directories of earlier releases, not named after their rule
+BENCHMARK_ALIASES = {"rmhost_bwotie2_index": "rmhost_bowtie2_index"}
+
+
+def is_target(rule):
+    return rule == "all" or rule.endswith("_all")
+
+
+@functools.lru_cache(maxsize=None)
+def benchmark_declarations():
+    """
+    {(step, benchmark directory): rule} of the benchmark: declarations of the rule files
+    """
+    declarations = {}
+    for smk in sorted(os.listdir(RULES_DIR)):
+        if not smk.endswith(".smk"):
+            continue
+        rule = None
+        with open(os.path.join(RULES_DIR, smk), "rt") as ih:
+            for line in ih:
+                matched = SMK_RULE_RE.match(line)
+                if matched is not None:
+                    rule = matched.group(1)
+                    continue
+                matched = BENCHMARK_DIR_RE.search(line)
+                if matched is not None and rule is not None:
+                    declarations[matched.groups()] = rule
+    return declarations
+
+
+def benchmark_dir_rules(workdir, conf):
+    """
+    {<output>/benchmark/<dir>: rule} of a project, alignment rules write their
+    benchmarks to a directory named after the aligner only
+    """
+    dir_rules = {}
+    for (step, name), rule in benchmark_declarations().items():
+        if step in conf["output"]:
+            dir_rules[os.path.join(workdir, conf["output"][step], "benchmark", name)] = rule
+    return dir_rules
+
+
+def benchmark_rule(rule_dir, dir_rules):
+    """
+    rule of a benchmark directory, its name when no rule declares it
+    """
+    name = os.path.basename(rule_dir)
+    return dir_rules.get(rule_dir, BENCHMARK_ALIASES.get(name, name))
+
+
+def scan_dir(path, cached=None, suffix="", stat=False):
+    """
+    ([mtime_ns, names without suffix], mtimes of the new names) of a directory,
+    the cached listing is returned as is when the directory didn't change
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None, []
+    if (cached is not None) and (cached[0] == mtime):
+        return cached, []
+
+    old = cached[1] if cached is not None else set()
+    names = set()
+    mtimes = []
+    with os.scandir(path) as it:
+        for entry in it:
+            name = entry.name[:-len(suffix)] if suffix and entry.name.endswith(suffix) else entry.name
+            names.add(name)
+            if stat and (name not in old):
+                try:
+                    mtimes.append(entry.stat().st_mtime)
+                except FileNotFoundError:
+                    pass
+    if time.time() - mtime / 1e9 < MTIME_SLACK:
+        mtime = -1
+    return [mtime, names], mtimes
+
+
+def check_manifest(root, sample, cached=None):
+    """
+    [mtime_ns of root/sample, whether root/sample/sample.json exists], the
+    cached check is returned as is when the directory didn't change, so a
+    manifest removed after it was seen is noticed
+    """
+    sample_dir = os.path.join(root, sample)
+    try:
+        mtime = os.stat(sample_dir).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if (cached is not None) and (cached[0] == mtime):
+        return cached
+    exists = os.path.exists(os.path.join(sample_dir, sample + ".json"))
+    if time.time() - mtime / 1e9 < MTIME_SLACK:
+        mtime = -1
+    return [mtime, exists]
+
+
+class snakemake_log:
+    """
+    jobs, failures and progress of the latest snakemake run, parsed from its
+    log incrementally, only the lines appended since the last call are read,
+    jobs are keyed by their sample, or by their rule without a sample wildcard
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.offset = 0
+        # jobid -> [rule, sample] of started jobs
+        self.started = {}
+        # rule -> keys
+        self.done = {}
+        self.failed = {}
+        self.finished_jobs = 0
+        self.failed_jobs = 0
+        self.stats = {}
+        self.progress = None
+        self.block = None
+
+    def update(self, path):
+        if path != self.path:
+            self.__init__(path)
+        if path is None:
+            return False
+
+        with open(path, "rb") as ih:
+            ih.seek(self.offset)
+            data = ih.read()
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+        for line in data[:end].decode(errors="replace").splitlines():
+            self.parse(line)
+        return end > 0
+
+    def end_job(self, jobid, states):
+        rule, sample = self.started.pop(jobid, [self.block[1], None])
+        key = sample or rule
+        for other in (self.done, self.failed):
+            if (other is not states) and (key in other.get(rule, ())):
+                other[rule].discard(key)
+        states.setdefault(rule, set()).add(key)
+
+    def parse(self, line):
+        if (self.block is not None) and (self.block[0] == "stats"):
+            matched = STATS_RE.match(line)
+            if matched is None:
+                return
+            if matched.group(1) == "total":
+                self.block = None
+            else:
+                self.stats[matched.group(1)] = int(matched.group(2))
+            return
+
+        if line == "Job stats:":
+            self.stats = {}
+            self.block = ["stats", None, None]
+            return
+
+        matched = RULE_RE.match(line)
+        if matched is not None:
+            self.block = ["job", matched.group(1), None]
+            return
+        matched = ERROR_RE.match(line)
+        if matched is not None:
+            self.block = ["error", matched.group(1), None]
+            return
+        matched = FINISHED_RE.match(line)
+        if matched is not None:
+            jobid = int(matched.group(1))
+            if jobid in self.started:
+                self.end_job(jobid, self.done)
+            self.finished_jobs += 1
+            return
+        matched = PROGRESS_RE.match(line)
+        if matched is not None:
+            self.progress = [int(matched.group(1)), int(matched.group(2))]
+            return
+
+        if self.block is None:
+            return
+        matched = JOBID_RE.match(line)
+        if matched is not None:
+            jobid = int(matched.group(1))
+            self.block[2] = jobid
+            if self.block[0] == "error":
+                self.end_job(jobid, self.failed)
+                self.failed_jobs += 1
+                self.block = None
+            else:
+                self.started[jobid] = [self.block[1], None]
+            return
+        matched = WILDCARDS_RE.match(line)
+        if (matched is not None) and (self.block[2] in self.started):
+            self.started[self.block[2]][1] = matched.group(1).strip()
+
+
+def read_samples(samples_tsv):
+    with open(samples_tsv, "rt") as ih:
+        header = ih.readline().rstrip("\r\n").split("\t")
+        col = header.index("sample_id")
+        samples = (line.rstrip("\r\n").split("\t")[col] for line in ih if line.strip())
+        return list(dict.fromkeys(samples))
+
+
+def latest_log(workdir):
+    log_dir = os.path.join(workdir, ".snakemake/log")
+    if not os.path.isdir(log_dir):
+        return None
+    logs = sorted(f for f in os.listdir(log_dir) if f.endswith(".snakemake.log"))
+    return os.path.join(log_dir, logs[-1]) if logs else None
+
+
+def is_running(workdir):
+    locks = os.path.join(workdir, ".snakemake/locks")
+    return os.path.isdir(locks) and len(os.listdir(locks)) > 0
+
+
+def load_cache(cache_file):
+    try:
+        with open(cache_file, "rb") as ih:
+            cache = pickle.load(ih)
+        if cache.get("version") == CACHE_VERSION:
+            return cache
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+        pass
+    return {"version": CACHE_VERSION, "samples": None, "dirs": {}, "manifests": {},
+            "recent": [], "log": snakemake_log()}
+
+
+def save_cache(cache, cache_file):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    with open(cache_file + ".tmp", "wb") as oh:
+        pickle.dump(cache, oh, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(cache_file + ".tmp", cache_file)
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "-"
+    seconds = int(seconds)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return "%s%02d:%02d:%02d" % ("%dd " % days if days else "", hours, minutes, seconds)
+
+
+def project_status(workdir="./", config=None, threads=16, refresh=False, per_sample=False):
+    """
+    per-step and per-rule progress of a strainpi project, from the benchmark
+    files, the {sample}.json manifests and the latest snakemake log, nothing
+    asks snakemake to build the DAG. Directories are listed in parallel and
+    cached by their mtime between calls, only what changed is read again
+    """
+    workdir = os.path.realpath(workdir)
+    config = config or os.path.join(workdir, "config.yaml")
+    conf = configer.parse_yaml(config)
+
+    cache_file = os.path.join(workdir, CACHE_FILE)
+    cache = load_cache(cache_file if not refresh else "")
+    changed = refresh
+
+    samples_tsv = os.path.join(workdir, conf["params"]["samples"])
+    samples_mtime = os.stat(samples_tsv).st_mtime_ns
+    if (cache["samples"] is None) or (cache["samples"][:2] != [samples_tsv, samples_mtime]):
+        cache["samples"] = [samples_tsv, samples_mtime, read_samples(samples_tsv)]
+        changed = True
+    samples = cache["samples"][2]
+    samples_set = set(samples)
+
+    outputs = [os.path.join(workdir, out) for out in dict.fromkeys(conf["output"].values())]
+    # step name -> manifest root, steps with several roots are named step:dir
+    manifest_roots = {}
+    for step in MANIFEST_DIRS:
+        if step not in conf["output"]:
+            continue
+        for d in MANIFEST_DIRS[step]:
+            name = step if len(MANIFEST_DIRS[step]) == 1 else "%s:%s" % (step, os.path.basename(d))
+            manifest_roots[name] = os.path.join(workdir, conf["output"][step], d)
+
+    old_dirs = cache["dirs"]
+    dirs = {}
+    new_mtimes = []
+
+    def scan(paths, **kwargs):
+        for path, (listing, mtimes) in zip(paths, executor.map(
+                lambda d: scan_dir(d, old_dirs.get(d), **kwargs), paths)):
+            if listing is not None:
+                dirs[path] = listing
+            new_mtimes.extend(mtimes)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        # benchmark/ and manifest roots, then benchmark/<rule>/
+        bench_roots = [os.path.join(out, "benchmark") for out in outputs]
+        scan(bench_roots + list(manifest_roots.values()))
+        rule_dirs = [os.path.join(root, rule)
+                     for root in bench_roots if root in dirs for rule in sorted(dirs[root][1])]
+        scan(rule_dirs, suffix=".txt", stat=True)
+
+        # manifests, only sample directories which changed are checked again
+        checks = {}
+        manifests = {}
+        for root in manifest_roots.values():
+            if root not in dirs:
+                continue
+            candidates = sorted(samples_set.intersection(dirs[root][1]))
+            old_checks = cache["manifests"].get(root, {})
+            found = executor.map(
+                lambda s, root=root, old_checks=old_checks: check_manifest(root, s, old_checks.get(s)),
+                candidates)
+            checks[root] = {s: check for s, check in zip(candidates, found) if check is not None}
+            manifests[root] = {s for s, check in checks[root].items() if check[1]}
+
+    changed = changed or len(old_dirs) != len(dirs) or \
+        any(old_dirs.get(d) is not listing for d, listing in dirs.items()) or \
+        checks != cache["manifests"]
+
+    log = cache["log"]
+    changed = log.update(latest_log(workdir)) or changed
+    running = is_running(workdir)
+
+    # rule -> done keys
+    rules = {}
+    dir_rules = benchmark_dir_rules(workdir, conf)
+    for rule_dir in rule_dirs:
+        if rule_dir in dirs:
+            rules.setdefault(benchmark_rule(rule_dir, dir_rules), set()).update(dirs[rule_dir][1])
+    for rule, keys in log.done.items():
+        rules[rule] = rules.get(rule, set()) | keys
+    started = {}
+    for rule, sample in log.started.values():
+        started.setdefault(rule, set()).add(sample or rule)
+    for rule in list(log.failed) + list(started) + list(log.stats):
+        rules.setdefault(rule, set())
+
+    status = {
+        "workdir": workdir,
+        "samples": len(samples),
+        "snakemake_running": running,
+        "snakemake_log": log.path,
+        "snakemake_progress": log.progress,
+        "steps": {},
+        "rules": {},
+        "failed": [],
+    }
+
+    steps = {name: root for name, root in manifest_roots.items() if root in manifests}
+    for name, root in steps.items():
+        status["steps"][name] = {"done": len(manifests[root]), "total": len(samples)}
+
+    # rule -> (failed keys, running keys)
+    states = {}
+    total_jobs = done_jobs = 0
+    for rule in sorted(rules):
+        if is_target(rule):
+            continue
+        done = rules[rule]
+        failed = log.failed.get(rule, set()) - done
+        running_keys = started.get(rule, set()) - done - failed if running else set()
+        if not samples_set.isdisjoint(done | failed | running_keys):
+            done = done & samples_set
+            total = len(samples)
+        else:
+            total = max(len(done | failed | running_keys), log.stats.get(rule, 1))
+        states[rule] = (failed, running_keys)
+        status["rules"][rule] = {
+            "done": len(done),
+            "running": len(running_keys),
+            "failed": len(failed),
+            "total": total
+        }
+        status["failed"] += [[rule, key] for key in sorted(failed)]
+        total_jobs += total
+        done_jobs += len(done)
+
+    status["jobs"] = {"done": done_jobs, "total": total_jobs}
+
+    # throughput of the latest completions, the remaining jobs of the
+    # running snakemake come from its job stats
+    cache["recent"] = sorted(cache["recent"] + new_mtimes)[-RATE_WINDOW:]
+    recent = cache["recent"]
+    status["rate"] = None
+    status["eta"] = None
+    if running and len(recent) > 1 and recent[-1] > recent[0]:
+        status["rate"] = (len(recent) - 1) / (recent[-1] - recent[0])
+        remaining = total_jobs - done_jobs
+        if log.stats:
+            remaining = sum(log.stats.values()) - log.finished_jobs - log.failed_jobs
+        status["eta"] = max(remaining, 0) / status["rate"]
+
+    if per_sample:
+        status["per_sample"] = {}
+        for sample in samples:
+            status["per_sample"][sample] = {
+                "steps": {name: sample in manifests[root] for name, root in steps.items()},
+                "failed": [rule for rule in states if sample in states[rule][0]],
+                "running": [rule for rule in states if sample in states[rule][1]]
+            }
+
+    if changed:
+        cache["dirs"] = dirs
+        cache["manifests"] = checks
+        try:
+            save_cache(cache, cache_file)
+        except OSError:
+            pass
+
+    return status
+
+
+def print_status(status, oh):
+    print("strainpi status of %s" % status["workdir"], file=oh)
+    print("samples: %d, snakemake: %s" % (
+        status["samples"], "running" if status["snakemake_running"] else "not running"), file=oh)
+    if status["snakemake_progress"] is not None:
+        done, total = status["snakemake_progress"]
+        print("latest run: %d of %d steps (%.0f%%) done" % (
+            done, total, 100 * done / total if total > 0 else 100), file=oh)
+
+    if status["steps"]:
+        print("\n%-24s %10s %10s %8s" % ("step", "samples", "total", "percent"), file=oh)
+        for step, counts in status["steps"].items():
+            print("%-24s %10d %10d %7.2f%%" % (
+                step, counts["done"], counts["total"],
+                100 * counts["done"] / counts["total"] if counts["total"] > 0 else 0), file=oh)
+
+    print("\n%-32s %10s %10s %10s %10s %8s" % (
+        "rule", "done", "running", "failed", "total", "percent"), file=oh)
+    for rule, counts in status["rules"].items():
+        print("%-32s %10d %10d %10d %10d %7.2f%%" % (
+            rule, counts["done"], counts["running"], counts["failed"], counts["total"],
+            100 * counts["done"] / counts["total"] if counts["total"] > 0 else 0), file=oh)
+    jobs = status["jobs"]
+    print("%-32s %10d %10s %10s %10d %7.2f%%" % (
+        "total", jobs["done"], "", "", jobs["total"],
+        100 * jobs["done"] / jobs["total"] if jobs["total"] > 0 else 0), file=oh)
+
+    if status["failed"]:
+        print("\nfailed jobs (see the latest snakemake log: %s):" % status["snakemake_log"], file=oh)
+        for rule, key in status["failed"][:20]:
+            print("    %s %s" % (rule, key), file=oh)
+        if len(status["failed"]) > 20:
+            print("    ... %d more" % (len(status["failed"]) - 20), file=oh)
+
+    if status["rate"] is not None:
+        print("\nthroughput: %.2f jobs/min, ETA: %s" % (
+            status["rate"] * 60, format_eta(status["eta"])), file=oh)
+
+
+def write_per_sample(status, oh):
+    steps = list(status["steps"])
+    oh.write("\t".join(["sample_id"] + steps + ["failed", "running"]) + "\n")
+    for sample, info in status["per_sample"].items():
+        oh.write("\t".join(
+            [sample] +
+            ["done" if info["steps"][step] else "" for step in steps] +
+            [",".join(info["failed"]), ",".join(info["running"])]) + "\n")
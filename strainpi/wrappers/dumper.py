@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import argparse
+import collections
+import concurrent.futures
+import os
+import subprocess
+import sys
+import threading
+import zlib
+
+import pairer
+
+
+# pending compressed batches per run, bounds the memory of a slow writer
+MAX_PENDING = 8
+
+
+def gzip_member(data, level=6):
+    """
+    compress one batch into a standalone gzip member,
+    concatenated members are still one valid gzip file
+    """
+    if not data:
+        return b""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def deinterleave(batches):
+    """
+    --split-spot writes the mates of a spot as consecutive records with the
+    same name, pair them up and drop the spots with only one mate left,
+    like `fasterq-dump --split-3` does
+    """
+    carry = None
+    for lines in batches:
+        r1 = []
+        r2 = []
+        for i in range(0, len(lines), 4):
+            name = lines[i].split(None, 1)[0]
+            if (carry is not None) and (carry[0] == name):
+                r1 += carry[1]
+                r2 += lines[i:i + 4]
+                carry = None
+            else:
+                carry = (name, lines[i:i + 4])
+        yield [r1, r2]
+
+
+def join_lines(lines):
+    return b"\n".join(lines) + b"\n" if lines else b""
+
+
+def dump_run(sra, outputs, handles, lock, executor, threads, temp_dir, log, stats):
+    """
+    stream one run from fasterq-dump, compress batches on the shared pool and
+    append them to the final files, R1 and R2 members of a batch are appended
+    together so the mates of different runs never interleave out of order
+    """
+    cmd = ["fasterq-dump", "--stdout", "--threads", str(threads),
+           "--temp", temp_dir]
+    if len(outputs) == 2:
+        cmd.append("--split-spot")
+    cmd.append(sra)
+
+    with open(log, "ab") as log_h:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=log_h,
+                                bufsize=pairer.CHUNK_SIZE)
+
+    batches = pairer.split_records(proc.stdout, sra)
+    if len(outputs) == 2:
+        batches = deinterleave(batches)
+    else:
+        batches = ([lines] for lines in batches)
+
+    pending = collections.deque()
+
+    def append(future):
+        members = future.result()
+        with lock:
+            for oh, member in zip(handles, members):
+                oh.write(member)
+
+    reads = 0
+    try:
+        for batch in batches:
+            reads += len(batch[0]) // 4
+            if stats is not None:
+                with lock:
+                    for s, lines in zip(stats, batch):
+                        s.update(lines)
+            pending.append(executor.submit(
+                lambda batch: [gzip_member(join_lines(lines)) for lines in batch], batch))
+            if len(pending) >= MAX_PENDING:
+                append(pending.popleft())
+        while pending:
+            append(pending.popleft())
+    finally:
+        proc.stdout.close()
+        proc.wait()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+    print(f"{sra}: {reads} reads")
+    return reads
+
+
+def dump_sra(sras, outputs, threads, temp_dir, log, stats=None):
+    """
+    dump several runs of one sample concurrently, straight to the final
+    gzip files: one for single-end or long reads, two for paired-end reads,
+    stats of the outputs (seqstats.record_counter) are updated on the way
+    """
+    jobs = max(1, min(len(sras), threads // 4))
+    dump_threads = max(1, threads // (2 * jobs))
+    compress_threads = max(1, threads // 2)
+
+    os.makedirs(temp_dir, exist_ok=True)
+    handles = [open(output, "wb") for output in outputs]
+    lock = threading.Lock()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(compress_threads) as executor, \
+             concurrent.futures.ThreadPoolExecutor(jobs) as runner:
+            futures = [
+                runner.submit(dump_run, sra, outputs, handles, lock, executor,
+                              dump_threads, temp_dir, log, stats)
+                for sra in sras]
+            reads = sum(future.result() for future in futures)
+    finally:
+        for oh in handles:
+            oh.close()
+    return reads
+
+
+def main():
+    parser = argparse.ArgumentParser("strainpi dumper")
+    parser.add_argument("--sra", dest="sra", nargs="+", help="local sra files of one sample")
+    parser.add_argument("--output", dest="output", nargs="+",
+                        help="one output for single-end/long reads, two for paired-end reads")
+    parser.add_argument("--temp-dir", dest="temp_dir", default=".")
+    parser.add_argument("--log", dest="log", default=os.devnull)
+    parser.add_argument("--threads", dest="threads", type=int, default=8)
+    args = parser.parse_args()
+
+    if len(args.output) not in (1, 2):
+        print("please specific one or two outputs")
+        sys.exit(1)
+
+    dump_sra(args.sra, args.output, args.threads, args.temp_dir, args.log)
+
+
+if __name__ == "__main__":
+    main()
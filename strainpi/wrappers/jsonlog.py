@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+
+# snakemake --log-handler-script, every log message of snakemake is written as
+# one json line to the file descriptor in STRAINPI_LOG_FD, strainpi.api reads
+# them to follow a run
+
+import json
+import os
+
+
+LOG_FD = int(os.environ.get("STRAINPI_LOG_FD", "-1"))
+LOG_HANDLE = os.fdopen(LOG_FD, "wt", buffering=1) if LOG_FD >= 0 else None
+
+# snakemake shell commands don't inherit the pipe, but keep it out of their env
+os.environ.pop("STRAINPI_LOG_FD", None)
+
+
+def log_handler(msg):
+    if LOG_HANDLE is None:
+        return
+    try:
+        LOG_HANDLE.write(json.dumps(msg, default=str) + "\n")
+    except (BrokenPipeError, ValueError):
+        # nobody is listening anymore, snakemake keeps running
+        pass
@@ -2,10 +2,41 @@
 
 import os
 import argparse
+import shutil
 import subprocess
 import sys
 
 
+def concat_files(input_files, output_file):
+    """
+    cat input_files > output_file, with copy_file_range the kernel copies
+    inside the filesystem (a reflink on btrfs/xfs/nfs4.2), the data never
+    passes through user space, fall back to a buffered copy when it is not
+    supported
+    """
+    with open(output_file, "wb") as oh:
+        for input_file in input_files:
+            # copy_file_range writes at the fd offset, flush the buffered writes first
+            oh.flush()
+            with open(input_file, "rb") as ih:
+                size = os.fstat(ih.fileno()).st_size
+                copied = 0
+                try:
+                    while copied < size:
+                        n = os.copy_file_range(ih.fileno(), oh.fileno(), size - copied)
+                        if n == 0:
+                            break
+                        copied += n
+                except (AttributeError, OSError):
+                    # cross filesystem on old kernels, or no copy_file_range at all
+                    ih.seek(copied)
+                    shutil.copyfileobj(ih, oh, 1 << 20)
+                    continue
+                # size changed while copying
+                if copied < size:
+                    shutil.copyfileobj(ih, oh, 1 << 20)
+
+
 def link_or_cat(args):
     fq_gz = os.path.join(args.output_dir, args.basename + ".fq.gz")
 
@@ -23,11 +54,7 @@ def link_or_cat(args):
                 popd
                 ''', shell=True, stdout=sys.stdout, stderr=sys.stderr)
         else:
-            reads = " ".join(args.input_file)
-            subprocess.call(
-                f'''
-                cat {reads} > {args.output_dir}/{args.basename}.fq.gz
-                ''', shell=True, stdout=sys.stdout, stderr=sys.stderr)
+            concat_files(args.input_file, fq_gz)
 
 
 def main():
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+
+import argparse
+import gzip
+import heapq
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+
+CHUNK_SIZE = 1 << 22
+
+# records per sorted run of the external sort fallback
+SORT_RUN_SIZE = 1 << 18
+
+# runs merged at once, both mates are merged together, so twice as many files are open
+MERGE_FAN_IN = 64
+
+
+def open_fastq(fqs, threads=1):
+    """
+    open one or more (concatenated) fastq files for binary reading,
+    decompress with pigz in a separate process when it is available
+    """
+    if isinstance(fqs, str):
+        fqs = [fqs]
+
+    pigz = shutil.which("pigz")
+    if all(fq.endswith(".gz") for fq in fqs) and (pigz is not None):
+        proc = subprocess.Popen(
+            [pigz, "-dc", "-p", str(threads)] + list(fqs),
+            stdout=subprocess.PIPE, bufsize=CHUNK_SIZE)
+        return proc.stdout, proc
+
+    if len(fqs) == 1:
+        if fqs[0].endswith(".gz"):
+            return gzip.open(fqs[0], "rb"), None
+        return open(fqs[0], "rb"), None
+
+    proc = subprocess.Popen(
+        ["zcat" if fqs[0].endswith(".gz") else "cat"] + list(fqs),
+        stdout=subprocess.PIPE, bufsize=CHUNK_SIZE)
+    return proc.stdout, proc
+
+
+def split_records(ih, name):
+    """
+    yield batches of fastq lines read from a binary stream,
+    each batch holds whole records only
+    """
+    rest = b""
+    while True:
+        chunk = ih.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        lines = (rest + chunk).split(b"\n")
+        complete = len(lines) - 1
+        complete -= complete % 4
+        rest = b"\n".join(lines[complete:])
+        yield lines[:complete]
+
+    lines = rest.split(b"\n")
+    if lines[-1] == b"":
+        lines.pop()
+    if len(lines) % 4 != 0:
+        raise ValueError(f"{name} is truncated, the last record is incomplete")
+    if lines:
+        yield lines
+
+
+def read_records(fqs, threads=1):
+    """
+    yield batches of fastq lines, each batch holds whole records only
+    """
+    ih, proc = open_fastq(fqs, threads)
+    finished = False
+    try:
+        yield from split_records(ih, fqs)
+        finished = True
+    finally:
+        ih.close()
+        if proc is not None:
+            if not finished:
+                # closed early, the decompressor may block on a full pipe
+                proc.kill()
+            proc.wait()
+            if finished and (proc.returncode not in (0, -13)):
+                raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+
+def threaded(generator, maxsize=4):
+    """
+    run a generator in its own thread, so R1 and R2 are decompressed
+    and split at the same time
+    """
+    batches = queue.Queue(maxsize=maxsize)
+    done = object()
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def worker():
+        try:
+            for batch in generator:
+                if not put(batch):
+                    break
+        except BaseException as e:
+            put(e)
+        finally:
+            # when the consumer stops early, close the source and its decompressor
+            generator.close()
+        put(done)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            batch = batches.get()
+            if batch is done:
+                break
+            if isinstance(batch, BaseException):
+                raise batch
+            yield batch
+    finally:
+        stop.set()
+        thread.join()
+
+
+def normalize_ids(headers, suffix):
+    """
+    '@read_1/1 comment' -> '@read_1', same as `seqkit seq -ni | sed 's#/1$##g'`
+    """
+    ids = [header.split(None, 1)[0] for header in headers]
+    return [i[:-2] if i.endswith(suffix) else i for i in ids]
+
+
+def read_ids(fqs, suffix, threads=1, stats=None):
+    records = read_records(fqs, threads)
+    try:
+        for lines in records:
+            if stats is not None:
+                stats.update(lines)
+            yield normalize_ids(lines[0::4], suffix)
+    finally:
+        records.close()
+
+
+def check_pairs(r1, r2, threads=2, stats=(None, None)):
+    """
+    compare normalized read ids of R1 and R2 in lockstep, nothing is written to disk,
+    stats of R1 and R2 (seqstats.record_counter) are updated on the way and are
+    complete when the pairs are in sync
+    return (paired, pairs checked, index of the first out-of-sync pair or None)
+    """
+    decompress_threads = max(1, threads // 2)
+    ids_1 = threaded(read_ids(r1, b"/1", decompress_threads, stats[0]))
+    ids_2 = threaded(read_ids(r2, b"/2", decompress_threads, stats[1]))
+    try:
+        return compare_ids(ids_1, ids_2)
+    finally:
+        ids_1.close()
+        ids_2.close()
+
+
+def compare_ids(ids_1, ids_2):
+    checked = 0
+    batch_1 = []
+    batch_2 = []
+    while True:
+        while not batch_1:
+            batch_1 = next(ids_1, None)
+            if batch_1 is None:
+                break
+        while not batch_2:
+            batch_2 = next(ids_2, None)
+            if batch_2 is None:
+                break
+
+        if (batch_1 is None) or (batch_2 is None):
+            # one of them ends early
+            if (batch_1 is None) and (batch_2 is None):
+                return True, checked, None
+            return False, checked, checked
+
+        n = min(len(batch_1), len(batch_2))
+        if batch_1[:n] != batch_2[:n]:
+            for i in range(n):
+                if batch_1[i] != batch_2[i]:
+                    return False, checked, checked + i
+
+        checked += n
+        batch_1 = batch_1[n:]
+        batch_2 = batch_2[n:]
+
+
+class BufferOverflow(Exception):
+    pass
+
+
+def open_gzip_writer(fq, threads=1, level=6):
+    """
+    compress with pigz (gzip) or bgzip (BGZF) in a separate process when
+    one of them is available, python gzip otherwise
+    """
+    for compressor in (["pigz", "-c", f"-{level}", "-p"], ["bgzip", "-c", "-l", str(level), "-@"]):
+        path = shutil.which(compressor[0])
+        if path is not None:
+            oh = open(fq, "wb")
+            proc = subprocess.Popen(
+                [path] + compressor[1:] + [str(threads)],
+                stdin=subprocess.PIPE, stdout=oh, bufsize=CHUNK_SIZE)
+            oh.close()
+            return proc.stdin, proc
+    return gzip.open(fq, "wb", compresslevel=level), None
+
+
+def close_gzip_writer(oh, proc):
+    oh.close()
+    if proc is not None:
+        proc.wait()
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+
+def read_fastq(fqs, suffix, threads=1):
+    """
+    yield (normalized id, record) in file order
+    """
+    batches = threaded(read_records(fqs, threads))
+    try:
+        for lines in batches:
+            for i in range(0, len(lines), 4):
+                header = lines[i]
+                read_id = header.split(None, 1)[0]
+                if read_id.endswith(suffix):
+                    read_id = read_id[:-2]
+                yield read_id, b"\n".join(lines[i:i + 4]) + b"\n"
+    finally:
+        batches.close()
+
+
+def join_buffered(records_1, records_2, buffer_size):
+    """
+    merge-join two locally disordered streams, a record waits in its
+    pending dict until its mate shows up, records left at the end have
+    no mate and are dropped
+
+    raise BufferOverflow when more than buffer_size records are pending
+    """
+    pending_1 = {}
+    pending_2 = {}
+    while True:
+        id_1, rec_1 = next(records_1, (None, None))
+        if id_1 is None:
+            break
+        id_2, rec_2 = next(records_2, (None, None))
+        if id_2 is None:
+            # records_2 ends early
+            mate_2 = pending_2.pop(id_1, None)
+            if mate_2 is not None:
+                yield rec_1, mate_2
+            break
+
+        if id_1 == id_2:
+            yield rec_1, rec_2
+            continue
+
+        mate_2 = pending_2.pop(id_1, None)
+        if mate_2 is None:
+            pending_1[id_1] = rec_1
+        else:
+            yield rec_1, mate_2
+
+        mate_1 = pending_1.pop(id_2, None)
+        if mate_1 is None:
+            pending_2[id_2] = rec_2
+        else:
+            yield mate_1, rec_2
+
+        if len(pending_1) + len(pending_2) > buffer_size:
+            raise BufferOverflow(
+                f"more than {buffer_size} reads are waiting for their mates")
+
+    # one file is longer than the other
+    for id_1, rec_1 in records_1:
+        mate_2 = pending_2.pop(id_1, None)
+        if mate_2 is not None:
+            yield rec_1, mate_2
+    for id_2, rec_2 in records_2:
+        mate_1 = pending_1.pop(id_2, None)
+        if mate_1 is not None:
+            yield mate_1, rec_2
+
+
+def sorted_runs(records, temp_dir):
+    """
+    external sort, step one: write sorted runs of SORT_RUN_SIZE records
+    """
+    runs = []
+    run = []
+
+    def flush():
+        run.sort(key=lambda x: x[0])
+        with tempfile.NamedTemporaryFile(
+            dir=temp_dir, suffix=".run", delete=False) as oh:
+            for _, record in run:
+                oh.write(record)
+        runs.append(oh.name)
+        run.clear()
+
+    for record in records:
+        run.append(record)
+        if len(run) >= SORT_RUN_SIZE:
+            flush()
+    if run:
+        flush()
+    return runs
+
+
+def read_run(run, suffix):
+    with open(run, "rb") as ih:
+        while True:
+            record = b"".join(ih.readline() for _ in range(4))
+            if not record:
+                break
+            read_id = record.split(None, 1)[0]
+            if read_id.endswith(suffix):
+                read_id = read_id[:-2]
+            yield read_id, record
+
+
+def merge_runs(runs, suffix, temp_dir):
+    """
+    external sort, step two: merge runs MERGE_FAN_IN at a time into longer runs
+    until one pass is left, return the records of that last pass
+    """
+    while len(runs) > MERGE_FAN_IN:
+        merged = []
+        for i in range(0, len(runs), MERGE_FAN_IN):
+            group = runs[i:i + MERGE_FAN_IN]
+            with tempfile.NamedTemporaryFile(
+                dir=temp_dir, suffix=".run", delete=False) as oh:
+                for _, record in heapq.merge(*[read_run(run, suffix) for run in group],
+                                             key=lambda x: x[0]):
+                    oh.write(record)
+            merged.append(oh.name)
+            for run in group:
+                os.remove(run)
+        runs = merged
+    return heapq.merge(*[read_run(run, suffix) for run in runs], key=lambda x: x[0])
+
+
+def join_sorted(records_1, records_2):
+    """
+    merge-join two streams sorted by id
+    """
+    id_1, rec_1 = next(records_1, (None, None))
+    id_2, rec_2 = next(records_2, (None, None))
+    while (id_1 is not None) and (id_2 is not None):
+        if id_1 == id_2:
+            yield rec_1, rec_2
+            id_1, rec_1 = next(records_1, (None, None))
+            id_2, rec_2 = next(records_2, (None, None))
+        elif id_1 < id_2:
+            id_1, rec_1 = next(records_1, (None, None))
+        else:
+            id_2, rec_2 = next(records_2, (None, None))
+
+
+def write_pairs(pairs, out_1, out_2, threads=2):
+    compress_threads = max(1, threads // 2)
+    oh_1, proc_1 = open_gzip_writer(out_1, compress_threads)
+    oh_2, proc_2 = open_gzip_writer(out_2, compress_threads)
+    count = 0
+    try:
+        for rec_1, rec_2 in pairs:
+            oh_1.write(rec_1)
+            oh_2.write(rec_2)
+            count += 1
+    finally:
+        close_gzip_writer(oh_1, proc_1)
+        close_gzip_writer(oh_2, proc_2)
+    return count
+
+
+def resync_pairs(r1, r2, out_1, out_2, threads=2, buffer_size=1000000, temp_dir=None):
+    """
+    write the reads which have a mate in both files to out_1 and out_2,
+    keep a bounded look-ahead buffer for locally disordered or missing reads,
+    fall back to an external sort of both files when the buffer overflows
+
+    return the number of pairs written
+    """
+    decompress_threads = max(1, threads // 2)
+    records_1 = read_fastq(r1, b"/1", decompress_threads)
+    records_2 = read_fastq(r2, b"/2", decompress_threads)
+    try:
+        return write_pairs(join_buffered(records_1, records_2, buffer_size), out_1, out_2, threads)
+    except BufferOverflow as e:
+        print(f"{e}, falling back to external sort")
+    finally:
+        records_1.close()
+        records_2.close()
+
+    temp_dir = tempfile.mkdtemp(
+        prefix="pairer.", dir=temp_dir or os.path.dirname(os.path.abspath(out_1)))
+    try:
+        runs_1 = sorted_runs(read_fastq(r1, b"/1", decompress_threads), temp_dir)
+        runs_2 = sorted_runs(read_fastq(r2, b"/2", decompress_threads), temp_dir)
+        return write_pairs(
+            join_sorted(
+                merge_runs(runs_1, b"/1", temp_dir),
+                merge_runs(runs_2, b"/2", temp_dir)),
+            out_1, out_2, threads)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser("strainpi pairer")
+    parser.add_argument("--r1", dest="r1", nargs="+", help="forward reads")
+    parser.add_argument("--r2", dest="r2", nargs="+", help="reverse reads")
+    parser.add_argument("--out1", dest="out1", help="resynced forward reads")
+    parser.add_argument("--out2", dest="out2", help="resynced reverse reads")
+    parser.add_argument("--buffer-size", dest="buffer_size", type=int, default=1000000,
+                        help="max reads waiting for their mates before falling back to external sort")
+    parser.add_argument("--threads", dest="threads", type=int, default=2)
+    args = parser.parse_args()
+
+    paired, checked, mismatch = check_pairs(args.r1, args.r2, args.threads)
+    if paired:
+        print(f"{checked} pairs are in sync")
+    else:
+        print(f"pairs are out of sync from pair {mismatch}")
+        if args.out1 and args.out2:
+            pairs = resync_pairs(args.r1, args.r2, args.out1, args.out2,
+                                 args.threads, args.buffer_size)
+            print(f"{pairs} pairs are written")
+        else:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,32 @@
 #!/usr/bin/env python
 
 import os
-import filecmp
+import atexit
+import concurrent.futures
 import json
-from executor import execute
+import shutil
+import signal
+import sys
+import tempfile
 from pprint import pprint
 
+import dumper
+import misc
+import pairer
+import seqstats
+from runner import pipeline_runner
+
 
 sample_id = str(snakemake.params.sample_id)
 input_files = snakemake.params.input_files
 headers = snakemake.params.headers
 check_paired = snakemake.params.check_paired
+resync_buffer = int(snakemake.params.resync_buffer)
+sra_stream = snakemake.params.sra_stream
+virtual_input = snakemake.params.virtual_input
+scratch_dir = os.path.expandvars(str(snakemake.params.scratch_dir))
+inline_stats = snakemake.params.inline_stats
+fq_encoding = str(snakemake.params.fq_encoding)
 
 threads = int(snakemake.threads)
 log = str(snakemake.log)
@@ -25,10 +41,6 @@ outdir_pe = os.path.join(outdir, "pe")
 outdir_se = os.path.join(outdir, "se")
 outdir_long = os.path.join(outdir, "long")
 
-outdir_pe_temp = os.path.join(outdir, "pe_temp")
-outdir_se_temp = os.path.join(outdir, "se_temp")
-outdir_long_temp = os.path.join(outdir, "long_temp")
-
 is_fastq = True
 input_tags = input_files.keys()
 for k in input_tags:
@@ -41,13 +53,49 @@ r2 = os.path.join(outdir_pe, f"{sample_id}.raw.pe.2.fq.gz")
 rs = os.path.join(outdir_se, f"{sample_id}.raw.se.fq.gz")
 rl = os.path.join(outdir_long, f"{sample_id}.raw.long.fq.gz")
 
-# temp file
+# temp file, on node-local scratch, removed however the job ends
+if (scratch_dir == "") or ("$" in scratch_dir):
+    scratch_dir = tempfile.gettempdir()
+os.makedirs(scratch_dir, exist_ok=True)
+scratch = tempfile.mkdtemp(prefix="strainpi_scratch.", dir=scratch_dir)
+atexit.register(shutil.rmtree, scratch, ignore_errors=True)
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+
+# concatenated reads, fasterq-dump outputs and their compression stay in
+# scratch, only the final gz is moved to outdir
+outdir_pe_temp = os.path.join(scratch, "pe_temp")
+outdir_se_temp = os.path.join(scratch, "se_temp")
+outdir_long_temp = os.path.join(scratch, "long_temp")
+
+# every sub-step is timed into {sample}.steps.json next to the manifest
+runner = pipeline_runner(os.path.join(outdir, f"{sample_id}.steps.json"))
+execute = runner.execute
+atexit.register(lambda: os.path.isdir(outdir) and runner.dump())
+
 execute(f'''rm -rf {outdir}''')
 execute(f'''mkdir -p {outdir}''')
 execute(f'''rm -rf {log}''')
 
 samples_dict ={}
 
+# seqkit stats of the final reads, counted while they stream by
+seq_stats = {}
+
+
+def new_stats(*fqs):
+    if not inline_stats:
+        return None
+    return [seqstats.record_counter(os.path.basename(fq), fq_encoding) for fq in fqs]
+
+
+def add_virtual(key, sources, recipe):
+    # reads of key are produced on the fly from sources by the rules, see reads.sh
+    samples_dict.setdefault("VIRTUAL", {})[key] = {
+        "sources": [os.path.realpath(fq) for fq in sources],
+        "recipe": recipe
+    }
+
+
 if is_fastq:
     if headers["FQ"]["PE_FORWARD"] in input_tags:
         samples_dict["PE_FORWARD"] = r1
@@ -58,76 +106,50 @@ if is_fastq:
 
         r1_temp = os.path.join(outdir_pe_temp, f"{sample_id}.raw.temp.1.gz")
         r2_temp = os.path.join(outdir_pe_temp, f"{sample_id}.raw.temp.2.gz")
-        r1_temp_p = os.path.join(outdir_pe_temp, f"{sample_id}.raw.temp.try_pe.1.gz")
-        r2_temp_p = os.path.join(outdir_pe_temp, f"{sample_id}.raw.temp.try_pe.2.gz")
 
         forward_reads = input_files[headers["FQ"]["PE_FORWARD"]]
         reverse_reads = input_files[headers["FQ"]["PE_REVERSE"]]
-        if len(forward_reads) == 1:
+        virtual = virtual_input and (len(forward_reads) > 1)
+        if virtual:
+            r1_temp = forward_reads
+            r2_temp = reverse_reads
+        elif len(forward_reads) == 1:
             fq1 = os.path.realpath(forward_reads[0])
             fq2 = os.path.realpath(reverse_reads[0])
             execute(f'''ln -s {fq1} {r1_temp} 2>> {log}''')
             execute(f'''ln -s {fq2} {r2_temp} 2>> {log}''')
         elif len(forward_reads) > 1:
-            fq1 = " ".join(forward_reads)
-            fq2 = " ".join(reverse_reads)
-            execute(f'''cat {fq1} > {r1_temp} 2> {log}''')
-            execute(f'''cat {fq2} > {r2_temp} 2>> {log}''')
+            with runner.step("concat_files"):
+                misc.concat_files(forward_reads, r1_temp)
+                misc.concat_files(reverse_reads, r2_temp)
 
         if check_paired:
             print("checking paired")
-            id1 = f"{outdir_pe_temp}/id.list.1"
-            id2 = f"{outdir_pe_temp}/id.list.2"
-            execute(f'''seqkit seq -ni {r1_temp} | sed 's#/1$##g' > {id1} 2>> {log}''')
-            execute(f'''seqkit seq -ni {r2_temp} | sed 's#/2$##g' > {id2} 2>> {log}''')
-
-            if filecmp.cmp(id1, id2):
-                execute(f'''mv {r1_temp} {r1} 2>> {log}''')
-                execute(f'''mv {r2_temp} {r2} 2>> {log}''')
-                execute(f'''rm -rf {id1}''')
-                execute(f'''rm -rf {id2}''')
-            else:
-                idp = f"{outdir_pe_temp}/id.list.paired"
-                execute(f'''mkdir -p {outdir_pe_temp}/temp0''')
-                execute(f'''sort -T {outdir_pe_temp}/temp0 {id1} {id2} | uniq -c | awk '$1==2{{print $2}}' > {idp} 2>> {log}''')
-                oneline = execute(f'''zcat {r1_temp} | head -1''', capture=True)
-                if "/1" in oneline:
-                    cmd1 = f'''awk '{{print $0 "/1"}}' {idp} | seqkit grep -f - {r1_temp} -o {r1_temp_p} 2>> {log}'''
-                    cmd2 = f'''awk '{{print $0 "/2"}}' {idp} | seqkit grep -f - {r2_temp} -o {r2_temp_p} 2>> {log}'''
-                    execute(cmd1)
-                    execute(cmd2)
+            stats = new_stats(r1, r2)
+            with runner.step("check_pairs"):
+                paired, pairs, mismatch = pairer.check_pairs(
+                    r1_temp, r2_temp, threads, stats=stats or (None, None))
+
+            if paired:
+                print(f"{pairs} pairs are in sync")
+                if stats is not None:
+                    seq_stats["PE_FORWARD"], seq_stats["PE_REVERSE"] = stats
+                if virtual:
+                    add_virtual("PE_FORWARD", r1_temp, "cat")
+                    add_virtual("PE_REVERSE", r2_temp, "cat")
                 else:
-                    execute(f'''seqkit grep -f {idp} {r1_temp} -o {r1_temp_p} 2>> {log}''')
-                    execute(f'''seqkit grep -f {idp} {r2_temp} -o {r2_temp_p} 2>> {log}''')
-
-                execute(f'''rm -rf {r1_temp} 2>> {log}''')
-                execute(f'''rm -rf {r2_temp} 2>> {log}''')
-                execute(f'''rm -rf {id1} 2>> {log}''')
-                execute(f'''rm -rf {id2} 2>> {log}''')
-                execute(f'''rm -rf {idp} 2>> {log}''')
-
-                ## more check
-                execute(f'''mkdir -p {outdir_pe_temp}/temp1''')
-                execute(f'''mkdir -p {outdir_pe_temp}/temp2''')
-                execute(
-                    f'''
-                    pigz -b 102400 -dc {r1_temp_p} | \
-                    paste - - - - | \
-                    LC_ALL=C sort --parallel 4 -n -T {outdir_pe_temp}/temp1 -S 8G | \
-                    tr '\t' '\n' | \
-                    pigz -b 102400 > {r1} \
-                    2>> {log}''')
-                execute(
-                    f'''
-                    pigz -b 102400 -dc {r2_temp_p} | \
-                    paste - - - - | \
-                    LC_ALL=C sort --parallel 4 -n -T {outdir_pe_temp}/temp2 -S 8G | \
-                    tr '\t' '\n' | \
-                    pigz -b 102400 > {r2} \
-                    2>> {log}''')
-
-                execute(f'''rm -rf {r1_temp_p} 2>> {log}''')
-                execute(f'''rm -rf {r2_temp_p} 2>> {log}''')
+                    execute(f'''mv {r1_temp} {r1} 2>> {log}''')
+                    execute(f'''mv {r2_temp} {r2} 2>> {log}''')
+            else:
+                print(f"pairs are out of sync from pair {mismatch}, repairing")
+                with runner.step("resync_pairs"):
+                    pairs = pairer.resync_pairs(
+                        r1_temp, r2_temp, r1, r2, threads,
+                        buffer_size=resync_buffer, temp_dir=scratch)
+                print(f"{pairs} pairs are written")
+        elif virtual:
+            add_virtual("PE_FORWARD", r1_temp, "cat")
+            add_virtual("PE_REVERSE", r2_temp, "cat")
         else:
             execute(f'''mv {r1_temp} {r1} 2>>{log}''')
             execute(f'''mv {r2_temp} {r2} 2>>{log}''')
@@ -140,13 +162,18 @@ if is_fastq:
 
         execute(f'''mkdir -p {outdir_pe}''')
 
-        fq = " ".join(input_files[headers["FQ"]["INTERLEAVED"]])
-        execute(
-            f'''
-            cat {fq} | \
-            tee >(seqtk seq -1 - | pigz -cf -p {threads} > {r1}) | \
-            seqtk seq -2 - | pigz -cf -p {threads} > {r2} 2>> {log}
-            ''')
+        interleaved_reads = input_files[headers["FQ"]["INTERLEAVED"]]
+        if virtual_input:
+            add_virtual("PE_FORWARD", interleaved_reads, "deinterleave_1")
+            add_virtual("PE_REVERSE", interleaved_reads, "deinterleave_2")
+        else:
+            fq = " ".join(interleaved_reads)
+            execute(
+                f'''
+                cat {fq} | \
+                tee >(seqtk seq -1 - | pigz -cf -p {threads} > {r1}) | \
+                seqtk seq -2 - | pigz -cf -p {threads} > {r2} 2>> {log}
+                ''')
 
     if headers["FQ"]["SE"] in input_tags:
         samples_dict["SE"] = rs
@@ -157,9 +184,11 @@ if is_fastq:
         if len(single_reads) == 1:
             fq = os.path.realpath(single_reads[0])
             execute(f'''ln -s {fq} {rs} 2>> {log}''')
-        elif len(single_reads) > 1:
-            fq = " ".join(single_reads)
-            execute(f'''cat {fq} > {rs} 2>> {log}''')
+        elif virtual_input:
+            add_virtual("SE", single_reads, "cat")
+        else:
+            with runner.step("concat_files"):
+                misc.concat_files(single_reads, rs)
 
     if headers["FQ"]["LONG"] in input_tags:
         samples_dict["LONG"] = rl
@@ -170,9 +199,11 @@ if is_fastq:
         if len(long_reads) == 1:
             fq = os.path.realpath(long_reads[0])
             execute(f'''ln -s {fq} {rl} 2>> {log}''')
-        elif len(long_reads) > 1:
-            fq = " ".join(long_reads)
-            execute(f'''cat {fq} > {rl} 2>> {log}''')
+        elif virtual_input:
+            add_virtual("LONG", long_reads, "cat")
+        else:
+            with runner.step("concat_files"):
+                misc.concat_files(long_reads, rl)
 
 else:
     if headers["SRA"]["PE"] in input_tags:
@@ -184,7 +215,14 @@ else:
 
         sra_pe = input_files[headers["SRA"]["PE"]]
 
-        if len(sra_pe) == 1:
+        if sra_stream:
+            stats = new_stats(r1, r2)
+            with runner.step("dump_sra"):
+                dumper.dump_sra(sra_pe, [r1, r2], threads, scratch, log, stats)
+            if stats is not None:
+                seq_stats["PE_FORWARD"], seq_stats["PE_REVERSE"] = stats
+
+        elif len(sra_pe) == 1:
             sra = sra_pe[0]
             sra_name = os.path.basename(sra)
             execute(f'''rm -rf {outdir_pe_temp}/{sra_name}* 2>> {log}''')
@@ -194,12 +232,12 @@ else:
                 fasterq-dump \
                 --threads {threads} \
                 --split-3 \
-                --temp {outdir_pe_temp}/{sra_name}.temp \
+                --temp {scratch}/{sra_name}.temp \
                 --outdir {outdir_pe_temp} \
                 {sra} 2>>{log}
                 ''')
 
-            execute(f'''rm -rf {outdir_pe_temp}/{sra_name}.temp* 2>> {log}''')
+            execute(f'''rm -rf {scratch}/{sra_name}.temp* 2>> {log}''')
             execute(f'''pigz -f -p {threads} {outdir_pe_temp}/{sra_name}_1.fastq 2>> {log}''')
             execute(f'''pigz -f -p {threads} {outdir_pe_temp}/{sra_name}_2.fastq 2>> {log}''')
             execute(f'''rm -rf {outdir_pe_temp}/{sra_name}_*.fastq 2>> {log}''')
@@ -223,12 +261,12 @@ else:
                     fasterq-dump \
                     --threads {threads} \
                     --split-3 \
-                    --temp {outdir_pe_temp}/{sra_name}.temp \
+                    --temp {scratch}/{sra_name}.temp \
                     --outdir {outdir_pe_temp} \
                     {sra} 2>> {log}
                     ''')
 
-                execute(f'''rm -rf {outdir_pe_temp}/{sra_name}.temp* 2>> {log}''')
+                execute(f'''rm -rf {scratch}/{sra_name}.temp* 2>> {log}''')
                 execute(f'''pigz -f -p {threads} {outdir_pe_temp}/{sra_name}_1.fastq 2>> {log}''')
                 execute(f'''pigz -f -p {threads} {outdir_pe_temp}/{sra_name}_2.fastq 2>> {log}''')
                 execute(f'''rm -rf {outdir_pe_temp}/{sra_name}._*.fastq 2>> {log}''')
@@ -251,7 +289,14 @@ else:
 
         sra_se = input_files[headers["SRA"]["SE"]]
 
-        if len(sra_se) == 1:
+        if sra_stream:
+            stats = new_stats(rs)
+            with runner.step("dump_sra"):
+                dumper.dump_sra(sra_se, [rs], threads, scratch, log, stats)
+            if stats is not None:
+                seq_stats["SE"] = stats[0]
+
+        elif len(sra_se) == 1:
             sra = sra_se[0]
             sra_name = os.path.basename(sra)
             execute(f'''rm -rf {outdir_se_temp}/{sra_name}* 2>> {log}''')
@@ -260,12 +305,12 @@ else:
                 f'''
                 fasterq-dump \
                 --threads {threads} \
-                --temp {outdir_se_temp}/{sra_name}.temp \
+                --temp {scratch}/{sra_name}.temp \
                 --outdir {outdir_se_temp} \
                 {sra} 2>>{log}
                 ''')
 
-            execute(f'''rm -rf {outdir_se_temp}/{sra_name}.temp* 2>> {log}''')
+            execute(f'''rm -rf {scratch}/{sra_name}.temp* 2>> {log}''')
             execute(f'''pigz -f -p {threads} {outdir_se_temp}/{sra_name}.fastq 2>> {log}''')
             execute(f'''rm -rf {outdir_se_temp}/{sra_name}*fastq 2>> {log}''')
             execute(f'''mv {outdir_se_temp}/{sra_name}.fastq.gz {rs} 2>> {log}''')
@@ -283,12 +328,12 @@ else:
                     f'''
                     fasterq-dump \
                     --threads {threads} \
-                    --temp {outdir_se_temp}/{sra_name}.temp \
+                    --temp {scratch}/{sra_name}.temp \
                     --outdir {outdir_se_temp} \
                     {sra} 2>> {log}
                     ''')
 
-                execute(f'''rm -rf {outdir_se_temp}/{sra_name}.temp* 2>> {log}''')
+                execute(f'''rm -rf {scratch}/{sra_name}.temp* 2>> {log}''')
                 execute(f'''pigz -f -p {threads} {outdir_se_temp}/{sra_name}.fastq 2>> {log}''')
                 execute(f'''rm -rf {outdir_se_temp}/{sra_name}*fastq 2>> {log}''')
 
@@ -307,7 +352,14 @@ else:
 
         sra_l = input_files[headers["SRA"]["LONG"]]
 
-        if len(sra_l) == 1:
+        if sra_stream:
+            stats = new_stats(rl)
+            with runner.step("dump_sra"):
+                dumper.dump_sra(sra_l, [rl], threads, scratch, log, stats)
+            if stats is not None:
+                seq_stats["LONG"] = stats[0]
+
+        elif len(sra_l) == 1:
             sra = sra_l[0]
             sra_name = os.path.basename(sra)
             execute(f'''rm -rf {outdir_long_temp}/{sra_name}* 2>> {log}''')
@@ -316,12 +368,12 @@ else:
                 f'''
                 fasterq-dump \
                 --threads {threads} \
-                --temp {outdir_long_temp}/{sra_name}.temp \
+                --temp {scratch}/{sra_name}.temp \
                 --outdir {outdir_long_temp} \
                 {sra} 2>>{log}
                 ''')
 
-            execute(f'''rm -rf {outdir_long_temp}/{sra_name}.temp* 2>> {log}''')
+            execute(f'''rm -rf {scratch}/{sra_name}.temp* 2>> {log}''')
             execute(f'''pigz -f -p {threads} {outdir_long_temp}/{sra_name}.fastq 2>> {log}''')
             execute(f'''rm -rf {outdir_long_temp}/{sra_name}*fastq 2>> {log}''')
             execute(f'''mv {outdir_long_temp}/{sra_name}.fastq.gz {rl} 2>> {log}''')
@@ -339,12 +391,12 @@ else:
                     f'''
                     fasterq-dump \
                     --threads {threads} \
-                    --temp {outdir_long_temp}/{sra_name}.temp \
+                    --temp {scratch}/{sra_name}.temp \
                     --outdir {outdir_long_temp} \
                     {sra} 2>> {log}
                     ''')
 
-                execute(f'''rm -rf {outdir_long_temp}/{sra_name}.temp* 2>> {log}''')
+                execute(f'''rm -rf {scratch}/{sra_name}.temp* 2>> {log}''')
                 execute(f'''pigz -f -p {threads} {outdir_long_temp}/{sra_name}.fastq 2>> {log}''')
                 execute(f'''rm -rf {outdir_long_temp}/{sra_name}*fastq 2>> {log}''')
 
@@ -355,6 +407,37 @@ else:
         execute(f'''rm -rf {outdir_long_temp}''')
 
 
+if inline_stats:
+    # the reads which were not streamed through this job (links, concatenation,
+    # virtual inputs, repaired pairs) are counted in one more pass here
+    keys = [k for k in ["PE_FORWARD", "PE_REVERSE", "SE", "LONG"] if k in samples_dict]
+    virtual_dict = samples_dict.get("VIRTUAL", {})
+
+    def count(key):
+        name = os.path.basename(samples_dict[key])
+        if key in virtual_dict:
+            if virtual_dict[key]["recipe"] == "deinterleave_1":
+                return seqstats.interleaved_stats(
+                    virtual_dict[key]["sources"], name,
+                    os.path.basename(samples_dict["PE_REVERSE"]), fq_encoding, 2)
+            return seqstats.file_stats(virtual_dict[key]["sources"], name, fq_encoding, 2)
+        return seqstats.file_stats(samples_dict[key], name, fq_encoding, 2)
+
+    with runner.step("seq_stats"):
+        missing = [k for k in keys if (k not in seq_stats) and
+                   (virtual_dict.get(k, {}).get("recipe") != "deinterleave_2")]
+        with concurrent.futures.ThreadPoolExecutor(max(1, min(len(missing), threads // 2))) as executor:
+            for key, stats in zip(missing, executor.map(count, missing)):
+                if isinstance(stats, tuple):
+                    seq_stats["PE_FORWARD"], seq_stats["PE_REVERSE"] = stats
+                else:
+                    seq_stats[key] = stats
+
+    stats_file = os.path.join(outdir, f"{sample_id}.raw.seq_stats.tsv")
+    seqstats.write_stats([seq_stats[k].row() for k in keys], stats_file)
+    samples_dict["SEQ_STATS"] = stats_file
+
+
 samples_obct = json.dumps(samples_dict, indent=2)
 with open(output, 'wt') as oh:
     oh.write(samples_obct)
@@ -0,0 +1,157 @@
+#!/usr/bin/env bash
+
+# read a {sample}.json reads manifest in a rule shell:
+#
+#   source reads.sh
+#   strainpi_reads {input}                          # set R1 R2 RS
+#   strainpi_reads {input} stream PE_FORWARD LONG   # set R1 RL only, every
+#                                                   # FIFO must be read once
+#   strainpi_reads {input} lockstep                 # for tools which read R1 and R2
+#                                                   # record by record together
+#   strainpi_reads {input} materialize              # for tools which read inputs twice
+#   ...
+#   strainpi_reads_wait                             # check the stream writers
+#
+# a manifest entry listed under "VIRTUAL" is not a file on disk, it is produced
+# on the fly from its sources by its recipe and served through a FIFO
+# (stream) or a temp file (materialize) with the expected basename, in lockstep
+# mode both mates of interleaved reads come from one producer, which blocks
+# when R1 is read far ahead of R2
+
+STRAINPI_READS_PIDS=""
+STRAINPI_READS_DIRS=""
+
+# strainpi_cleanup, the EXIT trap shared with scratch.sh
+if ! declare -F strainpi_cleanup > /dev/null; then
+    source $(dirname ${BASH_SOURCE[0]})/scratch.sh
+fi
+
+
+strainpi_reads_cleanup() {
+    local pid
+    for pid in $STRAINPI_READS_PIDS; do
+        kill $pid 2>/dev/null || true
+    done
+    if [ "$STRAINPI_READS_DIRS" != "" ]; then
+        rm -rf $STRAINPI_READS_DIRS
+    fi
+}
+
+
+strainpi_reads_recipe() {
+    local recipe=$1
+    shift
+
+    case $recipe in
+        cat)
+            cat "$@"
+            ;;
+        deinterleave_1)
+            zcat -f "$@" | paste - - - - - - - - | cut -f 1-4 | tr '\t' '\n'
+            ;;
+        deinterleave_2)
+            zcat -f "$@" | paste - - - - - - - - | cut -f 5-8 | tr '\t' '\n'
+            ;;
+        *)
+            echo "unknown virtual input recipe: $recipe" >&2
+            return 1
+            ;;
+    esac
+}
+
+
+strainpi_reads_deinterleave() {
+    # split interleaved reads into both mates in one pass, every record is
+    # flushed so a consumer reading both FIFOs in lockstep never waits on
+    # a mate held in awk's buffer, only for materialize and lockstep modes
+    local out_1=$1
+    local out_2=$2
+    shift 2
+
+    zcat -f "$@" | \
+    awk -v out_1="$out_1" -v out_2="$out_2" \
+        '{ out = (NR % 8 >= 1 && NR % 8 <= 4) ? out_1 : out_2; print > out; if (NR % 4 == 0) fflush(out) }'
+}
+
+
+strainpi_reads() {
+    local manifest=$1
+    local mode=${2:-stream}
+    local keys="PE_FORWARD PE_REVERSE SE"
+    if [ $# -gt 2 ]; then
+        keys="${@:3}"
+    fi
+
+    # both mates of interleaved reads are served by one producer, a FIFO per
+    # mate with its own producer otherwise
+    local split=""
+    if [ "$mode" != "stream" ] && \
+       [[ " $keys " == *" PE_FORWARD "* ]] && [[ " $keys " == *" PE_REVERSE "* ]] && \
+       [ "$(jq -r -M '.VIRTUAL.PE_FORWARD.recipe // empty' $manifest)" == "deinterleave_1" ] && \
+       [ "$(jq -r -M '.VIRTUAL.PE_REVERSE.recipe // empty' $manifest)" == "deinterleave_2" ]; then
+        split="yes"
+    fi
+
+    local reads_dir=""
+    local key recipe reads sources split_sources
+    for key in $keys; do
+        reads=$(jq -r -M ".$key" $manifest | sed 's/^null$//g')
+        recipe=$(jq -r -M ".VIRTUAL.$key.recipe // empty" $manifest)
+
+        if [ "$recipe" != "" ]; then
+            if [ "$reads_dir" == "" ]; then
+                reads_dir=$(mktemp -d ${TMPDIR:-/tmp}/strainpi_reads.XXXXXX)
+                STRAINPI_READS_DIRS="$STRAINPI_READS_DIRS $reads_dir"
+                trap strainpi_cleanup EXIT
+                trap 'exit 1' INT TERM
+            fi
+
+            mapfile -t sources < <(jq -r -M ".VIRTUAL.$key.sources[]" $manifest)
+
+            # de-interleaved reads are served uncompressed
+            reads=$reads_dir/$(basename $reads)
+            if [ "$recipe" != "cat" ]; then
+                reads=${reads%.gz}
+            fi
+
+            if [ "$split" == "yes" ] && [[ "$recipe" == deinterleave_* ]]; then
+                if [ "$mode" != "materialize" ]; then
+                    mkfifo $reads
+                fi
+                split_sources=("${sources[@]}")
+            elif [ "$mode" == "materialize" ]; then
+                strainpi_reads_recipe $recipe "${sources[@]}" > $reads
+            else
+                mkfifo $reads
+                strainpi_reads_recipe $recipe "${sources[@]}" > $reads &
+                STRAINPI_READS_PIDS="$STRAINPI_READS_PIDS $!"
+            fi
+        fi
+
+        case $key in
+            PE_FORWARD) R1=$reads ;;
+            PE_REVERSE) R2=$reads ;;
+            SE) RS=$reads ;;
+            LONG) RL=$reads ;;
+        esac
+    done
+
+    if [ "$split" == "yes" ]; then
+        # started once both mates have their paths
+        if [ "$mode" == "materialize" ]; then
+            strainpi_reads_deinterleave $R1 $R2 "${split_sources[@]}"
+        else
+            strainpi_reads_deinterleave $R1 $R2 "${split_sources[@]}" &
+            STRAINPI_READS_PIDS="$STRAINPI_READS_PIDS $!"
+        fi
+    fi
+}
+
+
+strainpi_reads_wait() {
+    local pid
+    for pid in $STRAINPI_READS_PIDS; do
+        wait $pid
+    done
+    STRAINPI_READS_PIDS=""
+}
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+
+IO_FIELDS = ["rchar", "wchar", "read_bytes", "write_bytes"]
+
+
+def read_proc_io(pid="self"):
+    """
+    /proc/<pid>/io of a process, the counters of its reaped children
+    are already added to it by the kernel
+    """
+    try:
+        with open(f"/proc/{pid}/io", "rt") as ih:
+            counters = dict(line.split(": ") for line in ih.read().splitlines())
+        return {k: int(counters[k]) for k in IO_FIELDS}
+    except (OSError, KeyError, ValueError):
+        return {k: None for k in IO_FIELDS}
+
+
+def exit_code(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class pipeline_runner:
+    """
+    run the shell steps of a wrapper and record wall time, user/sys CPU,
+    max RSS and I/O bytes of every step, dump them to a json file
+    """
+    def __init__(self, steps_json):
+        self.steps_json = steps_json
+        self.steps = []
+
+    def record(self, name, cmd, start, end, user, sys_, max_rss, inherited_rss, io, returncode):
+        self.steps.append({
+            "step": name,
+            "cmd": cmd,
+            "start": round(start, 3),
+            "wall_s": round(end - start, 3),
+            "user_s": round(user, 3),
+            "sys_s": round(sys_, 3),
+            "max_rss_kb": max_rss,
+            "inherited_rss_kb": inherited_rss,
+            **io,
+            "exit_code": returncode
+        })
+
+    def execute(self, cmd, capture=False, name=None):
+        """
+        a drop-in for executor.execute, run cmd with bash, raise on failure
+        """
+        name = name or cmd.split(None, 1)[0]
+        # a forked child starts with the peak RSS of this process, so max_rss_kb
+        # of a small command is this value, not its own
+        inherited_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        proc = subprocess.Popen(
+            ["bash", "-c", cmd],
+            stdout=subprocess.PIPE if capture else None,
+            universal_newlines=True)
+        output = proc.stdout.read() if capture else None
+
+        io = {k: None for k in IO_FIELDS}
+        if hasattr(os, "waitid"):
+            # wait for the exit but leave it a zombie, /proc/<pid>/io is still there
+            os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+            io = read_proc_io(proc.pid)
+        _, status, rusage = os.wait4(proc.pid, 0)
+        end = time.time()
+        proc.returncode = exit_code(status)
+        if capture:
+            proc.stdout.close()
+
+        self.record(name, cmd, start, end, rusage.ru_utime, rusage.ru_stime,
+                    rusage.ru_maxrss, inherited_rss, io, proc.returncode)
+
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, output)
+        return output.strip() if capture else True
+
+    @contextlib.contextmanager
+    def step(self, name):
+        """
+        measure a python step, its own threads and the children it reaps
+        """
+        start = time.time()
+        usage_self = resource.getrusage(resource.RUSAGE_SELF)
+        inherited_rss = usage_self.ru_maxrss
+        usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        io_start = read_proc_io()
+        returncode = 0
+        try:
+            yield
+        except BaseException:
+            returncode = 1
+            raise
+        finally:
+            end = time.time()
+            usage_self_end = resource.getrusage(resource.RUSAGE_SELF)
+            usage_children_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+            io_end = read_proc_io()
+
+            user = (usage_self_end.ru_utime - usage_self.ru_utime) + \
+                (usage_children_end.ru_utime - usage_children.ru_utime)
+            sys_ = (usage_self_end.ru_stime - usage_self.ru_stime) + \
+                (usage_children_end.ru_stime - usage_children.ru_stime)
+            # a high-water mark, inherited_rss_kb is what the process held before this step
+            max_rss = max(usage_self_end.ru_maxrss, usage_children_end.ru_maxrss)
+            io = {k: None if io_start[k] is None else io_end[k] - io_start[k]
+                  for k in IO_FIELDS}
+
+            self.record(name, None, start, end, user, sys_, max_rss, inherited_rss, io, returncode)
+
+    def dump(self):
+        with open(self.steps_json, "wt") as oh:
+            json.dump(self.steps, oh, indent=2)
+
+
+def main():
+    # strainpi runner steps.json cmd [cmd ...], mostly for testing
+    runner = pipeline_runner(sys.argv[1])
+    try:
+        for cmd in sys.argv[2:]:
+            runner.execute(cmd)
+    finally:
+        runner.dump()
+
+
+if __name__ == "__main__":
+    main()
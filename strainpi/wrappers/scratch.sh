@@ -0,0 +1,100 @@
+#!/usr/bin/env bash
+
+# node-local scratch space for a rule shell:
+#
+#   source scratch.sh
+#   strainpi_scratch_init {params.scratch_dir} {params.stage_inputs}   # set SCRATCH
+#   strainpi_stage_reads                                               # R1 R2 RS RL
+#   samtools sort -T $SCRATCH/temp -o $SCRATCH/sorted.bam -
+#   strainpi_commit $SCRATCH/sorted.bam $BAM
+#
+# SCRATCH is removed when the shell exits, whether the rule succeeds or fails
+
+STRAINPI_SCRATCH_DIRS=""
+STRAINPI_STAGE_INPUTS="False"
+
+# shared storage, random I/O on these is slow
+STRAINPI_REMOTE_FS="nfs nfs4 lustre gpfs cifs smb2 smbfs beegfs ceph fuse fuseblk glusterfs"
+
+
+strainpi_scratch_cleanup() {
+    if [ "$STRAINPI_SCRATCH_DIRS" != "" ]; then
+        rm -rf $STRAINPI_SCRATCH_DIRS
+    fi
+}
+
+
+strainpi_cleanup() {
+    # reads.sh and scratch.sh share the EXIT trap
+    local cleanup
+    for cleanup in strainpi_reads_cleanup strainpi_scratch_cleanup; do
+        if declare -F $cleanup > /dev/null; then
+            $cleanup
+        fi
+    done
+}
+
+
+strainpi_scratch_init() {
+    # the dir may be given as "$TMPDIR", expand it on the compute node
+    local scratch_dir=$(set +u; eval echo "${1:-}")
+    scratch_dir=${scratch_dir:-${TMPDIR:-/tmp}}
+    STRAINPI_STAGE_INPUTS=${2:-False}
+
+    mkdir -p $scratch_dir
+    SCRATCH=$(mktemp -d $scratch_dir/strainpi_scratch.XXXXXX)
+    STRAINPI_SCRATCH_DIRS="$STRAINPI_SCRATCH_DIRS $SCRATCH"
+
+    trap strainpi_cleanup EXIT
+    trap 'exit 1' INT TERM
+}
+
+
+strainpi_is_local() {
+    local fs_type=$(stat -f -c %T "$1" 2>/dev/null || echo unknown)
+    local remote_fs
+    for remote_fs in $STRAINPI_REMOTE_FS; do
+        if [ "$fs_type" == "$remote_fs" ]; then
+            return 1
+        fi
+    done
+    return 0
+}
+
+
+strainpi_stage() {
+    # print the path to read $1 from, copied into SCRATCH when it lives on shared storage,
+    # FIFOs and files which are already local are used in place
+    local reads=$1
+    if [ "$STRAINPI_STAGE_INPUTS" != "True" ] || [ ! -f "$reads" ] || strainpi_is_local "$reads"; then
+        echo $reads
+        return 0
+    fi
+
+    local staged=$(mktemp -d $SCRATCH/stage.XXXXXX)/$(basename $reads)
+    cp $reads $staged
+    echo $staged
+}
+
+
+strainpi_stage_reads() {
+    if [ "${R1:-}" != "" ]; then R1=$(strainpi_stage $R1); fi
+    if [ "${R2:-}" != "" ]; then R2=$(strainpi_stage $R2); fi
+    if [ "${RS:-}" != "" ]; then RS=$(strainpi_stage $RS); fi
+    if [ "${RL:-}" != "" ]; then RL=$(strainpi_stage $RL); fi
+}
+
+
+strainpi_commit() {
+    # move a finished output from SCRATCH to its final path, a partial copy is
+    # never seen there: move it next to the final path first, then rename
+    local src=$1
+    local dest=$2
+
+    mkdir -p $(dirname $dest)
+    if ! mv $src $dest.tmp.$$; then
+        rm -f $dest.tmp.$$
+        return 1
+    fi
+    mv -f $dest.tmp.$$ $dest
+}
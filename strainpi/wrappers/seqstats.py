@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+
+import numpy as np
+
+import pairer
+
+# strainpi/fqstats.py of the package this wrapper ships with, loaded by its
+# path: the conda environments of the rules only have numpy, and putting the
+# directory strainpi is installed in on sys.path would let the packages next
+# to it shadow those of the environment
+FQSTATS_PY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fqstats.py")
+spec = importlib.util.spec_from_file_location("strainpi_fqstats", FQSTATS_PY)
+fqstats = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(fqstats)
+
+
+# columns of `seqkit stats --all --tabular`
+STATS_COLUMNS = [
+    "file", "format", "type", "num_seqs", "sum_len", "min_len", "avg_len", "max_len",
+    "Q1", "Q2", "Q3", "sum_gap", "N50", "Q20(%)", "Q30(%)", "AvgQual", "GC(%)"]
+
+class record_counter(fqstats.fastq_counter):
+    """
+    fqstats.fastq_counter of one output, fed the record lines of
+    pairer.split_records batch by batch while the reads pass by
+    """
+    def __init__(self, name, fq_encoding="sanger"):
+        super().__init__(fq_encoding)
+        self.name = name
+
+    def update(self, lines):
+        if lines:
+            self.update_bytes(b"\n".join(lines) + b"\n")
+
+    def update_bytes(self, data):
+        super().update(np.frombuffer(data, dtype=np.uint8))
+
+    def row(self):
+        return super().row(self.name)
+
+
+def write_stats(rows, stats_file):
+    """
+    append rows to a seqkit stats table, the header is written with the first rows
+    """
+    header = not (os.path.exists(stats_file) and os.path.getsize(stats_file) > 0)
+    with open(stats_file, "at") as oh:
+        if header:
+            oh.write("\t".join(STATS_COLUMNS) + "\n")
+        for row in rows:
+            if isinstance(row, dict):
+                row = [row[column] for column in STATS_COLUMNS]
+            oh.write("\t".join(map(str, row)) + "\n")
+
+
+def file_stats(fqs, name, fq_encoding="sanger", threads=1):
+    """
+    one pass over (concatenated) fastq files
+    """
+    stats = record_counter(name, fq_encoding)
+    for lines in pairer.threaded(pairer.read_records(fqs, threads)):
+        stats.update(lines)
+    return stats
+
+
+def interleaved_stats(fqs, name_1, name_2, fq_encoding="sanger", threads=1):
+    """
+    one pass over interleaved fastq files, odd records are R1, even records are R2
+    """
+    stats_1 = record_counter(name_1, fq_encoding)
+    stats_2 = record_counter(name_2, fq_encoding)
+    # a batch may end between the mates of a pair, odd tells whether it starts with R2
+    odd = 0
+    for lines in pairer.threaded(pairer.read_records(fqs, threads)):
+        stats_1.update([line for i in range(4 * odd, len(lines), 8) for line in lines[i:i + 4]])
+        stats_2.update([line for i in range(4 - 4 * odd, len(lines), 8) for line in lines[i:i + 4]])
+        odd = (odd + len(lines) // 4) % 2
+    return stats_1, stats_2
+
+
+def pair_records(batches):
+    """
+    pair the mates of an interleaved stream, `samtools fastq -N` names them
+    read/1 and read/2, reads without a mate next to them are dropped
+    """
+    carry = None
+    for lines in batches:
+        r1 = []
+        r2 = []
+        for i in range(0, len(lines), 4):
+            name = lines[i].split(None, 1)[0]
+            if name.endswith((b"/1", b"/2")):
+                name = name[:-2]
+            if (carry is not None) and (carry[0] == name):
+                r1 += carry[1]
+                r2 += lines[i:i + 4]
+                carry = None
+            else:
+                carry = (name, lines[i:i + 4])
+        yield [r1, r2]
+
+
+def stream_stats(ih, outputs, names, fq_encoding="sanger", threads=1, level=6, count=True):
+    """
+    write a fastq stream to gzip files and count it on the way unless count
+    is False, two outputs de-interleave the stream
+    """
+    batches = pairer.split_records(ih, "stdin")
+    if len(outputs) == 2:
+        batches = pair_records(batches)
+    else:
+        batches = ([lines] for lines in batches)
+
+    stats = [record_counter(name, fq_encoding) for name in names]
+    writers = [pairer.open_gzip_writer(output, max(1, threads // len(outputs)), level)
+               for output in outputs]
+    try:
+        for batch in batches:
+            for (oh, _), lines, s in zip(writers, batch, stats):
+                if lines:
+                    data = b"\n".join(lines) + b"\n"
+                    oh.write(data)
+                    if count:
+                        s.update_bytes(data)
+    finally:
+        for oh, proc in writers:
+            pairer.close_gzip_writer(oh, proc)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser("strainpi seqstats")
+    subparsers = parser.add_subparsers(dest="command")
+
+    parser_stream = subparsers.add_parser(
+        "stream", help="gzip fastq from stdin and count it, two outputs de-interleave it")
+    parser_stream.add_argument("--out", dest="outputs", nargs="+", required=True)
+    parser_stream.add_argument("--stats", dest="stats", default="",
+                               help="append to a seqkit stats table, nothing is counted when empty")
+    parser_stream.add_argument("--threads", dest="threads", type=int, default=2)
+    parser_stream.add_argument("--level", dest="level", type=int, default=6)
+    parser_stream.add_argument("--fq-encoding", dest="fq_encoding", default="sanger")
+
+    parser_fastp = subparsers.add_parser("fastp", help="seqkit stats table from a fastp json report")
+    parser_fastp.add_argument("--json", dest="json", required=True)
+    parser_fastp.add_argument("--out", dest="outputs", nargs="+", required=True)
+    parser_fastp.add_argument("--stats", dest="stats", required=True)
+
+    parser_files = subparsers.add_parser("files", help="seqkit stats table of fastq files")
+    parser_files.add_argument("--stats", dest="stats", required=True)
+    parser_files.add_argument("--threads", dest="threads", type=int, default=2)
+    parser_files.add_argument("--fq-encoding", dest="fq_encoding", default="sanger")
+    parser_files.add_argument("fqs", nargs="+")
+
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+        sys.exit(1)
+
+    names = [os.path.basename(fq) for fq in args.outputs] \
+        if args.command != "files" else [os.path.basename(fq) for fq in args.fqs]
+
+    if args.command == "stream":
+        if len(args.outputs) not in (1, 2):
+            print("please specific one or two outputs")
+            sys.exit(1)
+        stats = stream_stats(sys.stdin.buffer, args.outputs, names,
+                             args.fq_encoding, args.threads, args.level, args.stats != "")
+        if args.stats != "":
+            write_stats([s.row() for s in stats], args.stats)
+
+    elif args.command == "fastp":
+        with open(args.json, "rt") as ih:
+            write_stats(fqstats.fastp_rows(json.load(ih), names), args.stats)
+
+    elif args.command == "files":
+        write_stats([file_stats(fq, name, args.fq_encoding, args.threads).row()
+                     for fq, name in zip(args.fqs, names)], args.stats)
+
+
+if __name__ == "__main__":
+    main()